@@ -0,0 +1,309 @@
+"""
+Behavior tests for tickets.py.
+
+Each test gets a scratch workspace: a copy of tickets.py next to its own
+tickets/ and ticket-state/, seeded from a small L3 file with --parse.
+The CLI runs with --no-daemon so no test depends on a running server.
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+import tickets  # noqa: E402
+
+L3 = """\
+# TASK-T-001: First task
+
+**Type:** backend
+**Priority:** high
+
+## Description
+Do the first thing.
+
+## Acceptance Criteria
+- [ ] Works
+
+# TASK-T-002: Second task
+
+**Type:** backend
+**Priority:** medium
+**Dependencies:** TASK-T-001
+
+## Description
+Do the second thing.
+
+# TASK-T-003: Third task
+
+**Type:** docs
+**Priority:** low
+
+## Description
+Write the docs.
+"""
+
+
+def run(ws: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, str(ws / "tickets.py"), "--no-daemon", *args],
+        cwd=ws, capture_output=True, text=True,
+    )
+
+
+def master(ws: Path, tid: str) -> dict:
+    return json.loads((ws / "tickets" / f"{tid}.json").read_text())
+
+
+def edit_master(ws: Path, tid: str, **fields) -> None:
+    """Rewrite a master in place, the way an editor or merge tool would."""
+    path = ws / "tickets" / f"{tid}.json"
+    ticket = json.loads(path.read_text())
+    ticket.update(fields)
+    with open(path, "w") as f:
+        f.write(json.dumps(ticket, indent=2) + "\n")
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    shutil.copy(REPO / "tickets.py", tmp_path)
+    for stage in tickets.STAGES:
+        (tmp_path / "ticket-state" / tickets.STAGE_TO_STATE_DIR.get(stage, stage)).mkdir(parents=True)
+    (tmp_path / "l3").mkdir()
+    (tmp_path / "l3" / "L3-test.md").write_text(L3)
+    result = run(tmp_path, "--parse", "l3")
+    assert result.returncode == 0, result.stderr
+    return tmp_path
+
+
+# ─── Concurrency / CAS ───────────────────────────────────────────────────────
+
+
+def test_concurrent_claims_have_one_winner_and_no_torn_reads(workspace):
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "tickets.py", "--no-daemon", "--claim", "TASK-T-001", f"agent{i}", "m", "op"],
+            cwd=workspace, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        for i in range(12)
+    ]
+    results = [(p.wait(), *p.communicate()) for p in procs]
+    assert not [err for _, _, err in results if "Traceback" in err]
+    assert all(code in (0, 1, tickets.EXIT_CONFLICT) for code, _, _ in results)
+    winners = [i for i, (code, _, _) in enumerate(results) if code == 0]
+    assert len(winners) == 1
+    assert master(workspace, "TASK-T-001")["claimed_by"] == f"agent{winners[0]}"
+
+
+def test_save_raises_conflict_when_master_changed_since_load(tmp_path):
+    dirs = (tmp_path / "tickets", tmp_path / "ticket-state")
+    tickets.create_ticket("TASK-T-100", "Title", "Body", "backend", store=tickets.TicketStore(*dirs))
+    first, second = tickets.TicketStore(*dirs), tickets.TicketStore(*dirs)
+    mine, theirs = first.load("TASK-T-100"), second.load("TASK-T-100")
+    mine["priority"] = "low"
+    first.save(mine)
+    theirs["priority"] = "high"
+    with pytest.raises(tickets.TicketConflict):
+        second.save(theirs)
+    assert json.loads((dirs[0] / "TASK-T-100.json").read_text())["priority"] == "low"
+
+
+def test_unreadable_master_is_reported_as_conflict(workspace):
+    (workspace / "tickets" / "TASK-T-001.json").write_text("")
+    result = run(workspace, "--claim", "TASK-T-001", "Backend", "m", "op")
+    assert result.returncode == tickets.EXIT_CONFLICT
+    assert result.stdout.startswith("FAIL: CONFLICT")
+    assert "Traceback" not in result.stderr
+
+
+# ─── Upsert ──────────────────────────────────────────────────────────────────
+
+
+def add_dependency(ws: Path, task: str, dependency: str) -> None:
+    """Give an L3 task a Dependencies line, as an author editing the file would."""
+    path = ws / "l3" / "L3-test.md"
+    header = f"# {task}:"
+    text = path.read_text()
+    start = text.index(header)
+    priority = text.index("**Priority:**", start)
+    line_end = text.index("\n", priority) + 1
+    path.write_text(text[:line_end] + f"**Dependencies:** {dependency}\n" + text[line_end:])
+
+
+def test_upsert_applies_edited_fields_with_one_history_event(workspace):
+    path = workspace / "l3" / "L3-test.md"
+    path.write_text(path.read_text().replace("Third task", "Third task, renamed"))
+    result = run(workspace, "--parse", "l3", "--upsert")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert master(workspace, "TASK-T-003")["title"] == "Third task, renamed"
+    events = json.loads(run(workspace, "--history", "TASK-T-003", "--json").stdout)
+    updates = [e for e in events if e["event"] == "UPDATED"]
+    assert len(updates) == 1
+    assert updates[0]["changes"]["title"]["to"] == "Third task, renamed"
+
+
+def test_upsert_takes_unclaimed_ready_ticket_with_new_dependency_out_of_ready(workspace):
+    add_dependency(workspace, "TASK-T-003", "TASK-T-001")
+    result = run(workspace, "--parse", "l3", "--upsert")
+    assert "TASK-T-003: moved out of READY" in result.stdout
+    assert not (workspace / "ticket-state" / "READY" / "TASK-T-003.json").exists()
+    assert master(workspace, "TASK-T-003")["stage"] == "BLOCKED"
+    validate = run(workspace, "--validate")
+    assert validate.returncode == 0, validate.stdout
+    assert "No claimable tickets" in run(workspace, "--next", "Documentation").stdout
+
+
+def test_upsert_keeps_claimed_ticket_in_its_stage_and_reports_it(workspace):
+    assert run(workspace, "--claim", "TASK-T-003", "Documentation", "m", "op").returncode == 0
+    add_dependency(workspace, "TASK-T-003", "TASK-T-001")
+    result = run(workspace, "--parse", "l3", "--upsert")
+    assert "TASK-T-003: kept in READY" in result.stdout
+    assert (workspace / "ticket-state" / "READY" / "TASK-T-003.json").exists()
+    assert master(workspace, "TASK-T-003")["stage"] == "READY"
+    assert master(workspace, "TASK-T-003")["blocked_by"] == ["TASK-T-001"]
+    assert "STAGE MISMATCH" not in run(workspace, "--validate").stdout
+
+
+def test_compaction_waits_its_turn_behind_a_ticket_writer(tmp_path):
+    dirs = (tmp_path / "tickets", tmp_path / "ticket-state")
+    tickets.create_ticket("TASK-T-100", "Title", "Body", "backend", store=tickets.TicketStore(*dirs))
+    log = dirs[0] / f"TASK-T-100{tickets.HISTORY_SUFFIX}"
+    before = log.read_text()
+    with tickets.TicketStore(*dirs)._ticket_lock("TASK-T-100"):
+        result = tickets.compact_history(tickets.TicketStore(*dirs), keep=0)
+    assert result["compacted"] == []
+    assert result["errors"] and result["errors"][0].startswith("CONFLICT: TASK-T-100")
+    assert log.read_text() == before
+    assert tickets.compact_history(tickets.TicketStore(*dirs), keep=0)["compacted"] == ["TASK-T-100"]
+
+
+# ─── Index journals ──────────────────────────────────────────────────────────
+
+
+def journal_lines(path: Path) -> int:
+    return len(path.read_text().splitlines())
+
+
+def test_search_journal_is_folded_back_once_past_the_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(tickets, "INDEX_JOURNAL_MAX", 5)
+    dirs = (tmp_path / "tickets", tmp_path / "ticket-state")
+    tickets.create_ticket("TASK-T-100", "Original title", "Body", "backend", store=tickets.TicketStore(*dirs))
+    store = tickets.TicketStore(*dirs)
+    tickets.search_tickets("original", store)
+    store.flush()
+    journal = dirs[1] / (tickets.SEARCH_INDEX_FILE + tickets.INDEX_JOURNAL_SUFFIX)
+
+    for n in range(8):
+        store = tickets.TicketStore(*dirs)
+        ticket = store.load("TASK-T-100")
+        ticket["title"] = f"Renamed {n} zebra{n}"
+        store.save(ticket)
+        store.flush()
+    assert journal_lines(journal) == 1 + 8
+
+    store = tickets.TicketStore(*dirs)
+    assert [tid for tid, _ in tickets.search_tickets("zebra7", store)] == ["TASK-T-100"]
+    store.flush()
+    assert journal_lines(journal) == 1
+    assert tickets.search_tickets("zebra6", tickets.TicketStore(*dirs)) == []
+
+
+def test_saves_that_leave_the_search_row_alone_are_not_journaled(workspace):
+    run(workspace, "--search", "task")
+    journal = workspace / "ticket-state" / (tickets.SEARCH_INDEX_FILE + tickets.INDEX_JOURNAL_SUFFIX)
+    before = journal_lines(journal)
+    for _ in range(3):
+        assert run(workspace, "--claim", "TASK-T-001", "Backend", "m", "op").returncode == 0
+        assert run(workspace, "--release", "TASK-T-001").returncode == 0
+    assert journal_lines(journal) == before
+    assert "TASK-T-001" in run(workspace, "--search", "first", "--ids-only").stdout.split()
+
+
+# ─── Caches after in-place edits ─────────────────────────────────────────────
+
+
+def finish(ws: Path, tid: str, agent: str, *flags: str) -> subprocess.CompletedProcess:
+    """Claim and advance a ticket until it reaches DONE; returns the last advance."""
+    while True:
+        assert run(ws, "--claim", tid, agent, "m", "op").returncode == 0
+        result = run(ws, "--advance", tid, agent, *flags)
+        assert result.returncode == 0, result.stdout
+        if "→ DONE" in result.stdout:
+            return result
+
+
+def test_unblock_finds_dependent_added_by_an_in_place_edit(workspace):
+    run(workspace, "--next", "Documentation")  # builds .dependents.json
+    edit_master(workspace, "TASK-T-002", dependencies=["TASK-T-003"], blocked_by=["TASK-T-003"])
+    result = finish(workspace, "TASK-T-003", "Documentation", "--unblock")
+    assert "moved to READY: TASK-T-002" in result.stdout
+    assert (workspace / "ticket-state" / "READY" / "TASK-T-002.json").exists()
+
+
+def test_concurrent_dependents_flushes_keep_each_others_entries(tmp_path):
+    dirs = (tmp_path / "tickets", tmp_path / "ticket-state")
+    for tid in ("TASK-T-100", "TASK-T-101", "TASK-T-102"):
+        tickets.create_ticket(tid, tid, "Body", "backend", store=tickets.TicketStore(*dirs))
+    first, second = tickets.TicketStore(*dirs), tickets.TicketStore(*dirs)
+    first.dependents("TASK-T-100"), second.dependents("TASK-T-100")
+    for store, tid in ((first, "TASK-T-101"), (second, "TASK-T-102")):
+        ticket = store.load(tid)
+        store.link_dependencies(tid, [], ["TASK-T-100"])
+        ticket["dependencies"] = ["TASK-T-100"]
+        store.save(ticket)
+    first.flush()
+    second.flush()
+    on_disk = json.loads((dirs[1] / tickets.DEPENDENTS_FILE).read_text())
+    assert on_disk["dependents"]["TASK-T-100"] == ["TASK-T-101", "TASK-T-102"]
+    assert tickets.TicketStore(*dirs).dependents("TASK-T-100") == ["TASK-T-101", "TASK-T-102"]
+
+
+
+
+def test_next_ranks_by_dependencies_edited_in_place(workspace):
+    assert "0 downstream" in run(workspace, "--next", "Documentation").stdout
+    edit_master(workspace, "TASK-T-002", dependencies=["TASK-T-003"], blocked_by=["TASK-T-003"])
+    assert "1 downstream" in run(workspace, "--next", "Documentation").stdout
+
+
+def test_release_expired_sees_a_lease_edited_into_a_master_in_place(workspace):
+    assert run(workspace, "--claim", "TASK-T-001", "Backend", "m", "op").returncode == 0
+    assert "TASK-T-001" not in run(workspace, "--release-expired").stdout
+    edit_master(workspace, "TASK-T-001", lease_expiry="2000-01-01T00:00:00+00:00")
+    result = run(workspace, "--release-expired")
+    assert "TASK-T-001" in result.stdout, result.stdout
+    assert master(workspace, "TASK-T-001")["claimed_by"] is None
+
+
+
+def test_query_sees_fields_edited_into_a_master_in_place(workspace):
+    assert run(workspace, "--query", "priority=critical", "--ids-only").stdout.split() == []
+    edit_master(workspace, "TASK-T-003", priority="critical", tags=["urgent"])
+    assert run(workspace, "--query", "priority=critical", "--ids-only").stdout.split() == ["TASK-T-003"]
+    assert run(workspace, "--query", "tag=urgent", "--ids-only").stdout.split() == ["TASK-T-003"]
+
+
+# ─── Batch ───────────────────────────────────────────────────────────────────
+
+
+def test_batch_next_with_nothing_claimable_is_not_a_failure(workspace):
+    ops = [
+        {"op": "next", "agent": "Documentation"},
+        {"op": "claim", "ticket_id": "TASK-T-003", "agent": "Documentation", "machine_id": "m", "operator": "op"},
+        {"op": "next", "agent": "Documentation"},
+    ]
+    result = subprocess.run(
+        [sys.executable, "tickets.py", "--no-daemon", "--batch"], cwd=workspace, text=True, capture_output=True,
+        input="".join(json.dumps(op) + "\n" for op in ops),
+    )
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert result.returncode == 0, result.stdout
+    assert lines[0]["ticket_id"] == "TASK-T-003"
+    assert lines[2]["ok"] and lines[2]["ticket_id"] is None
+    assert lines[-1]["failed"] == 0
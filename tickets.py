@@ -13,12 +13,29 @@ Purpose:
 Usage:
   python tickets.py --sync                 # Evaluate all tickets, move unblocked to READY
   python tickets.py --parse <L3-dir>       # Parse L3 markdown into ticket JSON files
+  python tickets.py --parse <L3-dir> --upsert  # ...and apply L3 edits to existing tickets
   python tickets.py --status               # Show current state of all tickets
+  python tickets.py --status --rev <commit>  # ...as committed at <commit>, without a checkout
+  python tickets.py --as-of <iso-time>     # Stages and claims at a past moment, from history events
+  python tickets.py --metrics              # Lead/cycle time, stage dwell, rework, throughput (--json/--csv)
+  python tickets.py --query "<terms>"      # Tickets matching stage=/type=/priority=/tag=/... terms
+  python tickets.py --search "<text>"      # Tickets ranked by how well their wording matches
   python tickets.py --claim <ticket-id> <agent> <machine-id> <operator>
   python tickets.py --release <ticket-id>  # Release expired/stalled claim
+  python tickets.py --renew <ticket-id>    # Extend the lease on an active claim
+  python tickets.py --next <agent>         # Best claimable ticket for an agent's stage
   python tickets.py --advance <ticket-id>  # Move ticket to next stage in its SDLC flow
+  python tickets.py --advance <ticket-id> <agent> --unblock  # ...and unblock dependents on DONE
   python tickets.py --validate             # Full integrity check
+  python tickets.py --history <ticket-id>  # Full event timeline of a ticket
+  python tickets.py --compact              # Fold old history events into archived summaries
+  python tickets.py --restore-history <ticket-id>  # Bring archived events back
+  python tickets.py --batch < ops.ndjson   # Apply claim/release/renew/advance/rework/next ops from stdin
+  python tickets.py --serve                # Daemon on a Unix socket; other commands forward to it
   python tickets.py --dot                  # Output dependency graph in DOT format
+  python tickets.py --db-import            # Copy tickets/ + ticket-state/ into tickets.db
+  python tickets.py --db-export            # Write tickets.db back to tickets/ + ticket-state/
+  python tickets.py --backend sqlite ...   # Run any command against tickets.db
 
 Authorized callers:
   - TODO agent (after L1→L2→L3 decomposition)
@@ -29,12 +46,45 @@ No other agent may execute this script.
 """
 
 import argparse
+import bisect
+import contextlib
+import csv
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import os
 import re
+import signal
+import socket
+import socketserver
+import sqlite3
+import subprocess
 import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
+from math import log
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+
+# Optional fast JSON codecs; stdlib json is always the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+# Optional vectorized --metrics; array.array columns and plain loops otherwise
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # ─── Constants ────────────────────────────────────────────────────────────────
 
@@ -42,6 +92,28 @@ ROOT = Path(__file__).resolve().parent  # workspace root
 TICKETS_DIR = ROOT / "tickets"
 STATE_DIR = ROOT / "ticket-state"
 AGENT_OUTPUT_DIR = ROOT / "agent-output"
+INDEX_FILE = ".index.json"  # location index, kept inside STATE_DIR
+INDEX_VERSION = 1
+DEPENDENTS_FILE = ".dependents.json"  # reverse dependency index, kept inside STATE_DIR
+LEASES_FILE = ".leases.json"  # active leases as an expiry min-heap, kept inside STATE_DIR
+PARSE_CACHE_FILE = ".parse-cache.json"  # parsed L3 tasks per markdown file, kept inside STATE_DIR
+VALIDATION_FILE = ".validation.json"  # per-file integrity facts, kept inside STATE_DIR
+QUERY_INDEX_FILE = ".query-index.json"  # --query fields per ticket, kept inside STATE_DIR
+SEARCH_INDEX_FILE = ".search-index.json"  # --search term frequencies per ticket, kept inside STATE_DIR
+EVENT_INDEX_FILE = ".events.json"  # --as-of replay steps per ticket, kept inside STATE_DIR
+METRICS_FILE = ".metrics.json"  # --metrics result for one event-log watermark, kept inside STATE_DIR
+INDEX_JOURNAL_SUFFIX = "l"  # <index>.jsonl: rows saved since the index file was written
+INDEX_JOURNAL_MAX = 1000  # journal lines folded back into the index file on the next flush
+HISTORY_SUFFIX = ".history.jsonl"  # append-only event log next to each master
+ARCHIVE_SUFFIX = ".history.jsonl.gz"  # raw events folded away by --compact
+COMPACT_KEEP_EVENTS = 10  # recent events --compact leaves raw on tickets not yet DONE
+DB_FILE = ROOT / "tickets.db"  # default database for --backend sqlite
+SOCKET_FILE = ".tickets.sock"  # --serve daemon socket, kept inside STATE_DIR
+LOCK_DIR = ".locks"  # per-ticket write locks, kept inside STATE_DIR
+LOCK_STALE_SECONDS = 30  # locks older than this were left by a crashed writer
+EXIT_CONFLICT = 3  # CLI exit code when a write lost a compare-and-swap race
+DAEMON_TIMEOUT = 120  # seconds the CLI waits for a daemon reply
+DB_SCHEMA_VERSION = 1
 
 STAGES = [
     "READY", "RESEARCH", "PM", "ARCHITECT", "DEVOPS", "BACKEND",
@@ -78,12 +150,23 @@ STAGE_TO_AGENT = {
     "VALIDATION": "Validator",
 }
 
+AGENT_TO_STAGE = {agent: stage for stage, agent in STAGE_TO_AGENT.items()}
+
+PRIORITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
 # Map stage names to physical directory names (when they differ)
 # Empty means all stages use their stage name as directory name
 STAGE_TO_STATE_DIR: dict[str, str] = {}
 
 DEFAULT_LEASE_MINUTES = 30
 
+# Concurrent file reads for bulk loads (overridden by --jobs)
+LOAD_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+# Changed L3 markdown (in bytes) needed before --parse starts a process pool;
+# below this, parsing in-process is faster than starting workers
+PARSE_POOL_MIN_BYTES = 1 << 20
+
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
 
@@ -91,16 +174,144 @@ def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def lease_timestamp(expiry: Optional[str]) -> Optional[float]:
+    """POSIX time of an ISO lease expiry, or None if missing, naive or unparsable."""
+    try:
+        moment = datetime.fromisoformat(expiry)
+    except (ValueError, TypeError):
+        return None
+    return moment.timestamp() if moment.tzinfo is not None else None
+
+
+# ─── Serialization ────────────────────────────────────────────────────────────
+#
+# Tickets are read with orjson or msgspec when installed. Writes use orjson
+# only while its output is byte-identical to json.dump(indent=2) — i.e. the
+# ticket holds no floats (orjson writes 1e+20 as 1e20 and NaN/Infinity as
+# null), the result is pure ASCII (stdlib escapes non-ASCII as \uXXXX) and it
+# is encodable without fallbacks — so switching backends never shows up in
+# git diffs.
+
+if orjson is not None:
+    _ORJSON_TICKET_OPTS = (
+        orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+        | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+    )
+    _ORJSON_COMPACT_OPTS = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+    )
+
+
+def json_loads(data: str | bytes) -> Any:
+    """Decode JSON with the fastest available backend."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def json_dumps_compact(data: object) -> str:
+    """Compact JSON for machine-only files (indexes, caches)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str, option=_ORJSON_COMPACT_OPTS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
 def load_ticket(path: Path) -> dict:
-    with open(path, "r") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return json_loads(f.read())
+
+
+def _has_float(value: Any) -> bool:
+    if isinstance(value, float):
+        return True
+    if isinstance(value, dict):
+        return any(_has_float(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_float(item) for item in value)
+    return False
+
+
+def dump_ticket(ticket: dict) -> str:
+    """Serialize a ticket exactly as save_ticket() writes it."""
+    if orjson is not None and not _has_float(ticket):
+        try:
+            data = orjson.dumps(ticket, default=str, option=_ORJSON_TICKET_OPTS)
+        except TypeError:
+            data = b""
+        if data and data.isascii():
+            return data.decode("ascii")
+    return json.dumps(ticket, indent=2, default=str) + "\n"
+
+
+def save_ticket(ticket: dict, path: Path, text: Optional[str] = None) -> None:
+    write_text_atomic(dump_ticket(ticket) if text is None else text, path)
+
+
+def content_hash(text: str | bytes) -> str:
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    """content_hash() of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def save_ticket(ticket: dict, path: Path) -> None:
+def write_text_atomic(text: str, path: Path) -> None:
+    """Write a file via write-then-rename: concurrent readers see the old or the new content, never a torn one."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(ticket, f, indent=2, default=str)
-        f.write("\n")
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json_atomic(data: object, path: Path) -> None:
+    """Write a machine-only JSON file via write-then-rename."""
+    write_text_atomic(json_dumps_compact(data), path)
+
+
+def map_files(
+    reader: Callable[[Path], Any],
+    paths: list[Path],
+    jobs: Optional[int] = None,
+) -> tuple[list[Any], dict[Path, Exception]]:
+    """
+    Apply `reader` to every path on a bounded thread pool.
+
+    Results keep the order of `paths`. A file whose read fails yields None
+    and its exception is collected in the returned {path: error} map, so
+    one bad file does not abort the batch.
+    """
+    jobs = LOAD_JOBS if jobs is None else jobs
+    errors: dict[Path, Exception] = {}
+
+    def attempt(path: Path) -> Any:
+        try:
+            return reader(path)
+        except (OSError, ValueError) as e:
+            errors[path] = e
+            return None
+
+    if jobs <= 1 or len(paths) < 2:
+        return [attempt(p) for p in paths], errors
+    with ThreadPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        return list(pool.map(attempt, paths)), errors
+
+
+def load_tickets_parallel(paths: list[Path], jobs: Optional[int] = None) -> tuple[list[Optional[dict]], dict[Path, Exception]]:
+    """load_ticket() over many files; see map_files()."""
+    return map_files(load_ticket, paths, jobs)
 
 
 def ticket_path_in_state(ticket_id: str, stage: str) -> Path:
@@ -135,11 +346,10 @@ def all_ticket_ids() -> list[str]:
 
 def all_tickets() -> list[dict]:
     """Load all tickets from master directory."""
-    tickets = []
-    for f in TICKETS_DIR.glob("*.json"):
-        if f.name == "ticket-schema.json":
-            continue
-        tickets.append(load_ticket(f))
+    paths = [TICKETS_DIR / f"{tid}.json" for tid in all_ticket_ids()]
+    tickets, errors = load_tickets_parallel(paths)
+    if errors:
+        raise next(iter(errors.values()))
     return tickets
 
 
@@ -149,6 +359,1499 @@ def get_done_ticket_ids() -> set[str]:
     return {f.stem for f in done_dir.glob("*.json")}
 
 
+# ─── Ticket Store ─────────────────────────────────────────────────────────────
+
+
+class TicketConflict(Exception):
+    """A ticket changed (or is being written) elsewhere since this store loaded it."""
+
+    def __init__(self, ticket_id: str, reason: str) -> None:
+        super().__init__(f"{ticket_id} {reason}")
+        self.ticket_id = ticket_id
+
+
+class JournaledIndex:
+    """
+    One derived row per ticket, in an index file plus an append-only journal.
+
+    Each row is stored with the size and mtime of the master it was made
+    from. track() queues the row of each ticket a save() wrote and flush()
+    appends those rows to <index>.jsonl instead of rewriting the index.
+    load() reads the index, replays the journal over it and checks every
+    row against a scan of tickets/: rows of masters added, removed or
+    rewritten behind the store's back (an editor, a merge, a git checkout)
+    are redone from those masters only. The journal's first line names
+    the index generation it extends; a mismatch or a torn line rebuilds
+    every row. Once a load replays or re-reads more than INDEX_JOURNAL_MAX
+    rows, its flush() writes a new index and an empty journal.
+
+    Writers do not load the index; since every journaled row carries its
+    master's stat, a row appended to an outdated journal is caught by the
+    same check. Rows a write left unchanged are not journaled at all.
+    """
+
+    def __init__(self, path: Path, fields: tuple[str, ...], make_row: Callable[[dict], Any]) -> None:
+        self.path = path
+        self.journal_path = path.with_name(path.name + INDEX_JOURNAL_SUFFIX)
+        self.fields = fields  # row layout; an index written for another layout is rebuilt
+        self.make_row = make_row
+        self.rows: Optional[dict[str, Any]] = None
+        self.stats: dict[str, list[int]] = {}
+        self._journaled = 0
+        self._pending: list[dict] = []
+        self._dirty = False
+
+    def load(
+        self, tickets_dir: Path, tickets: Callable[[], list[dict]], load: Callable[[str], Optional[dict]],
+    ) -> dict[str, Any]:
+        """ticket_id → row for every master; `tickets` rebuilds all rows, `load` redoes stale ones."""
+        if self.rows is None:
+            on_disk = master_stats(tickets_dir)
+            try:
+                with open(self.path, "rb") as f:
+                    data = json_loads(f.read())
+                if data.get("version") != INDEX_VERSION or data.get("fields") != list(self.fields):
+                    raise ValueError(f"{self.path.name} version {data.get('version')}")
+                rows, stats = data["rows"], data["stats"]
+                with open(self.journal_path, "rb") as f:
+                    lines = [json_loads(line) for line in f if line.strip()]
+                if not lines or lines[0].get("generation") != data["generation"]:
+                    raise ValueError(f"{self.journal_path.name} belongs to another index")
+                for line in lines[1:]:
+                    rows[line["id"]], stats[line["id"]] = line["row"], line["stat"]
+            except (OSError, ValueError, KeyError, TypeError):
+                # Stats are taken before the reads, so a master rewritten meanwhile is redone next time
+                self.rows = {ticket["ticket_id"]: self.make_row(ticket) for ticket in tickets()}
+                self.stats = on_disk
+                self._journaled = 0
+                self._dirty = True
+                return self.rows
+            self.rows, self.stats, self._journaled = rows, stats, len(lines) - 1
+            for tid in rows.keys() - on_disk.keys():
+                del rows[tid]
+                stats.pop(tid, None)
+                self._dirty = True
+            restamped = 0
+            for tid, stat in on_disk.items():
+                if stats.get(tid) != stat:
+                    ticket = load(tid)
+                    if ticket is not None:
+                        self.track(ticket, stat)
+                        restamped += 1
+            # Bound the replay and re-reads every later load pays: fold them into a new index
+            if self._journaled + restamped > INDEX_JOURNAL_MAX:
+                self._dirty = True
+        return self.rows
+
+    def track(self, ticket: dict, stat: list[int], before: Optional[dict] = None) -> Optional[tuple[Any, Any]]:
+        """
+        Queue the ticket's row, made from a master of the given [size, mtime_ns], for the journal.
+
+        Only rows that changed are journaled: against the loaded rows, or
+        else against `before`, the master this write replaced. An unchanged
+        row keeps its old stat on disk, so the next load re-reads that one
+        master. If the rows are loaded, returns (previous row or None, new
+        row) when the row changed and None when it did not.
+        """
+        tid = ticket["ticket_id"]
+        row = self.make_row(ticket)
+        if self.rows is not None:
+            previous = self.rows.get(tid)
+            self.stats[tid] = stat
+            if previous == row:
+                return None
+            self.rows[tid] = row
+            self._journaled += 1
+            if self._journaled > INDEX_JOURNAL_MAX:
+                self._dirty = True
+            self._pending.append({"id": tid, "row": row, "stat": stat})
+            return previous, row
+        if before is None or self.make_row(before) != row:
+            self._pending.append({"id": tid, "row": row, "stat": stat})
+        return None
+
+    def flush(self) -> None:
+        """Rewrite the index if rebuilt or the journal grew long; otherwise append queued rows."""
+        if self.rows is not None and self._dirty:
+            generation = f"{time.time_ns():x}"
+            data = {
+                "version": INDEX_VERSION, "generation": generation, "fields": self.fields,
+                "rows": self.rows, "stats": self.stats,
+            }
+            write_json_atomic(data, self.path)
+            tmp = self.journal_path.with_name(f"{self.journal_path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json_dumps_compact({"generation": generation}) + "\n")
+            os.replace(tmp, self.journal_path)
+            self._dirty = False
+            self._journaled = 0
+        elif self._pending:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(json_dumps_compact(line) + "\n" for line in self._pending))
+        self._pending.clear()
+
+
+def master_stats(tickets_dir: Path) -> dict[str, list[int]]:
+    """ticket_id → [size, mtime_ns] of every master in tickets/, from one directory scan."""
+    stats = {}
+    try:
+        with os.scandir(tickets_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.name != "ticket-schema.json":
+                    st = entry.stat()
+                    stats[entry.name[:-5]] = [st.st_size, st.st_mtime_ns]
+    except FileNotFoundError:
+        pass
+    return stats
+
+
+class TicketStore:
+    """
+    In-memory view of tickets/ and ticket-state/ for a single run.
+
+    Each stage directory is listed once (on first lookup) into a
+    ticket_id → [(stage, path)] map, and master records are cached after
+    their first load. Core operations read and write through the store so
+    a full sync costs O(files) instead of O(tickets × stages) stat calls.
+
+    The map is persisted in ticket-state/.index.json together with each
+    file's size, mtime and content hash. A cold start reads the index and
+    stats the stage directories; only directories whose mtime changed
+    since the index was written are listed again.
+
+    save() compares the serialized ticket against what is on disk (master
+    hash recorded at load, state hash from the index) and skips files
+    whose content would not change.
+
+    History events are not part of the ticket JSON: append_history()
+    queues them and save() appends them to tickets/<id>.history.jsonl.
+    A legacy inline "history" array is moved into that log the first time
+    the ticket is saved. history() reads the full timeline on demand.
+    Events folded by compact_history() live in tickets/<id>.history.jsonl.gz.
+
+    A reverse dependency index (dependency → dependents) is persisted in
+    ticket-state/.dependents.json with the size and mtime of each master
+    it was read from; entries of masters changed since are redone from
+    those masters alone, and flush() keeps entries another process read
+    from newer masters meanwhile (under the file's lock). The longest
+    downstream chain per ticket is derived from it once and cached there
+    until the graph changes.
+
+    Active leases are kept in ticket-state/.leases.json as ticket → expiry
+    plus a min-heap of [expiry timestamp, ticket] entries, with the same
+    per-master stamps: a lease edited into a master in place is picked up
+    on the next load. save() pushes a new entry when a lease changes;
+    entries outdated by a renewal or release stay in the heap and are
+    skipped when popped (lazy deletion), so expired_leases() costs
+    O(expired · log n). flush() re-reads the index under
+    ticket-state/.locks/.leases.json.lock and applies only this store's
+    lease changes and stamps to it, so concurrent claims are never lost.
+
+    The fields --query filters on and the term frequencies --search ranks
+    by are kept per ticket in ticket-state/.query-index.json and
+    .search-index.json (see query_row(), search_row() and JournaledIndex);
+    save() journals each written ticket's rows instead of rewriting them.
+    query_postings() and search_postings() invert one field or term into
+    ticket IDs in memory when first needed, so neither reads masters.
+
+    Between begin_batch() and end_batch() saves and removals only update
+    the in-memory view; end_batch() then writes each touched ticket once.
+
+    Master writes are compare-and-swap on the ticket's "version" counter:
+    save() takes ticket-state/.locks/<id>.lock (O_EXCL), re-reads the
+    version on disk and raises TicketConflict if it is no longer the one
+    loaded, otherwise writes with version + 1. Losing writers fail fast
+    instead of silently overwriting each other.
+    """
+
+    def __init__(self, tickets_dir: Path = TICKETS_DIR, state_dir: Path = STATE_DIR) -> None:
+        self.tickets_dir = tickets_dir
+        self.state_dir = state_dir
+        self.index_path = state_dir / INDEX_FILE
+        self._locations: Optional[dict[str, list[tuple[str, Path]]]] = None
+        self._master_ids: Optional[set[str]] = None
+        self._masters: dict[str, dict] = {}
+        self._master_hashes: dict[str, str] = {}
+        self._index: Optional[dict] = None
+        self._index_dirty = False
+        self.dependents_path = state_dir / DEPENDENTS_FILE
+        self._dependents: Optional[dict[str, list[str]]] = None
+        self._dependent_stats: dict[str, list[int]] = {}
+        self._relinked: set[str] = set()
+        self._downstream: Optional[dict[str, int]] = None
+        self._dependents_dirty = False
+        self.leases_path = state_dir / LEASES_FILE
+        self._leases: Optional[dict[str, str]] = None
+        self._lease_heap: list[list] = []
+        self._lease_changes: dict[str, Optional[str]] = {}
+        self._lease_stats: dict[str, list[int]] = {}
+        self._lease_stamps: dict[str, Optional[list[int]]] = {}
+        self._leases_dirty = False
+        self._query_index = JournaledIndex(state_dir / QUERY_INDEX_FILE, QUERY_FIELDS, query_row)
+        self._query_postings: dict[str, dict[str, set[str]]] = {}
+        self._search_index = JournaledIndex(state_dir / SEARCH_INDEX_FILE, SEARCH_FIELDS, search_row)
+        self._search_postings: dict[str, dict[str, int]] = {}
+        self._pending_history: dict[str, list[dict]] = {}
+        self._batch: Optional[dict[str, dict]] = None
+        self._versions: dict[str, int] = {}
+
+    def _stage_dir(self, stage: str) -> Path:
+        return self.state_dir / STAGE_TO_STATE_DIR.get(stage, stage)
+
+    # ── Location index ──
+
+    def _load_index(self) -> dict:
+        if self._index is None:
+            try:
+                with open(self.index_path, "rb") as f:
+                    index = json_loads(f.read())
+                if index.get("version") != INDEX_VERSION:
+                    raise ValueError(f"index version {index.get('version')}")
+            except (OSError, ValueError):
+                index = {"version": INDEX_VERSION, "stages": {}}
+                self._index_dirty = True
+            self._index = index
+        return self._index
+
+    @staticmethod
+    def _rescan_stage(stage_dir: Path, previous: dict[str, dict]) -> dict[str, dict]:
+        """List one stage directory, re-hashing only files whose size or mtime changed."""
+        entries: dict[str, dict] = {}
+        with os.scandir(stage_dir) as it:
+            for entry in it:
+                if not (entry.name.endswith(".json") and entry.is_file()):
+                    continue
+                tid = entry.name[:-5]
+                st = entry.stat()
+                prev = previous.get(tid)
+                if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                    entries[tid] = prev
+                    continue
+                with open(entry.path, "rb") as f:
+                    digest = content_hash(f.read())
+                entries[tid] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return entries
+
+    def _index_record(self, stage: str, ticket_id: str, path: Optional[Path], text: Optional[str]) -> None:
+        """Update the index after writing (path/text given) or removing a state file."""
+        stage_dir = self._stage_dir(stage)
+        stages = self._load_index()["stages"]
+        cached = stages.setdefault(stage, {"mtime_ns": None, "tickets": {}})
+        if path is None or text is None:
+            cached["tickets"].pop(ticket_id, None)
+        else:
+            st = path.stat()
+            cached["tickets"][ticket_id] = {
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": content_hash(text),
+            }
+        try:
+            cached["mtime_ns"] = stage_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            stages.pop(stage, None)
+        self._index_dirty = True
+
+    def index_entry(self, ticket_id: str, stage: str) -> Optional[dict]:
+        """Indexed size/mtime/hash of a ticket's state file in `stage`."""
+        self._scan_states()
+        return self._load_index()["stages"].get(stage, {}).get("tickets", {}).get(ticket_id)
+
+    def flush(self) -> None:
+        """Persist the location, dependents, lease, query and search indexes if they changed."""
+        if self._batch is not None:
+            return
+        if self._index is not None and self._index_dirty:
+            write_json_atomic(self._index, self.index_path)
+            self._index_dirty = False
+        if self._leases is not None and self._leases_dirty:
+            # Waiting as long as a lock can live means a crashed holder is broken, never raised on
+            with self._ticket_lock(LEASES_FILE, wait=LOCK_STALE_SECONDS):
+                self._merge_leases()
+                data = {
+                    "version": INDEX_VERSION, "stats": self._lease_stats,
+                    "leases": self._leases, "heap": self._lease_heap,
+                }
+                write_json_atomic(data, self.leases_path)
+            self._leases_dirty = False
+        self._query_index.flush()
+        self._search_index.flush()
+        if self._dependents is not None and self._dependents_dirty:
+            with self._ticket_lock(DEPENDENTS_FILE, wait=LOCK_STALE_SECONDS):
+                self._merge_dependents()
+                data = {
+                    "version": INDEX_VERSION, "stats": self._dependent_stats, "dependents": self._dependents,
+                }
+                if self._downstream is not None:
+                    data["downstream"] = self._downstream
+                write_json_atomic(data, self.dependents_path)
+            self._dependents_dirty = False
+
+    # ── Dependents index ──
+
+    def _master_stats(self) -> dict[str, list[int]]:
+        """[size, mtime_ns] of every master; the dependents index is checked against it."""
+        return master_stats(self.tickets_dir)
+
+    def _read_dependents_file(self) -> Optional[dict]:
+        """The reverse index as stored, or None if missing or unreadable."""
+        try:
+            with open(self.dependents_path, "rb") as f:
+                data = json_loads(f.read())
+            if data.get("version") != INDEX_VERSION or not isinstance(data.get("stats"), dict):
+                return None
+            return data if "dependents" in data else None
+        except (OSError, ValueError):
+            return None
+
+    def _read_dependents(self) -> Optional[dict]:
+        """
+        On-disk reverse index, or None if missing or unreadable.
+
+        Each master's edges are stored with the [size, mtime_ns] they were
+        read at; those of masters added, removed or rewritten since (an
+        editor, a merge, another process) are redone from those masters.
+        """
+        data = self._read_dependents_file()
+        if data is None:
+            return None
+        on_disk = self._master_stats()
+        stats = data["stats"]
+        stale = {tid for tid, st in on_disk.items() if stats.get(tid) != st} | (stats.keys() - on_disk.keys())
+        if stale:
+            before = {dep: list(dependents) for dep, dependents in data["dependents"].items()}
+            self._relink(data["dependents"], stats, stale, on_disk)
+            if data["dependents"] != before:
+                data.pop("downstream", None)  # ranks follow the edges, not the stamps
+            self._dependents_dirty = True
+        return data
+
+    def _relink(self, graph: dict[str, list[str]], stats: dict, tids: set[str], on_disk: dict) -> None:
+        """Replace the edges of `tids` in `graph` with their masters' current dependencies."""
+        for dep in list(graph):
+            kept = [tid for tid in graph[dep] if tid not in tids]
+            if kept:
+                graph[dep] = kept
+            else:
+                del graph[dep]
+        for tid in tids:
+            stats.pop(tid, None)
+            if tid not in on_disk:
+                continue
+            try:
+                ticket = self.load(tid)
+            except TicketConflict:
+                continue  # unreadable now; stays stale and is retried by the next load
+            if ticket is None:
+                continue
+            stats[tid] = on_disk[tid]
+            for dep in ticket.get("dependencies", []):
+                dependents = graph.setdefault(dep, [])
+                if tid not in dependents:
+                    bisect.insort(dependents, tid)
+
+    def _load_dependents(self) -> dict[str, list[str]]:
+        if self._dependents is None:
+            data = self._read_dependents()
+            if data is None:
+                self.rebuild_dependents(self.tickets())
+            else:
+                self._dependents, self._dependent_stats = data["dependents"], data.get("stats", {})
+                self._downstream = data.get("downstream")
+        return self._dependents
+
+    def rebuild_dependents(self, tickets: list[dict]) -> None:
+        """Recompute the reverse dependency index from a full set of masters."""
+        stats = self._master_stats()
+        graph: dict[str, list[str]] = {}
+        for ticket in tickets:
+            for dep in ticket.get("dependencies", []):
+                graph.setdefault(dep, []).append(ticket["ticket_id"])
+        for dependents in graph.values():
+            dependents.sort()
+        if self._dependents is not None:
+            previous, previous_stats = self._dependents, self._dependent_stats
+        else:
+            data = self._read_dependents()
+            previous, previous_stats = (data["dependents"], data.get("stats", {})) if data else (None, None)
+            self._downstream = data.get("downstream") if data else None
+        if graph != previous or stats != previous_stats:
+            if graph != previous:
+                self._downstream = None
+            self._dependents, self._dependent_stats = graph, stats
+            self._dependents_dirty = True
+        elif self._dependents is None:
+            self._dependents, self._dependent_stats = graph, stats
+
+    def _merge_dependents(self) -> None:
+        """
+        Take in entries other processes refreshed since this store read the
+        index: for each master, keep the edges read from its current
+        content. Called by flush() under the dependents lock.
+        """
+        data = self._read_dependents_file()
+        if data is None:
+            return
+        current = self._master_stats()
+        theirs = data["stats"]
+        newer = {
+            tid for tid, st in theirs.items()
+            if st == current.get(tid) and self._dependent_stats.get(tid) != st
+        }
+        if not newer:
+            return
+        graph = self._dependents
+        for dep in list(graph):
+            kept = [tid for tid in graph[dep] if tid not in newer]
+            if kept:
+                graph[dep] = kept
+            else:
+                del graph[dep]
+        for dep, dependents in data["dependents"].items():
+            for tid in dependents:
+                if tid in newer:
+                    bisect.insort(graph.setdefault(dep, []), tid)
+        for tid in newer:
+            self._dependent_stats[tid] = theirs[tid]
+        self._downstream = None
+
+    def dependents(self, ticket_id: str) -> list[str]:
+        """Tickets that list `ticket_id` in their dependencies."""
+        return list(self._load_dependents().get(ticket_id, []))
+
+    def link_dependencies(self, ticket_id: str, old: list[str], new: list[str]) -> None:
+        """Update the reverse index when a ticket's dependencies change."""
+        graph = self._load_dependents()
+        for dep in set(old) - set(new):
+            if ticket_id in graph.get(dep, []):
+                graph[dep].remove(ticket_id)
+                if not graph[dep]:
+                    del graph[dep]
+        for dep in set(new) - set(old):
+            dependents = graph.setdefault(dep, [])
+            if ticket_id not in dependents:
+                dependents.append(ticket_id)
+                dependents.sort()
+        # The master is not written yet: save() stamps it, else the next load re-reads it
+        self._dependent_stats.pop(ticket_id, None)
+        self._relinked.add(ticket_id)
+        self._downstream = None
+        self._dependents_dirty = True
+
+    def _track_dependents(self, ticket: dict, stat: list[int], before: Optional[dict]) -> None:
+        """Stamp the ticket's dependents entry after a write that left it right."""
+        if self._dependents is None:
+            return
+        tid = ticket["ticket_id"]
+        kept = (
+            tid in self._dependent_stats and before is not None
+            and before.get("dependencies", []) == ticket.get("dependencies", [])
+        )
+        if (kept or tid in self._relinked) and self._dependent_stats.get(tid) != stat:
+            self._dependent_stats[tid] = stat
+            self._dependents_dirty = True
+        self._relinked.discard(tid)
+
+    def downstream(self) -> dict[str, int]:
+        """
+        Length of the longest chain of dependents below each ticket.
+
+        Computed once per dependency graph with an iterative DFS and cached
+        alongside the reverse index. Edges closing a cycle are ignored.
+        """
+        graph = self._load_dependents()
+        if self._downstream is None:
+            lengths: dict[str, int] = {}
+            on_stack: set[str] = set()
+            for root in graph:
+                if root in lengths:
+                    continue
+                stack = [(root, iter(graph.get(root, [])))]
+                on_stack.add(root)
+                while stack:
+                    node, children = stack[-1]
+                    child = next(children, None)
+                    if child is None:
+                        stack.pop()
+                        on_stack.discard(node)
+                        lengths[node] = max(
+                            (lengths.get(c, 0) + 1 for c in graph.get(node, []) if c in lengths and c not in on_stack),
+                            default=0,
+                        )
+                    elif child not in lengths and child not in on_stack:
+                        on_stack.add(child)
+                        stack.append((child, iter(graph.get(child, []))))
+            self._downstream = {tid: n for tid, n in lengths.items() if n}
+            self._dependents_dirty = True
+        return self._downstream
+
+    # ── Lease heap ──
+
+    def _load_leases(self) -> dict[str, str]:
+        if self._leases is None:
+            try:
+                with open(self.leases_path, "rb") as f:
+                    data = json_loads(f.read())
+                if data.get("version") != INDEX_VERSION:
+                    raise ValueError(f"lease index version {data.get('version')}")
+                if not isinstance(data.get("stats"), dict):
+                    raise ValueError("lease index has no master stats")
+                self._leases, self._lease_heap = data["leases"], data["heap"]
+                self._lease_stats = data["stats"]
+            except (OSError, ValueError, KeyError):
+                self._leases, self._lease_heap, self._lease_stats = {}, [], {}  # every master is read below
+            self._refresh_leases()
+        return self._leases
+
+    def _refresh_leases(self) -> None:
+        """
+        Re-read the lease of every master added, removed or rewritten since
+        its [size, mtime_ns] was recorded (an editor, a merge, a crash).
+        """
+        on_disk = self._master_stats()
+        stats = self._lease_stats
+        for tid in stats.keys() - on_disk.keys():
+            self._track_lease({"ticket_id": tid}, None)
+        for tid, st in on_disk.items():
+            if stats.get(tid) == st:
+                continue
+            try:
+                ticket = self.load(tid)
+            except TicketConflict:
+                continue  # unreadable now; stays stale and is retried by the next load
+            if ticket is not None:
+                self._track_lease(ticket, st)
+
+    def _track_lease(self, ticket: dict, stat: Optional[list[int]]) -> None:
+        """
+        Record the ticket's current lease (or its absence) in the expiry
+        heap, stamped with the [size, mtime_ns] of the master it came from
+        (None once the master is gone).
+        """
+        leases = self._load_leases()
+        tid = ticket["ticket_id"]
+        if tid not in self._lease_stats or self._lease_stats[tid] != stat:
+            if stat is None:
+                self._lease_stats.pop(tid, None)
+            else:
+                self._lease_stats[tid] = stat
+            self._lease_stamps[tid] = stat
+            self._leases_dirty = True
+        expiry = ticket.get("lease_expiry") if ticket.get("claimed_by") else None
+        stamp = lease_timestamp(expiry)
+        if stamp is None:
+            if leases.pop(tid, None) is not None:
+                self._lease_changes[tid] = None
+                self._leases_dirty = True
+            return
+        if leases.get(tid) == expiry:
+            return
+        leases[tid] = expiry
+        self._lease_changes[tid] = expiry
+        heapq.heappush(self._lease_heap, [stamp, tid])
+        if len(self._lease_heap) > 2 * len(leases) + 64:
+            # Mostly outdated entries: rebuild from the live leases
+            self._lease_heap = [[lease_timestamp(e), t] for t, e in leases.items()]
+            heapq.heapify(self._lease_heap)
+        self._leases_dirty = True
+
+    def _merge_leases(self) -> None:
+        """
+        Re-apply this store's lease changes and stamps on top of the index
+        on disk, so leases other processes saved since it was loaded are
+        kept. Called by flush() under the lease lock.
+        """
+        try:
+            with open(self.leases_path, "rb") as f:
+                data = json_loads(f.read())
+            if data.get("version") != INDEX_VERSION:
+                raise ValueError(f"lease index version {data.get('version')}")
+            leases, heap, stats = data["leases"], data["heap"], data["stats"]
+            if not isinstance(stats, dict):
+                raise ValueError("lease index has no master stats")
+        except (OSError, ValueError, KeyError):
+            leases, heap, stats = self._leases, self._lease_heap, self._lease_stats
+        else:
+            for tid, stat in self._lease_stamps.items():
+                if stat is None:
+                    stats.pop(tid, None)
+                else:
+                    stats[tid] = stat
+            for tid, expiry in self._lease_changes.items():
+                if expiry is None:
+                    leases.pop(tid, None)
+                elif leases.get(tid) != expiry:
+                    leases[tid] = expiry
+                    heapq.heappush(heap, [lease_timestamp(expiry), tid])
+        self._leases, self._lease_heap, self._lease_stats = leases, heap, stats
+        self._lease_changes, self._lease_stamps = {}, {}
+
+    def expired_leases(self, now: datetime) -> list[str]:
+        """
+        IDs of claimed tickets whose lease ended before `now`, soonest first.
+
+        Pops heap entries due before `now`. Outdated ones are dropped; live
+        ones are pushed back and become outdated once the release is saved.
+        """
+        leases = self._load_leases()
+        cutoff = now.timestamp()
+        due: dict[str, list] = {}
+        while self._lease_heap and self._lease_heap[0][0] < cutoff:
+            entry = heapq.heappop(self._lease_heap)
+            self._leases_dirty = True
+            if lease_timestamp(leases.get(entry[1])) == entry[0]:
+                due.setdefault(entry[1], entry)
+        for entry in due.values():
+            heapq.heappush(self._lease_heap, entry)
+        return list(due)
+
+    # ── Query and search indexes ──
+
+    def query_rows(self) -> dict[str, list]:
+        """ticket_id → query_row() for every master."""
+        return self._query_index.load(self.tickets_dir, self.tickets, self.load)
+
+    def query_postings(self, field: str) -> dict[str, set[str]]:
+        """Casefolded value → IDs of tickets carrying it, inverted from query_rows() on first use."""
+        postings = self._query_postings.get(field)
+        if postings is None:
+            column = QUERY_FIELDS.index(field)
+            postings = {}
+            for tid, row in self.query_rows().items():
+                for value in row[column]:
+                    postings.setdefault(value, set()).add(tid)
+            self._query_postings[field] = postings
+        return postings
+
+    def _track_query(self, ticket: dict, stat: list[int], before: Optional[dict]) -> None:
+        """Journal the ticket's query row after a write, keeping built postings in step."""
+        change = self._query_index.track(ticket, stat, before)
+        if change is None:
+            return
+        tid, (previous, row) = ticket["ticket_id"], change
+        for field, postings in self._query_postings.items():
+            column = QUERY_FIELDS.index(field)
+            for value in previous[column] if previous is not None else ():
+                postings[value].discard(tid)
+                if not postings[value]:
+                    del postings[value]
+            for value in row[column]:
+                postings.setdefault(value, set()).add(tid)
+
+    def search_rows(self) -> dict[str, list]:
+        """ticket_id → search_row() for every master."""
+        return self._search_index.load(self.tickets_dir, self.tickets, self.load)
+
+    def search_postings(self, term: str) -> dict[str, int]:
+        """ticket_id → frequency of `term`, inverted from search_rows() on first use."""
+        postings = self._search_postings.get(term)
+        if postings is None:
+            postings = {tid: row[1][term] for tid, row in self.search_rows().items() if term in row[1]}
+            self._search_postings[term] = postings
+        return postings
+
+    def _track_search(self, ticket: dict, stat: list[int], before: Optional[dict]) -> None:
+        """Journal the ticket's search row after a write, keeping built postings in step."""
+        change = self._search_index.track(ticket, stat, before)
+        if change is None:
+            return
+        tid, row = ticket["ticket_id"], change[1]
+        for term, postings in self._search_postings.items():
+            if term in row[1]:
+                postings[tid] = row[1][term]
+            else:
+                postings.pop(tid, None)
+
+    # ── Scanning ──
+
+    def _scan_states(self) -> dict[str, list[tuple[str, Path]]]:
+        if self._locations is None:
+            stages = self._load_index()["stages"]
+            locations: dict[str, list[tuple[str, Path]]] = {}
+            for stage in STAGES:
+                stage_dir = self._stage_dir(stage)
+                try:
+                    mtime_ns = stage_dir.stat().st_mtime_ns
+                except FileNotFoundError:
+                    if stages.pop(stage, None) is not None:
+                        self._index_dirty = True
+                    continue
+                cached = stages.get(stage)
+                if cached is None or cached["mtime_ns"] != mtime_ns:
+                    previous = cached["tickets"] if cached else {}
+                    cached = {"mtime_ns": mtime_ns, "tickets": self._rescan_stage(stage_dir, previous)}
+                    stages[stage] = cached
+                    self._index_dirty = True
+                for tid in cached["tickets"]:
+                    locations.setdefault(tid, []).append((stage, stage_dir / f"{tid}.json"))
+            self._locations = locations
+        return self._locations
+
+    def _scan_masters(self) -> set[str]:
+        if self._master_ids is None:
+            ids = set()
+            try:
+                with os.scandir(self.tickets_dir) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".json") and entry.name != "ticket-schema.json":
+                            ids.add(entry.name[:-5])
+            except FileNotFoundError:
+                pass
+            self._master_ids = ids
+        return self._master_ids
+
+    # ── Lookups ──
+
+    def locations(self, ticket_id: str) -> list[tuple[str, Path]]:
+        """All state directories holding a copy of the ticket, in STAGES order."""
+        return list(self._scan_states().get(ticket_id, []))
+
+    def locate(self, ticket_id: str) -> Optional[tuple[str, Path]]:
+        """Same contract as find_ticket_in_states(), answered from the scan."""
+        found = self._scan_states().get(ticket_id)
+        return found[0] if found else None
+
+    def stage_ids(self, stage: str) -> set[str]:
+        """IDs of tickets with a copy in the given stage directory."""
+        return {
+            tid for tid, locs in self._scan_states().items()
+            if any(s == stage for s, _ in locs)
+        }
+
+    def done_ids(self) -> set[str]:
+        return self.stage_ids("DONE")
+
+    def is_done(self, ticket_id: str) -> bool:
+        return any(stage == "DONE" for stage, _ in self._scan_states().get(ticket_id, []))
+
+    def exists(self, ticket_id: str) -> bool:
+        """Whether a master record exists in tickets/."""
+        if self._master_ids is None:
+            # A single stat is cheaper than listing tickets/ for one lookup
+            return ticket_id in self._masters or (self.tickets_dir / f"{ticket_id}.json").is_file()
+        return ticket_id in self._master_ids
+
+    def ticket_ids(self) -> list[str]:
+        return sorted(self._scan_masters())
+
+    # ── Records ──
+
+    def load(self, ticket_id: str) -> Optional[dict]:
+        """Load (and cache) the master record, or None if it does not exist."""
+        if ticket_id in self._masters:
+            return self._masters[ticket_id]
+        if not self.exists(ticket_id):
+            return None
+        with open(self.tickets_dir / f"{ticket_id}.json", "rb") as f:
+            data = f.read()
+        try:
+            ticket = json_loads(data)
+        except ValueError as e:
+            raise TicketConflict(ticket_id, f"master is unreadable ({e})") from e
+        self._masters[ticket_id] = ticket
+        self._master_hashes[ticket_id] = content_hash(data)
+        self._versions[ticket_id] = ticket.get("version", 0)
+        return ticket
+
+    def tickets(self) -> list[dict]:
+        """All master records, loaded once (uncached ones in parallel)."""
+        ids = self.ticket_ids()
+        missing = [tid for tid in ids if tid not in self._masters]
+        contents, errors = map_files(Path.read_bytes, [self.tickets_dir / f"{tid}.json" for tid in missing])
+        if errors:
+            raise next(iter(errors.values()))
+        for tid, data in zip(missing, contents):
+            self._masters[tid] = json_loads(data)
+            self._master_hashes[tid] = content_hash(data)
+            self._versions[tid] = self._masters[tid].get("version", 0)
+        return [self._masters[tid] for tid in ids]
+
+    def state_copy(self, ticket_id: str, stage: str) -> Optional[dict]:
+        """The ticket as stored in one stage directory, or None if it is not there."""
+        if self._batch is not None and stage in self._batch.get(ticket_id, {}).get("stages", ()):
+            return self._batch[ticket_id]["ticket"]
+        for s, path in self.locations(ticket_id):
+            if s == stage:
+                return load_ticket(path)
+        return None
+
+    # ── History ──
+
+    def history_path(self, ticket_id: str) -> Path:
+        return self.tickets_dir / f"{ticket_id}{HISTORY_SUFFIX}"
+
+    def append_history(self, ticket_id: str, event: dict) -> None:
+        """Queue a history event; it is written by the next save() of the ticket."""
+        self._pending_history.setdefault(ticket_id, []).append(event)
+
+    def history(self, ticket_id: str) -> list[dict]:
+        """Full event timeline of a ticket, oldest first (read on demand)."""
+        ticket = self.load(ticket_id) or {}
+        events = list(ticket.get("history", []))
+        try:
+            with open(self.history_path(ticket_id), "rb") as f:
+                events.extend(json_loads(line) for line in f if line.strip())
+        except FileNotFoundError:
+            pass
+        return events + self._pending_history.get(ticket_id, [])
+
+    def _write_history(self, ticket_id: str, events: list[dict]) -> None:
+        if events:
+            with open(self.history_path(ticket_id), "a", encoding="utf-8") as f:
+                f.write("".join(json_dumps_compact(event) + "\n" for event in events))
+
+    def set_history(self, ticket_id: str, events: list[dict]) -> None:
+        """Replace a ticket's whole timeline (used when copying between stores)."""
+        self._pending_history.pop(ticket_id, None)
+        write_text_atomic("".join(json_dumps_compact(event) + "\n" for event in events), self.history_path(ticket_id))
+
+    def archive_path(self, ticket_id: str) -> Path:
+        return self.tickets_dir / f"{ticket_id}{ARCHIVE_SUFFIX}"
+
+    def archived_history(self, ticket_id: str) -> list[dict]:
+        """Raw events folded away by compact_history(), oldest first."""
+        try:
+            with gzip.open(self.archive_path(ticket_id), "rb") as f:
+                return [json_loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def write_archive(self, ticket_id: str, events: list[dict]) -> None:
+        """Replace the archive of raw events (an empty list deletes it)."""
+        path = self.archive_path(ticket_id)
+        if not events:
+            path.unlink(missing_ok=True)
+            return
+        data = "".join(json_dumps_compact(event) + "\n" for event in events).encode("utf-8")
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        # mtime=0 keeps the archive bytes stable for identical events
+        with open(tmp, "wb") as f:
+            f.write(gzip.compress(data, mtime=0))
+        os.replace(tmp, path)
+
+    # ── Writes ──
+
+    @staticmethod
+    def _unchanged(path: Path, text: str, known_hash: Optional[str]) -> bool:
+        """Whether writing `text` to `path` would leave its content as-is."""
+        if known_hash is None:
+            return False
+        if known_hash == content_hash(text):
+            return True
+        # Hand-formatted files hash differently but may hold the same data
+        try:
+            return load_ticket(path) == json_loads(text)
+        except (OSError, ValueError):
+            return False
+
+    def save(self, ticket: dict, stage: Optional[str] = None, cas: bool = True) -> bool:
+        """
+        Write the master record and, if given, the state copy in `stage`.
+
+        Files whose content would not change are left untouched. Otherwise
+        the version is bumped under the ticket lock; with cas=True a version
+        on disk other than the one loaded raises TicketConflict (cas=False
+        writes the ticket's own version as-is, for copies between stores).
+        A legacy inline "history" array moves to the history log, and is
+        dropped from the ticket's other state copies in the same write.
+        Returns True if anything was written (always True inside a batch).
+        """
+        tid = ticket["ticket_id"]
+        if self._batch is not None:
+            pending = self._batch.setdefault(tid, {"ticket": ticket, "stages": set(), "removed": set()})
+            pending["ticket"] = ticket
+            if stage is not None:
+                pending["stages"].add(stage)
+                pending["removed"].discard(stage)
+                locs = self._scan_states().setdefault(tid, [])
+                if not any(s == stage for s, _ in locs):
+                    locs.append((stage, self._stage_dir(stage) / f"{tid}.json"))
+                    locs.sort(key=lambda loc: STAGES.index(loc[0]))
+            if self._master_ids is not None:
+                self._master_ids.add(tid)
+            self._masters[tid] = ticket
+            return True
+        inline = "history" in ticket
+        events = ticket.pop("history", []) + self._pending_history.pop(tid, [])
+        text = dump_ticket(ticket)
+        master_path = self.tickets_dir / f"{tid}.json"
+        written = not (
+            self._unchanged(master_path, text, self._master_hashes.get(tid))
+            and (stage is None or self._state_unchanged(tid, stage, text))
+        )
+        if written or events:
+            before = None
+            with self._ticket_lock(tid):
+                if cas:
+                    try:
+                        before = load_ticket(master_path)
+                        current = before.get("version", 0)
+                    except FileNotFoundError:
+                        current = None
+                    except ValueError as e:
+                        self._evict(tid)
+                        raise TicketConflict(tid, f"master is unreadable ({e})") from e
+                    expected = self._versions.get(tid)
+                    if expected is not None and current != expected:
+                        self._evict(tid)
+                        raise TicketConflict(tid, f"changed concurrently (version {expected} → {current})")
+                    ticket["version"] = (current or 0) + 1
+                    text = dump_ticket(ticket)
+                if stage is not None:
+                    self.save_state_copy(ticket, stage, text)
+                if inline:
+                    for other, _ in self.locations(tid):
+                        copy = self.state_copy(tid, other) if other != stage else None
+                        if copy is not None and copy.pop("history", None) is not None:
+                            self.save_state_copy(copy, other)
+                save_ticket(ticket, master_path, text)
+                st = master_path.stat()
+                self._master_hashes[tid] = content_hash(text)
+                self._versions[tid] = ticket.get("version", 0)
+                self._write_history(tid, events)
+            self._track_lease(ticket, [st.st_size, st.st_mtime_ns])
+            self._track_query(ticket, [st.st_size, st.st_mtime_ns], before)
+            self._track_search(ticket, [st.st_size, st.st_mtime_ns], before)
+            self._track_dependents(ticket, [st.st_size, st.st_mtime_ns], before)
+            written = True
+        elif stage is not None:
+            self.save_state_copy(ticket, stage, text)
+        if self._master_ids is not None:
+            self._master_ids.add(tid)
+        self._masters[tid] = ticket
+        return written
+
+    @contextlib.contextmanager
+    def _ticket_lock(self, ticket_id: str, wait: float = 0):
+        """
+        Hold ticket-state/.locks/<id>.lock; raises TicketConflict if another
+        writer still has it after `wait` seconds.
+        """
+        lock_dir = self.state_dir / LOCK_DIR
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        path = lock_dir / f"{ticket_id}.lock"
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                break
+            except FileExistsError:
+                try:
+                    age = time.time() - path.stat().st_mtime
+                except FileNotFoundError:
+                    continue  # released meanwhile; try again
+                if age >= LOCK_STALE_SECONDS:
+                    path.unlink(missing_ok=True)
+                elif time.monotonic() >= deadline:
+                    raise TicketConflict(ticket_id, "is being written by another process") from None
+                else:
+                    time.sleep(0.01)
+        try:
+            os.write(fd, f"{os.getpid()}\n".encode("ascii"))
+            os.close(fd)
+            yield
+        finally:
+            path.unlink(missing_ok=True)
+
+    def _evict(self, ticket_id: str) -> None:
+        """Forget cached data for a ticket so the next load() re-reads it."""
+        self._masters.pop(ticket_id, None)
+        self._master_hashes.pop(ticket_id, None)
+        self._versions.pop(ticket_id, None)
+        self._pending_history.pop(ticket_id, None)
+
+    def save_state_copy(self, ticket: dict, stage: str, text: Optional[str] = None) -> bool:
+        """Write only the state copy in `stage`, unless its content would not change."""
+        tid = ticket["ticket_id"]
+        text = text if text is not None else dump_ticket(ticket)
+        path = self._stage_dir(stage) / f"{tid}.json"
+        locs = self._scan_states().setdefault(tid, [])
+        written = False
+        if not self._state_unchanged(tid, stage, text):
+            save_ticket(ticket, path, text)
+            self._index_record(stage, tid, path, text)
+            written = True
+        if not any(s == stage for s, _ in locs):
+            locs.append((stage, path))
+            locs.sort(key=lambda loc: STAGES.index(loc[0]))
+        return written
+
+    def _state_unchanged(self, ticket_id: str, stage: str, text: str) -> bool:
+        """Whether the indexed, untouched state copy in `stage` already holds `text`."""
+        path = self._stage_dir(stage) / f"{ticket_id}.json"
+        entry = self.index_entry(ticket_id, stage)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return False
+        fresh = entry is not None and (st.st_size, st.st_mtime_ns) == (entry["size"], entry["mtime_ns"])
+        return fresh and self._unchanged(path, text, entry["sha256"])
+
+    def remove(self, ticket_id: str, stage: str) -> None:
+        """Delete the state copy of a ticket from one stage directory."""
+        locs = self._scan_states().get(ticket_id, [])
+        for s, path in list(locs):
+            if s == stage:
+                if self._batch is not None:
+                    pending = self._batch.setdefault(
+                        ticket_id, {"ticket": None, "stages": set(), "removed": set()}
+                    )
+                    pending["stages"].discard(stage)
+                    pending["removed"].add(stage)
+                else:
+                    if path.exists():
+                        path.unlink()
+                    self._index_record(stage, ticket_id, None, None)
+                locs.remove((s, path))
+        if not locs:
+            self._scan_states().pop(ticket_id, None)
+
+    # ── Batches ──
+
+    def begin_batch(self) -> None:
+        """Defer file writes until end_batch()."""
+        if self._batch is None:
+            self._batch = {}
+
+    def end_batch(self) -> dict:
+        """
+        Write every ticket touched since begin_batch() once.
+
+        Tickets whose compare-and-swap fails are left untouched on disk.
+        Returns {"written": count, "conflicts": [ticket ids]}.
+        """
+        batch, self._batch = self._batch or {}, None
+        result: dict = {"written": 0, "conflicts": []}
+        for tid, pending in batch.items():
+            changed = False
+            ticket = pending["ticket"]
+            if ticket is not None:
+                stages = sorted(pending["stages"], key=STAGES.index)
+                try:
+                    changed = self.save(ticket, stages[0] if stages else None)
+                except TicketConflict:
+                    result["conflicts"].append(tid)
+                    continue
+                for stage in stages[1:]:
+                    changed |= self.save_state_copy(ticket, stage)
+            for stage in pending["removed"]:
+                path = self._stage_dir(stage) / f"{tid}.json"
+                if path.exists():
+                    path.unlink()
+                    changed = True
+                self._index_record(stage, tid, None, None)
+            result["written"] += changed
+        self.flush()
+        return result
+
+
+# ─── SQLite Backend ───────────────────────────────────────────────────────────
+
+
+class SqliteTicketStore(TicketStore):
+    """
+    TicketStore backed by a single SQLite database instead of JSON files.
+
+    Tables:
+      tickets  — one row per master record (JSON body, current state only)
+      states   — (ticket_id, stage) rows, the equivalent of state directories;
+                 body is NULL unless the state copy differs from the master
+      history  — append-only event rows per ticket
+      leases   — active claims, indexed by expiry
+      deps     — (ticket_id, dependency) edges, indexed by dependency
+      history_archive — gzipped JSONL of events folded by compact_history()
+
+    The database runs in WAL mode so status readers never block writers.
+    Writes open one IMMEDIATE transaction that flush() commits, so every
+    core operation (which ends with flush()) is applied atomically.
+
+    Use copy_tickets() to import from or export to the directory layout.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_id TEXT PRIMARY KEY,
+            body      TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS states (
+            ticket_id TEXT NOT NULL REFERENCES tickets(ticket_id) ON DELETE CASCADE,
+            stage     TEXT NOT NULL,
+            body      TEXT,
+            PRIMARY KEY (ticket_id, stage)
+        );
+        CREATE INDEX IF NOT EXISTS states_by_stage ON states(stage);
+        CREATE TABLE IF NOT EXISTS history (
+            ticket_id TEXT NOT NULL REFERENCES tickets(ticket_id) ON DELETE CASCADE,
+            seq       INTEGER NOT NULL,
+            timestamp TEXT,
+            event     TEXT,
+            body      TEXT NOT NULL,
+            PRIMARY KEY (ticket_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            ticket_id    TEXT PRIMARY KEY REFERENCES tickets(ticket_id) ON DELETE CASCADE,
+            claimed_by   TEXT NOT NULL,
+            machine_id   TEXT,
+            operator     TEXT,
+            lease_expiry TEXT
+        );
+        CREATE INDEX IF NOT EXISTS leases_by_expiry ON leases(lease_expiry);
+        CREATE TABLE IF NOT EXISTS deps (
+            ticket_id  TEXT NOT NULL REFERENCES tickets(ticket_id) ON DELETE CASCADE,
+            dependency TEXT NOT NULL,
+            PRIMARY KEY (ticket_id, dependency)
+        );
+        CREATE INDEX IF NOT EXISTS deps_by_dependency ON deps(dependency);
+        CREATE TABLE IF NOT EXISTS history_archive (
+            ticket_id TEXT PRIMARY KEY REFERENCES tickets(ticket_id) ON DELETE CASCADE,
+            events    BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path = DB_FILE, state_dir: Path = STATE_DIR) -> None:
+        super().__init__(state_dir=state_dir)
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, DB_SCHEMA_VERSION):
+            raise ValueError(f"{db_path}: unsupported schema version {version}")
+        self._db.executescript(self.SCHEMA)
+        self._db.execute(f"PRAGMA user_version={DB_SCHEMA_VERSION}")
+        self._bodies: dict[str, str] = {}
+
+    def _begin(self) -> None:
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN IMMEDIATE")
+
+    def flush(self) -> None:
+        """Commit the pending transaction, if any."""
+        if self._batch is None and self._db.in_transaction:
+            self._db.commit()
+
+    def end_batch(self) -> dict:
+        """A batch is one transaction: commit it (conflicts were already reported per operation)."""
+        batch, self._batch = self._batch or {}, None
+        self.flush()
+        return {"written": len(batch), "conflicts": []}
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    # ── Dependents index ──
+
+    def _master_stats(self) -> dict[str, list[int]]:
+        return {}  # the deps table is always current
+
+    def _read_dependents(self) -> Optional[dict]:
+        graph: dict[str, list[str]] = {}
+        for tid, dep in self._db.execute("SELECT ticket_id, dependency FROM deps ORDER BY dependency, ticket_id"):
+            graph.setdefault(dep, []).append(tid)
+        return {"dependents": graph}
+
+    def dependents(self, ticket_id: str) -> list[str]:
+        rows = self._db.execute(
+            "SELECT ticket_id FROM deps WHERE dependency = ? ORDER BY ticket_id", (ticket_id,)
+        )
+        return [tid for (tid,) in rows]
+
+    # ── Lookups ──
+
+    def locations(self, ticket_id: str) -> list[tuple[str, Path]]:
+        rows = self._db.execute("SELECT stage FROM states WHERE ticket_id = ?", (ticket_id,))
+        stages = sorted((stage for (stage,) in rows), key=STAGES.index)
+        return [(stage, self._stage_dir(stage) / f"{ticket_id}.json") for stage in stages]
+
+    def locate(self, ticket_id: str) -> Optional[tuple[str, Path]]:
+        found = self.locations(ticket_id)
+        return found[0] if found else None
+
+    def stage_ids(self, stage: str) -> set[str]:
+        return {tid for (tid,) in self._db.execute("SELECT ticket_id FROM states WHERE stage = ?", (stage,))}
+
+    def is_done(self, ticket_id: str) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM states WHERE ticket_id = ? AND stage = 'DONE'", (ticket_id,)
+        ).fetchone()
+        return row is not None
+
+    def exists(self, ticket_id: str) -> bool:
+        return ticket_id in self._masters or self._db.execute(
+            "SELECT 1 FROM tickets WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone() is not None
+
+    def ticket_ids(self) -> list[str]:
+        return [tid for (tid,) in self._db.execute("SELECT ticket_id FROM tickets ORDER BY ticket_id")]
+
+    # ── Records ──
+
+    def _hydrate(self, ticket_id: str, body: str) -> dict:
+        ticket = json_loads(body)
+        self._masters[ticket_id] = ticket
+        self._bodies[ticket_id] = body
+        self._versions[ticket_id] = ticket.get("version", 0)
+        return ticket
+
+    def _evict(self, ticket_id: str) -> None:
+        super()._evict(ticket_id)
+        self._bodies.pop(ticket_id, None)
+
+    def expired_leases(self, now: datetime) -> list[str]:
+        """Claimed tickets whose lease ended before `now`, read via leases_by_expiry."""
+        cutoff = now.timestamp()
+        rows = self._db.execute(
+            "SELECT ticket_id, lease_expiry FROM leases WHERE lease_expiry < ? ORDER BY lease_expiry",
+            (now.astimezone(timezone.utc).isoformat(),),
+        )
+        return [tid for tid, expiry in rows if (lease_timestamp(expiry) or cutoff) < cutoff]
+
+    def query_rows(self) -> dict[str, list]:
+        """Query rows straight from the tickets table; there is no index file to keep."""
+        return {ticket["ticket_id"]: query_row(ticket) for ticket in self.tickets()}
+
+    def search_rows(self) -> dict[str, list]:
+        """Search rows straight from the tickets table; there is no index file to keep."""
+        return {ticket["ticket_id"]: search_row(ticket) for ticket in self.tickets()}
+
+    def load(self, ticket_id: str) -> Optional[dict]:
+        if ticket_id in self._masters:
+            return self._masters[ticket_id]
+        row = self._db.execute("SELECT body FROM tickets WHERE ticket_id = ?", (ticket_id,)).fetchone()
+        if row is None:
+            return None
+        return self._hydrate(ticket_id, row[0])
+
+    def tickets(self) -> list[dict]:
+        ids = self.ticket_ids()
+        if any(tid not in self._masters for tid in ids):
+            for tid, body in self._db.execute("SELECT ticket_id, body FROM tickets"):
+                if tid not in self._masters:
+                    self._hydrate(tid, body)
+        return [self._masters[tid] for tid in ids]
+
+    def state_copy(self, ticket_id: str, stage: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT body FROM states WHERE ticket_id = ? AND stage = ?", (ticket_id, stage)
+        ).fetchone()
+        if row is None:
+            return None
+        return json_loads(row[0]) if row[0] is not None else self.load(ticket_id)
+
+    # ── History ──
+
+    def history(self, ticket_id: str) -> list[dict]:
+        rows = self._db.execute("SELECT body FROM history WHERE ticket_id = ? ORDER BY seq", (ticket_id,))
+        return [json_loads(body) for (body,) in rows] + self._pending_history.get(ticket_id, [])
+
+    def _write_history(self, ticket_id: str, events: list[dict]) -> None:
+        if not events:
+            return
+        self._begin()
+        first = self._db.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM history WHERE ticket_id = ?", (ticket_id,)
+        ).fetchone()[0]
+        self._db.executemany(
+            "INSERT INTO history (ticket_id, seq, timestamp, event, body) VALUES (?, ?, ?, ?, ?)",
+            [
+                (ticket_id, seq, event.get("timestamp"), event.get("event"), json_dumps_compact(event))
+                for seq, event in enumerate(events, start=first)
+            ],
+        )
+
+    def set_history(self, ticket_id: str, events: list[dict]) -> None:
+        self._pending_history.pop(ticket_id, None)
+        self._begin()
+        self._db.execute("DELETE FROM history WHERE ticket_id = ?", (ticket_id,))
+        self._write_history(ticket_id, events)
+
+    def history_watermark(self) -> str:
+        """Changes whenever a history row or archive is added, replaced or removed (event_runs())."""
+        events = self._db.execute("SELECT COUNT(*), MAX(rowid), SUM(length(body)) FROM history").fetchone()
+        archives = self._db.execute("SELECT COUNT(*), SUM(length(events)) FROM history_archive").fetchone()
+        return "sqlite:" + ":".join(str(value or 0) for value in events + archives)
+
+    def archived_history(self, ticket_id: str) -> list[dict]:
+        row = self._db.execute("SELECT events FROM history_archive WHERE ticket_id = ?", (ticket_id,)).fetchone()
+        if row is None:
+            return []
+        return [json_loads(line) for line in gzip.decompress(row[0]).splitlines() if line.strip()]
+
+    def write_archive(self, ticket_id: str, events: list[dict]) -> None:
+        self._begin()
+        if not events:
+            self._db.execute("DELETE FROM history_archive WHERE ticket_id = ?", (ticket_id,))
+            return
+        data = "".join(json_dumps_compact(event) + "\n" for event in events).encode("utf-8")
+        self._db.execute(
+            "INSERT OR REPLACE INTO history_archive (ticket_id, events) VALUES (?, ?)",
+            (ticket_id, gzip.compress(data, mtime=0)),
+        )
+
+    # ── Writes ──
+
+    def save(self, ticket: dict, stage: Optional[str] = None, cas: bool = True) -> bool:
+        """
+        Upsert the ticket and, if given, add its `stage` location.
+
+        Queued history events (and a legacy inline "history" array) are
+        inserted as new rows. Changes bump the version; with cas=True the
+        stored version is checked first, inside the write transaction.
+        Returns True if anything was written.
+        """
+        tid = ticket["ticket_id"]
+        events = ticket.pop("history", []) + self._pending_history.pop(tid, [])
+        body = json_dumps_compact(ticket)
+        if tid not in self._bodies:
+            self.load(tid)
+        stored_body = self._bodies.get(tid)
+        written = bool(events)
+        if self._batch is not None:
+            self._batch.setdefault(tid, {})
+        self._begin()
+        if body != stored_body or events:
+            if cas:
+                row = self._db.execute("SELECT body FROM tickets WHERE ticket_id = ?", (tid,)).fetchone()
+                current = json_loads(row[0]).get("version", 0) if row else None
+                expected = self._versions.get(tid)
+                if expected is not None and current != expected:
+                    self._evict(tid)
+                    self.flush()  # nothing written for this ticket; keep earlier saves, release the lock
+                    raise TicketConflict(tid, f"changed concurrently (version {expected} → {current})")
+                ticket["version"] = (current or 0) + 1
+                body = json_dumps_compact(ticket)
+            self._db.execute(
+                "INSERT INTO tickets (ticket_id, body) VALUES (?, ?) "
+                "ON CONFLICT(ticket_id) DO UPDATE SET body = excluded.body",
+                (tid, body),
+            )
+            self._db.execute("DELETE FROM deps WHERE ticket_id = ?", (tid,))
+            self._db.executemany(
+                "INSERT OR IGNORE INTO deps (ticket_id, dependency) VALUES (?, ?)",
+                [(tid, dep) for dep in ticket.get("dependencies", [])],
+            )
+            if ticket.get("claimed_by"):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO leases (ticket_id, claimed_by, machine_id, operator, lease_expiry) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (tid, ticket["claimed_by"], ticket.get("machine_id"), ticket.get("operator"),
+                     ticket.get("lease_expiry")),
+                )
+            else:
+                self._db.execute("DELETE FROM leases WHERE ticket_id = ?", (tid,))
+            self._bodies[tid] = body
+            self._versions[tid] = ticket.get("version", 0)
+            self._query_postings = {}
+            self._search_postings = {}
+            written = True
+        self._write_history(tid, events)
+        self._masters[tid] = ticket
+        if stage is not None:
+            written |= self._put_state(tid, stage, None)
+        return written
+
+    def save_state_copy(self, ticket: dict, stage: str, text: Optional[str] = None) -> bool:
+        tid = ticket["ticket_id"]
+        master = self.load(tid)
+        if master is None:
+            raise KeyError(f"Ticket {tid} has no master record")
+        return self._put_state(tid, stage, None if ticket == master else json_dumps_compact(ticket))
+
+    def _put_state(self, ticket_id: str, stage: str, body: Optional[str]) -> bool:
+        self._begin()
+        cursor = self._db.execute(
+            "INSERT INTO states (ticket_id, stage, body) VALUES (?, ?, ?) "
+            "ON CONFLICT(ticket_id, stage) DO UPDATE SET body = excluded.body WHERE body IS NOT excluded.body",
+            (ticket_id, stage, body),
+        )
+        return cursor.rowcount > 0
+
+    def remove(self, ticket_id: str, stage: str) -> None:
+        if self._batch is not None:
+            self._batch.setdefault(ticket_id, {})
+        self._begin()
+        self._db.execute("DELETE FROM states WHERE ticket_id = ? AND stage = ?", (ticket_id, stage))
+
+    # ── Integrity ──
+
+    def integrity_report(self) -> dict:
+        """Database counterpart of integrity_report(); orphans are prevented by foreign keys."""
+        errors = []
+        masters = []
+        for ticket in self.tickets():
+            tid = ticket["ticket_id"]
+            locations = self.locations(tid)
+            if len(locations) > 1:
+                errors.append(f"DUPLICATE: {tid} found in {[stage for stage, _ in locations]}")
+            for stage, _ in locations:
+                copy = self.state_copy(tid, stage)
+                effective_stage = STAGE_TO_STATE_DIR.get(copy.get("stage", ""), copy.get("stage", ""))
+                if effective_stage != stage and copy.get("stage") != stage:
+                    errors.append(f"STAGE MISMATCH: {tid} stage={copy.get('stage')} but in dir {stage}")
+            required = ["ticket_id", "title", "type", "stage", "sdlc_flow",
+                        "created_at", "dependencies", "acceptance_criteria"]
+            for field in required:
+                if field not in ticket:
+                    errors.append(f"SCHEMA: {tid} missing required field: {field}")
+            masters.append({"ticket_id": tid, "dependencies": ticket.get("dependencies", [])})
+        graph = analyze_dependency_graph(masters)
+        errors.extend(dependency_graph_errors(graph))
+        return {"errors": errors, "graph": graph}
+
+
+def open_store(backend: str = "files", db_path: Optional[Path] = None) -> TicketStore:
+    """TicketStore for the --backend option."""
+    if backend == "sqlite":
+        return SqliteTicketStore(db_path or DB_FILE)
+    return TicketStore()
+
+
+def copy_tickets(source: TicketStore, target: TicketStore) -> dict:
+    """
+    Mirror every ticket and its stage locations from `source` into `target`.
+
+    Used for both directions between the directory layout and SQLite.
+    State copies are carried over as stored, including ones that differ
+    from their master, and each ticket's history is copied when it differs. State locations in `target` that `source` does not
+    have are removed; master records are never deleted. Returns
+    written/skipped/removed counts.
+    """
+    summary = {"written": 0, "skipped": 0, "removed": 0}
+    source_ids = set()
+    tickets = source.tickets()
+    target.tickets()  # load existing records so unchanged ones are skipped
+    for ticket in tickets:
+        tid = ticket["ticket_id"]
+        source_ids.add(tid)
+        stages = [stage for stage, _ in source.locations(tid)]
+        events = source.history(tid)
+        ticket = {k: v for k, v in ticket.items() if k != "history"}
+        written = target.save(ticket, cas=False)
+        if target.history(tid) != events:
+            target.set_history(tid, events)
+            written = True
+        archived = source.archived_history(tid)
+        if target.archived_history(tid) != archived:
+            target.write_archive(tid, archived)
+            written = True
+        for stage in stages:
+            copy = source.state_copy(tid, stage)
+            copy.pop("history", None)  # the history log above is authoritative
+            written |= target.save_state_copy(copy, stage)
+        for stage, _ in target.locations(tid):
+            if stage not in stages:
+                target.remove(tid, stage)
+                summary["removed"] += 1
+        summary["written" if written else "skipped"] += 1
+    for stage in STAGES:
+        for tid in target.stage_ids(stage) - source_ids:
+            target.remove(tid, stage)
+            summary["removed"] += 1
+    target.rebuild_dependents(tickets)
+    target.flush()
+    return summary
+
+
 # ─── Core Operations ─────────────────────────────────────────────────────────
 
 
@@ -164,6 +1867,7 @@ def create_ticket(
     created_by: str = "TODO",
     source_task_file: str | None = None,
     tags: list[str] | None = None,
+    store: Optional[TicketStore] = None,
 ) -> dict:
     """Create a new ticket JSON and save it to tickets/"""
     if ticket_type not in SDLC_FLOWS:
@@ -189,25 +1893,95 @@ def create_ticket(
         "operator": None,
         "lease_expiry": None,
         "lease_duration_minutes": DEFAULT_LEASE_MINUTES,
-        "history": [
-            {
-                "timestamp": now_iso(),
-                "event": "CREATED",
-                "agent": created_by,
-                "machine_id": "system",
-                "details": f"Ticket created from {source_task_file or 'manual'}"
-            }
-        ],
         "source_task_file": source_task_file,
         "tags": tags or [],
+        "version": 0,
     }
 
     # Save master copy
-    save_ticket(ticket, canonical_ticket_path(ticket_id))
+    own_store = store is None
+    store = store or TicketStore()
+    store.append_history(ticket_id, {
+        "timestamp": now_iso(),
+        "event": "CREATED",
+        "agent": created_by,
+        "machine_id": "system",
+        "details": f"Ticket created from {source_task_file or 'manual'}"
+    })
+    store.link_dependencies(ticket_id, [], ticket["dependencies"])
+    store.save(ticket)
+    if own_store:
+        store.flush()
     return ticket
 
 
-def sync_tickets() -> dict[str, list[str]]:
+def _move_to_ready(ticket: dict, store: TicketStore) -> bool:
+    """Place an unblocked ticket in READY. Returns True if anything was written."""
+    ticket["stage"] = "READY"
+    store.append_history(ticket["ticket_id"], {
+        "timestamp": now_iso(),
+        "event": "MOVED_TO_READY",
+        "agent": "tickets.py",
+        "machine_id": "system",
+        "details": "Dependencies resolved, moved to READY"
+    })
+    return store.save(ticket, "READY")
+
+
+def _move_to_blocked(ticket: dict, store: TicketStore) -> bool:
+    """Take an unclaimed READY ticket whose dependencies are unmet back out of READY. Returns True if written."""
+    ticket["stage"] = "BLOCKED"
+    store.append_history(ticket["ticket_id"], {
+        "timestamp": now_iso(),
+        "event": "MOVED_TO_BLOCKED",
+        "agent": "tickets.py",
+        "machine_id": "system",
+        "details": f"Unmet dependencies {ticket['blocked_by']}, removed from READY"
+    })
+    store.remove(ticket["ticket_id"], "READY")
+    store.save(ticket)
+    return True
+
+
+def _resolve_dependencies(ticket: dict, store: TicketStore, done_ids: set[str], actions: dict) -> bool:
+    """
+    Recompute blocked_by for one ticket and move it to READY once unblocked.
+
+    A ticket that gains unmet dependencies after it left BLOCKED is taken
+    back out of READY if nobody claimed it yet; one already claimed or in
+    a working stage keeps its stage. Both are listed under
+    actions["newly_blocked"]. Records the other outcomes under
+    actions["moved_to_ready"] / ["still_blocked"].
+    Returns True if anything was written.
+    """
+    tid = ticket["ticket_id"]
+    unresolved = [dep for dep in ticket.get("dependencies", []) if dep not in done_ids]
+    ticket["blocked_by"] = unresolved
+
+    if not unresolved:
+        # Ticket is unblocked
+        if store.locate(tid) is None:
+            # Not in any state dir yet — move to READY
+            actions["moved_to_ready"].append(tid)
+            return _move_to_ready(ticket, store)
+        # Already in READY or progressing, just update master
+        return store.save(ticket)
+
+    # Still blocked
+    actions["still_blocked"].append(f"{tid} blocked by: {unresolved}")
+    current = store.locate(tid)
+    if current is None:
+        ticket["stage"] = "BLOCKED"
+        return store.save(ticket)
+    if current[0] == "READY" and not ticket.get("claimed_by"):
+        actions["newly_blocked"].append(f"{tid}: moved out of READY")
+        return _move_to_blocked(ticket, store)
+    # Work is under way; keep the stage its state file holds
+    actions["newly_blocked"].append(f"{tid}: kept in {current[0]}")
+    return store.save(ticket)
+
+
+def sync_tickets(store: Optional[TicketStore] = None) -> dict:
     """
     Evaluate all tickets:
     1. Check dependency resolution
@@ -215,72 +1989,53 @@ def sync_tickets() -> dict[str, list[str]]:
     3. Ensure no duplicate state (ticket in multiple stage dirs)
     4. Validate integrity
 
-    Returns summary of actions taken.
+    Only tickets whose content actually changed are rewritten.
+
+    Returns summary of actions taken, plus written/skipped counts.
     """
-    actions: dict[str, list[str]] = {
+    actions: dict = {
         "moved_to_ready": [],
         "still_blocked": [],
+        "newly_blocked": [],
         "errors": [],
         "duplicates_fixed": [],
+        "summary": {"written": 0, "skipped": 0},
     }
 
-    done_ids = get_done_ticket_ids()
-    all_tix = all_tickets()
+    store = store or TicketStore()
+    done_ids = store.done_ids()
 
-    for ticket in all_tix:
+    for ticket in store.tickets():
         tid = ticket["ticket_id"]
+        written = False
 
         # 1. Check for duplicates (ticket in multiple state dirs)
-        locations = []
-        for stage in STAGES:
-            p = STATE_DIR / stage / f"{tid}.json"
-            if p.exists():
-                locations.append((stage, p))
+        locations = store.locations(tid)
 
         if len(locations) > 1:
             # Keep only the most advanced stage
             stage_order = {s: i for i, s in enumerate(STAGES)}
             locations.sort(key=lambda x: stage_order.get(x[0], 0), reverse=True)
             keep = locations[0]
-            for stage, path in locations[1:]:
-                path.unlink()
+            for stage, _ in locations[1:]:
+                store.remove(tid, stage)
+                written = True
                 actions["duplicates_fixed"].append(f"{tid}: removed from {stage}, kept in {keep[0]}")
 
         # 2. Resolve dependencies
-        unresolved = [dep for dep in ticket.get("dependencies", []) if dep not in done_ids]
-        ticket["blocked_by"] = unresolved
-
-        if not unresolved:
-            # Ticket is unblocked
-            current = find_ticket_in_states(tid)
-
-            if current is None:
-                # Not in any state dir yet — move to READY
-                ticket["stage"] = "READY"
-                ticket["history"].append({
-                    "timestamp": now_iso(),
-                    "event": "MOVED_TO_READY",
-                    "agent": "tickets.py",
-                    "machine_id": "system",
-                    "details": "Dependencies resolved, moved to READY"
-                })
-                save_ticket(ticket, ticket_path_in_state(tid, "READY"))
-                save_ticket(ticket, canonical_ticket_path(tid))
-                actions["moved_to_ready"].append(tid)
+        try:
+            written |= _resolve_dependencies(ticket, store, done_ids, actions)
+        except TicketConflict as e:
+            # Another process wrote the ticket meanwhile; the next sync sees its version
+            actions["errors"].append(f"CONFLICT: {e}")
 
-            elif current[0] == "READY":
-                # Already in READY, just update master
-                save_ticket(ticket, canonical_ticket_path(tid))
+        actions["summary"]["written" if written else "skipped"] += 1
 
-            else:
-                # Already progressing, just update master
-                save_ticket(ticket, canonical_ticket_path(tid))
-        else:
-            # Still blocked
-            ticket["stage"] = "BLOCKED"
-            save_ticket(ticket, canonical_ticket_path(tid))
-            actions["still_blocked"].append(f"{tid} blocked by: {unresolved}")
+    # 4. Dependency graph diagnostics (cycles keep tickets BLOCKED forever)
+    actions["errors"].extend(dependency_graph_errors(analyze_dependency_graph(store.tickets())))
 
+    store.rebuild_dependents(store.tickets())
+    store.flush()
     return actions
 
 
@@ -290,6 +2045,7 @@ def claim_ticket(
     machine_id: str,
     operator: str,
     lease_minutes: int = DEFAULT_LEASE_MINUTES,
+    store: Optional[TicketStore] = None,
 ) -> tuple[bool, str]:
     """
     Attempt to claim a ticket for processing.
@@ -298,18 +2054,20 @@ def claim_ticket(
     Returns (success, message).
     """
     # Load master ticket
-    master_path = canonical_ticket_path(ticket_id)
-    if not master_path.exists():
+    store = store or TicketStore()
+    try:
+        ticket = store.load(ticket_id)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if ticket is None:
         return False, f"Ticket {ticket_id} does not exist"
 
-    ticket = load_ticket(master_path)
-
     # Find current state
-    current = find_ticket_in_states(ticket_id)
+    current = store.locate(ticket_id)
     if current is None:
         return False, f"Ticket {ticket_id} not in any state directory"
 
-    current_stage, current_path = current
+    current_stage, _ = current
 
     # Determine expected stage for this agent
     sdlc = ticket.get("sdlc_flow", [])
@@ -355,7 +2113,7 @@ def claim_ticket(
     ticket["operator"] = operator
     ticket["lease_expiry"] = lease_expiry.isoformat()
 
-    ticket["history"].append({
+    store.append_history(ticket_id, {
         "timestamp": now_iso(),
         "event": "CLAIMED",
         "agent": agent,
@@ -365,21 +2123,30 @@ def claim_ticket(
         "details": f"Claimed by {operator}@{machine_id} via {agent}, lease until {lease_expiry.isoformat()}"
     })
 
-    # Save updated ticket in current state dir + master
-    save_ticket(ticket, current_path)
-    save_ticket(ticket, canonical_ticket_path(ticket_id))
+    # Save updated ticket in current state dir + master (fails if another claim won)
+    try:
+        store.save(ticket, current_stage)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    store.flush()
 
     return True, f"Claimed {ticket_id} for {agent} on {machine_id} (operator: {operator})"
 
 
-def release_claim(ticket_id: str, reason: str = "manual release") -> tuple[bool, str]:
+def release_claim(
+    ticket_id: str,
+    reason: str = "manual release",
+    store: Optional[TicketStore] = None,
+) -> tuple[bool, str]:
     """Release a claim on a ticket (for expired leases or manual intervention)."""
-    master_path = canonical_ticket_path(ticket_id)
-    if not master_path.exists():
+    store = store or TicketStore()
+    try:
+        ticket = store.load(ticket_id)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if ticket is None:
         return False, f"Ticket {ticket_id} does not exist"
 
-    ticket = load_ticket(master_path)
-
     if not ticket.get("claimed_by"):
         return False, f"Ticket {ticket_id} is not claimed"
 
@@ -389,7 +2156,7 @@ def release_claim(ticket_id: str, reason: str = "manual release") -> tuple[bool,
     ticket["operator"] = None
     ticket["lease_expiry"] = None
 
-    ticket["history"].append({
+    store.append_history(ticket_id, {
         "timestamp": now_iso(),
         "event": "CLAIM_RELEASED",
         "agent": "tickets.py",
@@ -398,34 +2165,89 @@ def release_claim(ticket_id: str, reason: str = "manual release") -> tuple[bool,
     })
 
     # Update in state dir
-    current = find_ticket_in_states(ticket_id)
-    if current:
-        save_ticket(ticket, current[1])
-    save_ticket(ticket, canonical_ticket_path(ticket_id))
+    current = store.locate(ticket_id)
+    try:
+        store.save(ticket, current[0] if current else None)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    store.flush()
 
     return True, f"Released claim on {ticket_id} (was: {old_claimer})"
 
 
-def advance_ticket(ticket_id: str, agent: str, machine_id: str = "system") -> tuple[bool, str]:
+def renew_lease(
+    ticket_id: str,
+    lease_minutes: int = DEFAULT_LEASE_MINUTES,
+    store: Optional[TicketStore] = None,
+) -> tuple[bool, str]:
+    """Extend an active claim's lease from now; only lease_expiry changes."""
+    store = store or TicketStore()
+    try:
+        ticket = store.load(ticket_id)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if ticket is None:
+        return False, f"Ticket {ticket_id} does not exist"
+
+    if not ticket.get("claimed_by"):
+        return False, f"Ticket {ticket_id} is not claimed"
+    if not lease_active(ticket):
+        return False, f"Lease on {ticket_id} expired at {ticket.get('lease_expiry')}; claim it again"
+
+    lease_expiry = datetime.now(timezone.utc) + timedelta(minutes=lease_minutes)
+    ticket["lease_expiry"] = lease_expiry.isoformat()
+
+    store.append_history(ticket_id, {
+        "timestamp": now_iso(),
+        "event": "LEASE_RENEWED",
+        "agent": ticket["claimed_by"],
+        "machine_id": ticket.get("machine_id") or "system",
+        "details": f"Lease extended until {lease_expiry.isoformat()}"
+    })
+
+    current = store.locate(ticket_id)
+    try:
+        store.save(ticket, current[0] if current else None)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    store.flush()
+
+    return True, f"Renewed lease on {ticket_id} for {ticket['claimed_by']} until {lease_expiry.isoformat()}"
+
+
+def advance_ticket(
+    ticket_id: str,
+    agent: str,
+    machine_id: str = "system",
+    store: Optional[TicketStore] = None,
+    unblock: bool = False,
+) -> tuple[bool, str]:
     """
     Move a ticket to the next stage in its SDLC flow.
     Called after successful work commit (commit 2).
 
+    With unblock=True, a ticket reaching DONE re-evaluates only its own
+    dependents (via the reverse dependency index) and moves the ones that
+    became unblocked to READY in the same operation.
+
     Returns (success, message).
     """
-    master_path = canonical_ticket_path(ticket_id)
-    if not master_path.exists():
+    store = store or TicketStore()
+    try:
+        ticket = store.load(ticket_id)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if ticket is None:
         return False, f"Ticket {ticket_id} does not exist"
 
-    ticket = load_ticket(master_path)
     sdlc = ticket.get("sdlc_flow", [])
 
     # Find current location
-    current = find_ticket_in_states(ticket_id)
+    current = store.locate(ticket_id)
     if current is None:
         return False, f"Ticket {ticket_id} not in any state directory"
 
-    current_stage, current_path = current
+    current_stage, _ = current
 
     # Find position in SDLC flow
     current_idx = None
@@ -444,9 +2266,6 @@ def advance_ticket(ticket_id: str, agent: str, machine_id: str = "system") -> tu
     next_sdlc_stage = sdlc[current_idx + 1]
     next_dir_stage = STAGE_TO_STATE_DIR.get(next_sdlc_stage, next_sdlc_stage)
 
-    # Move ticket file
-    next_path = STATE_DIR / next_dir_stage / f"{ticket_id}.json"
-
     # Clear claim
     ticket["claimed_by"] = None
     ticket["machine_id"] = None
@@ -454,7 +2273,7 @@ def advance_ticket(ticket_id: str, agent: str, machine_id: str = "system") -> tu
     ticket["lease_expiry"] = None
     ticket["stage"] = next_sdlc_stage
 
-    ticket["history"].append({
+    store.append_history(ticket_id, {
         "timestamp": now_iso(),
         "event": "STAGE_COMPLETED",
         "agent": agent,
@@ -464,23 +2283,120 @@ def advance_ticket(ticket_id: str, agent: str, machine_id: str = "system") -> tu
         "details": f"Advanced from {current_stage} to {next_dir_stage}"
     })
 
-    # Remove from old location, save to new
-    if current_path.exists():
-        current_path.unlink()
-    save_ticket(ticket, next_path)
-    save_ticket(ticket, canonical_ticket_path(ticket_id))
+    # Save to new location, then remove from old (nothing moves if the save conflicts)
+    try:
+        store.save(ticket, next_sdlc_stage)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    store.remove(ticket_id, current_stage)
+
+    message = f"Advanced {ticket_id}: {current_stage} → {next_dir_stage}"
+    if unblock and next_sdlc_stage == "DONE":
+        unblocked = unblock_dependents(ticket_id, store)
+        if unblocked:
+            message += f"; moved to READY: {', '.join(unblocked)}"
+    store.flush()
+
+    return True, message
+
+
+def unblock_dependents(ticket_id: str, store: Optional[TicketStore] = None) -> list[str]:
+    """
+    Re-evaluate the dependents of a ticket that just reached DONE.
+
+    Costs O(out-degree) instead of a full sync. Returns the IDs moved to READY.
+    """
+    store = store or TicketStore()
+    moved = []
+    for dep_id in store.dependents(ticket_id):
+        ticket = store.load(dep_id)
+        if ticket is None or ticket_id not in ticket.get("dependencies", []):
+            continue
+        unresolved = [dep for dep in ticket["dependencies"] if not store.is_done(dep)]
+        ticket["blocked_by"] = unresolved
+        try:
+            if not unresolved and store.locate(dep_id) is None:
+                _move_to_ready(ticket, store)
+                moved.append(dep_id)
+            else:
+                store.save(ticket)
+        except TicketConflict:
+            continue  # changed elsewhere; the next sync re-evaluates it
+    store.flush()
+    return moved
+
+
+def lease_active(ticket: dict, now: Optional[datetime] = None) -> bool:
+    """Whether the ticket holds a claim whose lease has not yet expired."""
+    if not ticket.get("claimed_by") or not ticket.get("lease_expiry"):
+        return False
+    try:
+        return datetime.fromisoformat(ticket["lease_expiry"]) > (now or datetime.now(timezone.utc))
+    except (ValueError, TypeError):
+        return False
+
+
+def next_ticket(agent: str, store: Optional[TicketStore] = None) -> Optional[dict]:
+    """
+    Pick the best claimable ticket for an agent.
+
+    Candidates are unclaimed (or lease-expired) tickets waiting in the
+    agent's stage directory, plus READY tickets whose first SDLC stage is
+    the agent's stage. They are ranked by priority, then by the longest
+    downstream dependency chain, then by ticket ID.
+
+    Returns a copy of the ticket with its located stage and a "downstream"
+    count, or None.
+    """
+    store = store or TicketStore()
+    stage = AGENT_TO_STAGE.get(agent) or (agent.upper() if agent.upper() in STAGE_TO_AGENT else None)
+    if stage is None:
+        raise ValueError(f"Unknown agent: {agent}. Valid: {list(AGENT_TO_STAGE.keys())}")
+
+    downstream = store.downstream()
+    now = datetime.now(timezone.utc)
+    best: Optional[tuple] = None
+    for tid in store.stage_ids(stage) | store.stage_ids("READY"):
+        ticket = store.load(tid)
+        if ticket is None or lease_active(ticket, now):
+            continue
+        sdlc = ticket.get("sdlc_flow", [])
+        current = store.locate(tid)
+        if current is None:
+            continue
+        if current[0] == "READY":
+            if len(sdlc) < 2 or sdlc[1] != stage:
+                continue
+        elif current[0] != stage or stage not in sdlc:
+            continue
+        rank = (PRIORITY_ORDER.get(ticket.get("priority", "medium"), 9), -downstream.get(tid, 0), tid)
+        if best is None or rank < best[0]:
+            best = (rank, ticket, current[0])
 
-    return True, f"Advanced {ticket_id}: {current_stage} → {next_dir_stage}"
+    store.flush()
+    if best is None:
+        return None
+    _, ticket, located = best
+    # State directory is the source of truth for the current stage
+    return {**ticket, "stage": located, "downstream": downstream.get(ticket["ticket_id"], 0)}
 
 
-def rework_ticket(ticket_id: str, agent: str, reason: str, machine_id: str = "system") -> tuple[bool, str]:
+def rework_ticket(
+    ticket_id: str,
+    agent: str,
+    reason: str,
+    machine_id: str = "system",
+    store: Optional[TicketStore] = None,
+) -> tuple[bool, str]:
     """Send a ticket back to its implementation stage (rework)."""
-    master_path = canonical_ticket_path(ticket_id)
-    if not master_path.exists():
+    store = store or TicketStore()
+    try:
+        ticket = store.load(ticket_id)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if ticket is None:
         return False, f"Ticket {ticket_id} does not exist"
 
-    ticket = load_ticket(master_path)
-
     if ticket["rework_count"] >= 3:
         return False, f"Ticket {ticket_id} exceeded max rework count (3). Must escalate."
 
@@ -491,10 +2407,7 @@ def rework_ticket(ticket_id: str, agent: str, reason: str, machine_id: str = "sy
     impl_stage = sdlc[1] if len(sdlc) > 1 else "READY"
     impl_dir = STAGE_TO_STATE_DIR.get(impl_stage, impl_stage)
 
-    # Remove from current location
-    current = find_ticket_in_states(ticket_id)
-    if current:
-        current[1].unlink()
+    current = store.locate(ticket_id)
 
     # Clear claim and move back
     ticket["claimed_by"] = None
@@ -503,7 +2416,7 @@ def rework_ticket(ticket_id: str, agent: str, reason: str, machine_id: str = "sy
     ticket["lease_expiry"] = None
     ticket["stage"] = impl_stage
 
-    ticket["history"].append({
+    store.append_history(ticket_id, {
         "timestamp": now_iso(),
         "event": "REWORK",
         "agent": agent,
@@ -513,17 +2426,217 @@ def rework_ticket(ticket_id: str, agent: str, reason: str, machine_id: str = "sy
         "details": f"Rework #{ticket['rework_count']}: {reason}"
     })
 
-    rework_path = STATE_DIR / impl_dir / f"{ticket_id}.json"
-    save_ticket(ticket, rework_path)
-    save_ticket(ticket, canonical_ticket_path(ticket_id))
+    # Save to the implementation stage, then remove from the current location
+    try:
+        store.save(ticket, impl_stage)
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    if current and current[0] != impl_stage:
+        store.remove(ticket_id, current[0])
+    store.flush()
 
     return True, f"Rework #{ticket['rework_count']} for {ticket_id}: sent back to {impl_dir}"
 
 
+# ─── History Compaction ──────────────────────────────────────────────────────
+
+
+def summarize_history(events: list[dict]) -> dict:
+    """Counts per event type, first/last timestamps and rework reasons."""
+    counts: dict[str, int] = {}
+    for event in events:
+        counts[event.get("event", "UNKNOWN")] = counts.get(event.get("event", "UNKNOWN"), 0) + 1
+    timestamps = sorted(event["timestamp"] for event in events if event.get("timestamp"))
+    return {
+        "events": len(events),
+        "counts": dict(sorted(counts.items())),
+        "first_timestamp": timestamps[0] if timestamps else None,
+        "last_timestamp": timestamps[-1] if timestamps else None,
+        "rework_reasons": [
+            event.get("details", "") for event in events if event.get("event") == "REWORK"
+        ],
+    }
+
+
+def compact_history(store: Optional[TicketStore] = None, keep: int = COMPACT_KEEP_EVENTS) -> dict:
+    """
+    Fold old history events into a single COMPACTED summary event.
+
+    DONE tickets are folded completely; other tickets keep their `keep`
+    most recent events raw. Folded events go to the ticket's compressed
+    archive (merged with any earlier one) and come back with
+    restore_history(). Legacy inline history arrays are migrated out of
+    the ticket JSON on the way; a ticket another process writes meanwhile
+    is reported and left for the next run.
+
+    Returns {"compacted": [ticket ids], "events": folded event count,
+    "errors": [...]}.
+    """
+    store = store or TicketStore()
+    result: dict = {"compacted": [], "events": 0, "errors": []}
+    for ticket in store.tickets():
+        tid = ticket["ticket_id"]
+        if "history" in ticket:
+            try:
+                store.save(ticket)
+            except TicketConflict as e:
+                result["errors"].append(f"CONFLICT: {e}")
+                continue
+        try:
+            # save() appends events under the same lock: none lands between the read and the rewrite
+            with store._ticket_lock(tid):
+                events = store.history(tid)
+                split = len(events) if store.is_done(tid) else max(0, len(events) - keep)
+                head, tail = events[:split], events[split:]
+                previous = head[:1] if head and head[0].get("event") == "COMPACTED" else []
+                fresh = head[len(previous):]
+                if not fresh:
+                    continue
+                raw = (store.archived_history(tid) if previous else []) + fresh
+                summary = summarize_history(raw)
+                store.write_archive(tid, raw)
+                store.set_history(tid, [{
+                    "timestamp": summary["last_timestamp"] or now_iso(),
+                    "event": "COMPACTED",
+                    "agent": "tickets.py",
+                    "machine_id": "system",
+                    "details": f"{summary['events']} event(s) archived in {store.archive_path(tid).name}",
+                    "summary": summary,
+                }] + tail)
+        except TicketConflict as e:
+            result["errors"].append(f"CONFLICT: {e}")
+            continue
+        result["compacted"].append(tid)
+        result["events"] += len(fresh)
+    store.flush()
+    return result
+
+
+def restore_history(ticket_id: str, store: Optional[TicketStore] = None) -> tuple[bool, str]:
+    """Put archived raw events back in place of the COMPACTED summary."""
+    store = store or TicketStore()
+    if not store.exists(ticket_id):
+        return False, f"Ticket {ticket_id} does not exist"
+    try:
+        with store._ticket_lock(ticket_id):
+            archived = store.archived_history(ticket_id)
+            if not archived:
+                return False, f"Ticket {ticket_id} has no archived history"
+            events = store.history(ticket_id)
+            if events and events[0].get("event") == "COMPACTED":
+                events = events[1:]
+            store.set_history(ticket_id, archived + events)
+            store.write_archive(ticket_id, [])
+    except TicketConflict as e:
+        return False, f"CONFLICT: {e}"
+    store.flush()
+    return True, f"Restored {len(archived)} archived event(s) for {ticket_id}"
+
+
+# ─── Batch Mode ───────────────────────────────────────────────────────────────
+
+# Required fields per --batch operation
+BATCH_OPS = {
+    "claim": ("ticket_id", "agent", "machine_id", "operator"),
+    "release": ("ticket_id",),
+    "renew": ("ticket_id",),
+    "advance": ("ticket_id", "agent"),
+    "rework": ("ticket_id", "agent", "reason"),
+    "next": ("agent",),
+}
+
+
+def run_batch_op(op: dict, store: TicketStore) -> dict:
+    """Apply one --batch operation and return its result record."""
+    name = op.get("op")
+    result: dict = {"op": name}
+    if "id" in op:
+        result["id"] = op["id"]  # caller's correlation id, echoed back
+    if "ticket_id" in op:
+        result["ticket_id"] = op["ticket_id"]
+    if name not in BATCH_OPS:
+        return {**result, "ok": False, "message": f"Unknown op {name!r}. Valid: {list(BATCH_OPS)}"}
+    missing = [field for field in BATCH_OPS[name] if not op.get(field)]
+    if missing:
+        return {**result, "ok": False, "message": f"Missing field(s): {', '.join(missing)}"}
+
+    try:
+        if name == "claim":
+            ok, msg = claim_ticket(
+                op["ticket_id"], op["agent"], op["machine_id"], op["operator"],
+                lease_minutes=int(op.get("lease_minutes", DEFAULT_LEASE_MINUTES)), store=store,
+            )
+        elif name == "release":
+            ok, msg = release_claim(op["ticket_id"], reason=op.get("reason", "manual release"), store=store)
+        elif name == "renew":
+            ok, msg = renew_lease(
+                op["ticket_id"], lease_minutes=int(op.get("lease_minutes", DEFAULT_LEASE_MINUTES)), store=store,
+            )
+        elif name == "advance":
+            ok, msg = advance_ticket(
+                op["ticket_id"], op["agent"], machine_id=op.get("machine_id", "system"),
+                store=store, unblock=bool(op.get("unblock")),
+            )
+        elif name == "rework":
+            ok, msg = rework_ticket(
+                op["ticket_id"], op["agent"], op["reason"], machine_id=op.get("machine_id", "system"), store=store,
+            )
+        else:
+            # An empty queue is an answer, not a failure (as with --next): ticket_id is null
+            ticket = next_ticket(op["agent"], store)
+            ok = True
+            msg = f"Next for {op['agent']}: {ticket['ticket_id']}" if ticket else f"No claimable tickets for {op['agent']}"
+            result["ticket_id"] = ticket["ticket_id"] if ticket else None
+    except TicketConflict as e:
+        ok, msg = False, f"CONFLICT: {e}"
+    except (ValueError, TypeError) as e:
+        ok, msg = False, str(e)
+    if msg.startswith("CONFLICT"):
+        result["conflict"] = True
+    return {**result, "ok": ok, "message": msg}
+
+
+def run_batch(lines: Iterable[str], out: TextIO, store: Optional[TicketStore] = None) -> dict:
+    """
+    Apply NDJSON operations in order against one store, streaming one
+    NDJSON result per operation to `out`.
+
+    Writes are deferred until every operation has run, so each touched
+    ticket file is written once (one transaction on the SQLite backend).
+    Tickets changed by another process meanwhile are not written and are
+    listed under "conflicts". Returns {"ops", "failed", "written",
+    "conflicts"}.
+    """
+    store = store or TicketStore()
+    summary: dict = {"ops": 0, "failed": 0, "written": 0, "conflicts": []}
+    store.begin_batch()
+    try:
+        for lineno, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            summary["ops"] += 1
+            try:
+                op = json.loads(line)
+            except ValueError as e:
+                result = {"ok": False, "message": f"Invalid JSON: {e}"}
+            else:
+                if isinstance(op, dict):
+                    result = run_batch_op(op, store)
+                else:
+                    result = {"ok": False, "message": "Operation must be a JSON object"}
+            if not result["ok"]:
+                summary["failed"] += 1
+            out.write(json.dumps({"line": lineno, **result}) + "\n")
+            out.flush()
+    finally:
+        summary.update(store.end_batch())
+    return summary
+
+
 # ─── L3 Markdown Parser ──────────────────────────────────────────────────────
 
 
-def parse_l3_tasks(l3_dir: str, created_by: str = "TODO") -> list[dict]:
+def parse_l3_tasks(l3_dir: str, created_by: str = "TODO", store: Optional[TicketStore] = None) -> list[dict]:
     """
     Parse L3 decomposed markdown task files into ticket JSON.
 
@@ -544,93 +2657,491 @@ def parse_l3_tasks(l3_dir: str, created_by: str = "TODO") -> list[dict]:
     - [ ] Criterion 1
     - [ ] Criterion 2
     ```
+
+    Parsed tasks are cached per file in ticket-state/.parse-cache.json,
+    keyed by path and content hash: files whose size and mtime (or, failing
+    that, content hash) are unchanged are not parsed again, and produce no
+    output unless one of their tickets has since disappeared. Changed
+    files are parsed on a process pool; tickets are still created in
+    sorted file order.
     """
     l3_path = Path(l3_dir)
     if not l3_path.exists():
         print(f"ERROR: L3 directory not found: {l3_dir}", file=sys.stderr)
         return []
 
-    created = []
-    md_files = sorted(l3_path.glob("**/*.md"))
-
-    for md_file in md_files:
-        content = md_file.read_text(encoding="utf-8")
-        tickets = _parse_single_l3_file(content, str(md_file), created_by)
-        created.extend(tickets)
+    store = store or TicketStore()
+    md_files, entries, changed = _scan_l3_dir(l3_path, store)
 
+    existing = set(store.ticket_ids())
+    created = []
+    unchanged_files = 0
+    for i, (md_file, entry) in enumerate(zip(md_files, entries)):
+        tasks = entry["tasks"]
+        if i not in changed:
+            tasks = [task for task in tasks if task["ticket_id"] not in existing]
+            if not tasks:
+                unchanged_files += 1
+                continue
+        created.extend(_create_l3_tickets(tasks, str(md_file), created_by, store, existing))
+
+    store.flush()
+    if unchanged_files:
+        print(f"  UNCHANGED: {unchanged_files} file(s) skipped (already parsed)")
     return created
 
 
-def _parse_single_l3_file(content: str, source_path: str, created_by: str) -> list[dict]:
-    """Parse a single L3 markdown file that may contain multiple tasks."""
-    tickets = []
+# Ticket fields an L3 edit may change (keys are shared with parse_l3_file() tasks)
+UPSERT_FIELDS = ("title", "description", "dependencies", "file_paths", "tags", "acceptance_criteria")
 
-    # Split on H1 task headers
-    task_blocks = re.split(r'^# (TASK-[A-Z0-9-]+):\s*(.+)$', content, flags=re.MULTILINE)
-
-    # task_blocks[0] is preamble text, then groups of (id, title, body)
-    i = 1
-    while i < len(task_blocks) - 2:
-        task_id = task_blocks[i].strip()
-        title = task_blocks[i + 1].strip()
-        body = task_blocks[i + 2] if i + 2 < len(task_blocks) else ""
-        i += 3
-
-        # Parse metadata
-        ticket_type = _extract_field(body, "Type", "backend")
-        priority = _extract_field(body, "Priority", "medium")
-        deps_str = _extract_field(body, "Dependencies", "")
-        files_str = _extract_field(body, "Files", "")
-        tags_str = _extract_field(body, "Tags", "")
-
-        dependencies = [d.strip() for d in deps_str.split(",") if d.strip()] if deps_str else []
-        file_paths = [f.strip() for f in files_str.split(",") if f.strip()] if files_str else []
-        tags = [t.strip() for t in tags_str.split(",") if t.strip()] if tags_str else []
-
-        # Parse description
-        desc_match = re.search(r'## Description\s*\n(.*?)(?=\n## |\Z)', body, re.DOTALL)
-        description = desc_match.group(1).strip() if desc_match else title
-
-        # Parse acceptance criteria
-        criteria = re.findall(r'- \[[ x]\] (.+)', body)
-        if not criteria:
-            criteria = ["Implementation complete"]
 
-        # Check if ticket already exists
-        existing = canonical_ticket_path(task_id)
-        if existing.exists():
-            print(f"  SKIP: {task_id} already exists")
+def upsert_l3_tasks(l3_dir: str, created_by: str = "TODO", store: Optional[TicketStore] = None) -> dict:
+    """
+    Parse L3 tasks like parse_l3_tasks(), and also apply edits to existing tickets.
+
+    Each task that already has a ticket is compared on UPSERT_FIELDS. A
+    changed ticket is written once, with a single UPDATED history event
+    whose "changes" map holds {field: {"from": old, "to": new}}; history,
+    stage and claim are kept. Tasks are taken from the parse cache, so
+    only changed files are parsed, but every task is diffed (an edit seen
+    by a plain --parse is still applied). Dependencies are re-evaluated
+    only for created tickets and tickets whose dependencies changed.
+
+    All writes go through one store batch. Returns {"created": [ids],
+    "updated": {id: [fields]}, "moved_to_ready", "still_blocked",
+    "newly_blocked", "errors"} (see _resolve_dependencies()).
+    """
+    result: dict = {
+        "created": [], "updated": {}, "moved_to_ready": [], "still_blocked": [], "newly_blocked": [], "errors": [],
+    }
+    l3_path = Path(l3_dir)
+    if not l3_path.exists():
+        print(f"ERROR: L3 directory not found: {l3_dir}", file=sys.stderr)
+        return result
+
+    store = store or TicketStore()
+    md_files, entries, changed = _scan_l3_dir(l3_path, store)
+
+    existing = set(store.ticket_ids())
+    seen: set[str] = set()
+    reevaluate: list[str] = []
+    store.begin_batch()
+    try:
+        for i, (md_file, entry) in enumerate(zip(md_files, entries)):
+            for task in entry["tasks"]:
+                tid = task["ticket_id"]
+                if tid in seen:
+                    print(f"  SKIP: {tid} is defined more than once; keeping the first")
+                    continue
+                seen.add(tid)
+                if tid not in existing:
+                    for ticket in _create_l3_tickets([task], str(md_file), created_by, store, existing):
+                        result["created"].append(ticket["ticket_id"])
+                        reevaluate.append(ticket["ticket_id"])
+                    continue
+                changes = _update_l3_ticket(task, str(md_file), created_by, store)
+                if changes:
+                    result["updated"][tid] = list(changes)
+                    print(f"  UPDATED: {tid} — {', '.join(changes)}")
+                    if "dependencies" in changes:
+                        reevaluate.append(tid)
+                elif i in changed:
+                    print(f"  SKIP: {tid} unchanged")
+
+        done_ids = store.done_ids()
+        for tid in reevaluate:
+            _resolve_dependencies(store.load(tid), store, done_ids, result)
+    finally:
+        conflicts = store.end_batch()["conflicts"]
+    result["errors"].extend(f"CONFLICT: {tid} changed concurrently; not updated" for tid in conflicts)
+    return result
+
+
+def _update_l3_ticket(task: dict, source_path: str, agent: str, store: TicketStore) -> dict[str, dict]:
+    """Apply a parsed task's UPSERT_FIELDS to its ticket. Returns {field: {"from", "to"}} (empty if unchanged)."""
+    ticket = store.load(task["ticket_id"])
+    changes = {
+        field: {"from": ticket.get(field), "to": task[field]}
+        for field in UPSERT_FIELDS
+        if ticket.get(field) != task[field]
+    }
+    if not changes:
+        return changes
+
+    if "dependencies" in changes:
+        store.link_dependencies(ticket["ticket_id"], ticket.get("dependencies", []), task["dependencies"])
+    for field in changes:
+        ticket[field] = task[field]
+    store.append_history(ticket["ticket_id"], {
+        "timestamp": now_iso(),
+        "event": "UPDATED",
+        "agent": agent,
+        "machine_id": "system",
+        "details": f"Updated from {source_path}: {', '.join(changes)}",
+        "changes": changes,
+    })
+    current = store.locate(ticket["ticket_id"])
+    store.save(ticket, current[0] if current else None)
+    return changes
+
+
+def _scan_l3_dir(l3_path: Path, store: TicketStore) -> tuple[list[Path], list[dict], set[int]]:
+    """
+    Parsed tasks of every L3 file under `l3_path`, in sorted file order.
+
+    Returns (files, cache entries with "tasks", indexes of files parsed
+    this time) and rewrites the parse cache.
+    """
+    cache_path = store.state_dir / PARSE_CACHE_FILE
+    cache = _load_parse_cache(cache_path)
+    md_files = sorted(l3_path.glob("**/*.md"))
+    keys = [str(md_file.resolve()) for md_file in md_files]
+
+    # Stat every file; read and hash only those whose size or mtime moved
+    entries: list[Optional[dict]] = []
+    stale: list[int] = []
+    for i, (md_file, key) in enumerate(zip(md_files, keys)):
+        st = md_file.stat()
+        entry = cache.get(key)
+        if entry and (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            entries.append(entry)
+        else:
+            entries.append({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": None, "tasks": None})
+            stale.append(i)
+    digests, errors = map_files(file_hash, [md_files[i] for i in stale])
+    if errors:
+        raise next(iter(errors.values()))
+    unparsed: list[int] = []
+    for i, digest in zip(stale, digests):
+        previous = cache.get(keys[i])
+        entries[i]["sha256"] = digest
+        if previous and previous["sha256"] == digest:
+            entries[i]["tasks"] = previous["tasks"]
+        else:
+            unparsed.append(i)
+    parsed = parse_l3_files([md_files[i] for i in unparsed], [entries[i]["size"] for i in unparsed])
+    for i, tasks in zip(unparsed, parsed):
+        entries[i]["tasks"] = tasks
+
+    # Keep entries for files outside this directory; drop deleted ones under it
+    root = str(l3_path.resolve()) + os.sep
+    cache = {key: entry for key, entry in cache.items() if not key.startswith(root)}
+    cache.update(zip(keys, entries))
+    write_json_atomic({"version": INDEX_VERSION, "files": cache}, cache_path)
+    return md_files, entries, set(unparsed)
+
+
+def _load_parse_cache(path: Path) -> dict[str, dict]:
+    """{resolved path: {size, mtime_ns, sha256, tasks}} from the parse cache, or {} if unusable."""
+    try:
+        with open(path, "rb") as f:
+            data = json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return data.get("files", {}) if data.get("version") == INDEX_VERSION else {}
+
+
+def parse_l3_files(paths: list[Path], sizes: list[int]) -> list[list[dict]]:
+    """
+    parse_l3_file() over many files, in order.
+
+    Uses a process pool once the files add up to PARSE_POOL_MIN_BYTES
+    (parsing is CPU-bound); falls back to parsing in this process if a
+    pool cannot be started.
+    """
+    jobs = min(LOAD_JOBS, os.cpu_count() or 1)
+    if jobs > 1 and len(paths) > 1 and sum(sizes) >= PARSE_POOL_MIN_BYTES:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                return list(pool.map(parse_l3_file, paths, chunksize=max(1, len(paths) // (jobs * 4))))
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            pass
+    return [parse_l3_file(path) for path in paths]
+
+
+def parse_l3_file(path: Path) -> list[dict]:
+    """Parse one L3 markdown file, streaming it line by line."""
+    with open(path, encoding="utf-8") as f:
+        return list(iter_l3_tasks(f))
+
+
+L3_HEADER_RE = re.compile(r"# (TASK-[A-Z0-9-]+):")
+L3_CRITERION_RE = re.compile(r"- \[[ x]\] (.+)")
+L3_FIELDS = {"Type": "**Type:**", "Priority": "**Priority:**", "Dependencies": "**Dependencies:**",
+             "Files": "**Files:**", "Tags": "**Tags:**"}
+L3_DESCRIPTION = "## Description"
+
+
+def iter_l3_tasks(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Single-pass tokenizer for the L3 markdown format (see parse_l3_tasks()).
+
+    Yields one dict per task with ticket_id, title, description, type,
+    priority (both as written), dependencies, file_paths, tags and
+    acceptance_criteria, as soon as the next header ends the task. Only
+    the current task's description is held in memory, so input of any
+    size can be streamed.
+
+    Matches the original regex parser line for line: a field or title
+    whose value is blank continues onto the next non-blank line, the
+    first `**Field:**` anywhere in the body wins, and a header whose
+    title never appears is treated as body text of the previous task.
+    """
+    task: Optional[_L3Task] = None
+    held: list[str] = []  # a header with a blank title, plus blank lines after it
+    held_id = ""
+    for line in lines:
+        text = line.rstrip("\n")
+        if held:
+            if text.strip():
+                if task is not None:
+                    yield task.finish()
+                task = _L3Task(held_id, text.strip())
+                held = []
+            else:
+                held.append(line)
+            continue
+        match = L3_HEADER_RE.match(text) if text[:7] == "# TASK-" else None
+        if match:
+            title = text[match.end():]
+            if title.strip():
+                if task is not None:
+                    yield task.finish()
+                task = _L3Task(match.group(1), title.strip())
+            else:
+                held, held_id = [line], match.group(1)
+            continue
+        if task is not None:
+            task.feed(text, len(text) < len(line))
+
+    if held:
+        header_tail = held[0].rstrip("\n")[len(held_id) + 3:]
+        if header_tail or any(line.rstrip("\n") for line in held[1:]):
+            # Whitespace up to the end of input still counts as a (blank) title
+            if task is not None:
+                yield task.finish()
+            task = _L3Task(held_id, "")
+        elif task is not None:
+            for line in held:
+                text = line.rstrip("\n")
+                task.feed(text, len(text) < len(line))
+    if task is not None:
+        yield task.finish()
+
+
+class _L3Task:
+    """Field, description and criteria state for one task, fed line by line."""
+
+    def __init__(self, ticket_id: str, title: str) -> None:
+        self.ticket_id = ticket_id
+        self.title = title
+        self.fields: dict[str, str] = {}
+        self.pending: dict[str, bool] = {}  # blank field → seen non-newline whitespace
+        self.description: Optional[list[str]] = None  # None until "## Description"
+        self.in_description = False
+        self.criteria: list[str] = []
+
+    def feed(self, text: str, newline: bool) -> None:
+        """Consume one body line (`text` without its newline)."""
+        # A blank field takes the next non-blank line
+        if self.pending:
+            value = text.strip()
+            for name in self.pending:
+                if value:
+                    self.fields[name] = value
+                else:
+                    self.pending[name] |= bool(text)
+            if value:
+                self.pending = {}
+        if "**" in text and len(self.fields) + len(self.pending) < len(L3_FIELDS):
+            for name, marker in L3_FIELDS.items():
+                if name in self.fields or name in self.pending:
+                    continue
+                at = text.find(marker)
+                if at >= 0:
+                    rest = text[at + len(marker):]
+                    if rest.strip():
+                        self.fields[name] = rest.strip()
+                    else:
+                        self.pending[name] = bool(rest)
+
+        # Description: from the first non-blank line after the heading to the next "## " line
+        description = self.description
+        if description is None:
+            if L3_DESCRIPTION in text and newline:
+                if not text[text.rfind(L3_DESCRIPTION) + len(L3_DESCRIPTION):].strip():
+                    self.description = []
+        elif self.in_description:
+            if text[:3] == "## ":
+                self.in_description = False
+            else:
+                description.append(text)
+        elif not description and text.strip():
+            self.in_description = True
+            description.append(text)
+
+        if "- [" in text:
+            match = L3_CRITERION_RE.search(text)
+            if match:
+                self.criteria.append(match.group(1))
+
+    def finish(self) -> dict:
+        for name, blank in self.pending.items():
+            if blank:
+                self.fields[name] = ""
+
+        def split(name: str) -> list[str]:
+            return [v.strip() for v in self.fields.get(name, "").split(",") if v.strip()]
+
+        return {
+            "ticket_id": self.ticket_id,
+            "title": self.title,
+            "description": self.title if self.description is None else "\n".join(self.description).strip(),
+            "type": self.fields.get("Type", "backend"),
+            "priority": self.fields.get("Priority", "medium"),
+            "dependencies": split("Dependencies"),
+            "file_paths": split("Files"),
+            "tags": split("Tags"),
+            "acceptance_criteria": self.criteria or ["Implementation complete"],
+        }
+
+
+def _create_l3_tickets(
+    tasks: list[dict],
+    source_path: str,
+    created_by: str,
+    store: TicketStore,
+    existing: set[str],
+) -> list[dict]:
+    """Create tickets for parsed tasks not yet in `existing` (which is updated)."""
+    tickets = []
+    for task in tasks:
+        task_id = task["ticket_id"]
+
+        # Check if ticket already exists
+        if task_id in existing:
+            print(f"  SKIP: {task_id} already exists")
             continue
 
         ticket = create_ticket(
             ticket_id=task_id,
-            title=title,
-            description=description,
-            ticket_type=ticket_type.lower(),
-            priority=priority.lower(),
-            dependencies=dependencies,
-            file_paths=file_paths,
-            acceptance_criteria=criteria,
+            title=task["title"],
+            description=task["description"],
+            ticket_type=task["type"].lower(),
+            priority=task["priority"].lower(),
+            dependencies=task["dependencies"],
+            file_paths=task["file_paths"],
+            acceptance_criteria=task["acceptance_criteria"],
             created_by=created_by,
             source_task_file=source_path,
-            tags=tags,
+            tags=task["tags"],
+            store=store,
         )
+        existing.add(task_id)
         tickets.append(ticket)
-        print(f"  CREATED: {task_id} — {title} ({ticket_type})")
+        print(f"  CREATED: {task_id} — {task['title']} ({task['type']})")
 
     return tickets
 
 
-def _extract_field(text: str, field_name: str, default: str) -> str:
-    """Extract a **Field:** value from markdown text."""
-    match = re.search(rf'\*\*{field_name}:\*\*\s*(.+)', text)
-    return match.group(1).strip() if match else default
+# ─── Validation ───────────────────────────────────────────────────────────────
 
 
-# ─── Validation ───────────────────────────────────────────────────────────────
+def analyze_dependency_graph(tickets: list[dict]) -> dict:
+    """
+    Dependency graph diagnostics in O(V+E).
 
+    Runs an iterative Tarjan SCC pass over ticket → dependency edges and
+    reports every cycle (SCC with more than one ticket), self-dependency
+    and dangling dependency. Because Tarjan emits SCCs dependencies-first,
+    the same pass assigns each ticket a level (1 + deepest dependency),
+    giving the graph depth and its widest level.
+    """
+    deps: dict[str, list[str]] = {}
+    for ticket in tickets:
+        deps[ticket["ticket_id"]] = list(ticket.get("dependencies", []))
+
+    report: dict = {
+        "nodes": len(deps),
+        "edges": sum(len(d) for d in deps.values()),
+        "cycles": [],
+        "self_dependencies": sorted(tid for tid, d in deps.items() if tid in d),
+        "dangling": sorted((tid, dep) for tid, d in deps.items() for dep in d if dep not in deps),
+        "depth": 0,
+        "width": 0,
+    }
 
-def validate_integrity() -> list[str]:
+    index: dict[str, int] = {}
+    lowlink: dict[str, int] = {}
+    on_stack: set[str] = set()
+    scc_stack: list[str] = []
+    level: dict[str, int] = {}
+    counter = 0
+
+    for root in deps:
+        if root in index:
+            continue
+        work = [(root, iter(deps[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        scc_stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            dep = next(edges, None)
+            if dep is not None:
+                if dep not in deps:
+                    continue
+                if dep not in index:
+                    index[dep] = lowlink[dep] = counter
+                    counter += 1
+                    scc_stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(deps[dep])))
+                elif dep in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dep])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] != index[node]:
+                continue
+            component = []
+            while True:
+                member = scc_stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member == node:
+                    break
+            members = set(component)
+            if len(component) > 1:
+                report["cycles"].append(sorted(component))
+            scc_level = 1 + max(
+                (level[d] for m in component for d in deps[m] if d in deps and d not in members),
+                default=0,
+            )
+            for member in component:
+                level[member] = scc_level
+
+    widths: dict[int, int] = {}
+    for lvl in level.values():
+        widths[lvl] = widths.get(lvl, 0) + 1
+    report["cycles"].sort()
+    report["depth"] = max(widths, default=0)
+    report["width"] = max(widths.values(), default=0)
+    return report
+
+
+def dependency_graph_errors(report: dict) -> list[str]:
+    """Render analyze_dependency_graph() findings as integrity error messages."""
+    errors = [f"CYCLE: {', '.join(cycle)} form a dependency cycle" for cycle in report["cycles"]]
+    errors += [f"SELF DEPENDENCY: {tid} depends on itself" for tid in report["self_dependencies"]]
+    errors += [f"DANGLING DEPENDENCY: {tid} depends on missing {dep}" for tid, dep in report["dangling"]]
+    return errors
+
+
+def validate_integrity(store: Optional[TicketStore] = None) -> list[str]:
     """
     Full integrity check:
     1. Every ticket in a state dir has a master copy
@@ -638,37 +3149,117 @@ def validate_integrity() -> list[str]:
     3. Stage field matches directory location
     4. SDLC flow is valid
     5. No orphaned state files
+    6. Dependency graph has no cycles, self- or dangling dependencies
 
     Returns list of error messages (empty = clean).
     """
-    errors = []
+    return integrity_report(store)["errors"]
 
-    # Check all state dirs
-    seen_tickets: dict[str, list[str]] = {}
+
+def list_ticket_files() -> dict:
+    """
+    List tickets/ and every stage directory once, with stat results.
+
+    Returns {"masters": [(name, path, stat)], "states": {stage: [...]}},
+    paths as strings; stage directories that do not exist are left out
+    of "states".
+    """
+    def scan(directory: Path) -> list[tuple[str, str, os.stat_result]]:
+        files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.name != "ticket-schema.json":
+                    files.append((entry.name, entry.path, entry.stat()))
+        return files
+
+    listing: dict = {"masters": scan(TICKETS_DIR) if TICKETS_DIR.is_dir() else [], "states": {}}
     for stage in STAGES:
         stage_dir = STATE_DIR / stage
-        if not stage_dir.exists():
+        if stage_dir.exists():
+            listing["states"][stage] = scan(stage_dir)
+    return listing
+
+
+def integrity_report(
+    store: Optional[TicketStore] = None,
+    listing: Optional[dict] = None,
+    records: Optional[dict[str, tuple[Optional[dict], Optional[str]]]] = None,
+    cache: bool = True,
+) -> dict:
+    """
+    validate_integrity() errors plus dependency graph statistics.
+
+    `listing` (from list_ticket_files()) and `records` ({path: (ticket,
+    load error)}) let a caller that already read the files have them
+    checked as read instead of listed and loaded again. Without `cache`
+    the validation manifest is neither used nor updated, for files that
+    are not the working tree's (read_revision()).
+    """
+    if isinstance(store, SqliteTicketStore):
+        return store.integrity_report()
+    errors = []
+    listing = listing or list_ticket_files()
+    records = records or {}
+
+    # Per-file facts come from the validation manifest unless size or mtime changed
+    manifest_path = STATE_DIR / VALIDATION_FILE
+    manifest = _load_validation_manifest(manifest_path) if cache else _empty_validation_manifest()
+    stale: list[tuple[dict, str, Path, os.stat_result]] = []
+
+    def facts_for(files: list[tuple[str, str, Optional[os.stat_result]]], cached: dict, fresh: dict) -> list[str]:
+        for name, path, st in files:
+            hit = cached.get(name)
+            if path in records:
+                ticket, error = records[path]
+                fresh[name] = {"facts": _validation_facts(ticket, error, fresh is masters, name[:-5])}
+                if st is not None:
+                    fresh[name].update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            elif hit and (hit["size"], hit["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                fresh[name] = hit
+            else:
+                stale.append((fresh, name, Path(path), st))
+        return [name for name, _, _ in files]
+
+    masters: dict[str, dict] = {}
+    master_names = facts_for(listing["masters"], manifest["masters"], masters)
+    states: dict[str, dict[str, dict]] = {}
+    state_names: list[tuple[str, list[str]]] = []
+    for stage in STAGES:
+        if stage not in listing["states"]:
             errors.append(f"MISSING STATE DIR: {stage}")
             continue
+        states[stage] = {}
+        state_names.append((stage, facts_for(listing["states"][stage], manifest["states"].get(stage, {}), states[stage])))
+
+    loaded, load_errors = load_tickets_parallel([path for _, _, path, _ in stale])
+    for (fresh, name, path, st), ticket in zip(stale, loaded):
+        fresh[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "facts": _validation_facts(
+            ticket, str(load_errors[path]) if path in load_errors else None, fresh is masters, path.stem,
+        )}
+    masters_changed = masters != manifest["masters"]
 
-        for f in stage_dir.glob("*.json"):
-            tid = f.stem
+    # Check all state dirs
+    master_ids = {name[:-5] for name in master_names}
+    seen_tickets: dict[str, list[str]] = {}
+    for stage, names in state_names:
+        for name in names:
+            tid = name[:-5]
+            facts = states[stage][name]["facts"]
             seen_tickets.setdefault(tid, []).append(stage)
 
             # Check master exists
-            if not canonical_ticket_path(tid).exists():
+            if tid not in master_ids:
                 errors.append(f"ORPHAN: {tid} in {stage} but no master in tickets/")
 
             # Check stage field matches
-            try:
-                ticket = load_ticket(f)
-                effective_stage = STAGE_TO_STATE_DIR.get(ticket.get("stage", ""), ticket.get("stage", ""))
-                if effective_stage != stage and ticket.get("stage") != stage:
-                    errors.append(
-                        f"STAGE MISMATCH: {tid} stage={ticket.get('stage')} but in dir {stage}"
-                    )
-            except (json.JSONDecodeError, KeyError) as e:
-                errors.append(f"CORRUPT: {tid} in {stage}: {e}")
+            if "error" in facts:
+                errors.append(f"CORRUPT: {tid} in {stage}: {facts['error']}")
+                continue
+            effective_stage = STAGE_TO_STATE_DIR.get(facts["stage"] or "", facts["stage"] or "")
+            if effective_stage != stage and facts["stage"] != stage:
+                errors.append(
+                    f"STAGE MISMATCH: {tid} stage={facts['stage']} but in dir {stage}"
+                )
 
     # Check for duplicates
     for tid, stages in seen_tickets.items():
@@ -676,67 +3267,252 @@ def validate_integrity() -> list[str]:
             errors.append(f"DUPLICATE: {tid} found in {stages}")
 
     # Check master tickets have valid schema fields
-    for f in TICKETS_DIR.glob("*.json"):
-        if f.name == "ticket-schema.json":
+    graph_input = []
+    for name in master_names:
+        facts = masters[name]["facts"]
+        if "error" in facts:
+            errors.append(f"CORRUPT MASTER: {name[:-5]}: {facts['error']}")
             continue
-        try:
-            ticket = load_ticket(f)
-            required = ["ticket_id", "title", "type", "stage", "sdlc_flow",
-                        "created_at", "dependencies", "acceptance_criteria"]
-            for field in required:
-                if field not in ticket:
-                    errors.append(f"SCHEMA: {f.stem} missing required field: {field}")
-        except (json.JSONDecodeError, KeyError) as e:
-            errors.append(f"CORRUPT MASTER: {f.stem}: {e}")
+        for field in facts["missing"]:
+            errors.append(f"SCHEMA: {name[:-5]} missing required field: {field}")
+        graph_input.append({"ticket_id": facts["ticket_id"], "dependencies": facts["dependencies"]})
+
+    # Check the dependency graph (reused while no master changed)
+    graph = manifest.get("graph") if not masters_changed else None
+    if graph is None:
+        graph = analyze_dependency_graph(graph_input)
+    errors.extend(dependency_graph_errors(graph))
+
+    if cache and (masters_changed or states != manifest["states"] or "graph" not in manifest):
+        write_json_atomic(
+            {"version": INDEX_VERSION, "masters": masters, "states": states, "graph": graph}, manifest_path,
+        )
+    return {"errors": errors, "graph": graph}
 
-    return errors
 
+# Fields every master must carry (checked by integrity_report())
+REQUIRED_FIELDS = ["ticket_id", "title", "type", "stage", "sdlc_flow",
+                   "created_at", "dependencies", "acceptance_criteria"]
 
-def release_expired_claims() -> list[str]:
-    """Find and release all expired claims."""
+
+def _validation_facts(ticket: Optional[dict], error: Optional[str], master: bool, stem: str) -> dict:
+    """What integrity_report() needs to know about one file, cached in the validation manifest."""
+    if error is not None:
+        return {"error": error}
+    if not master:
+        return {"stage": ticket.get("stage")}
+    return {
+        "ticket_id": ticket.get("ticket_id", stem),
+        "dependencies": ticket.get("dependencies", []),
+        "missing": [field for field in REQUIRED_FIELDS if field not in ticket],
+    }
+
+
+def _load_validation_manifest(path: Path) -> dict:
+    try:
+        with open(path, "rb") as f:
+            manifest = json_loads(f.read())
+        if manifest.get("version") == INDEX_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return _empty_validation_manifest()
+
+
+def _empty_validation_manifest() -> dict:
+    return {"version": INDEX_VERSION, "masters": {}, "states": {}}
+
+
+def release_expired_claims(store: Optional[TicketStore] = None) -> list[str]:
+    """Find and release all expired claims (only tickets the lease heap reports as due)."""
+    store = store or TicketStore()
     released = []
     now = datetime.now(timezone.utc)
 
-    for ticket in all_tickets():
-        if ticket.get("claimed_by") and ticket.get("lease_expiry"):
-            try:
-                expiry = datetime.fromisoformat(ticket["lease_expiry"])
-                if expiry < now:
-                    ok, msg = release_claim(
-                        ticket["ticket_id"],
-                        reason=f"Lease expired at {ticket['lease_expiry']}"
-                    )
-                    if ok:
-                        released.append(msg)
-            except (ValueError, TypeError):
-                pass
+    for ticket_id in sorted(store.expired_leases(now)):
+        try:
+            ticket = store.load(ticket_id)
+        except TicketConflict:
+            continue  # retried by the next run
+        if ticket is None:
+            continue
+        ok, msg = release_claim(
+            ticket_id,
+            reason=f"Lease expired at {ticket['lease_expiry']}",
+            store=store,
+        )
+        if ok:
+            released.append(msg)
+    store.flush()
 
     return released
 
 
+# ─── Git Revisions ────────────────────────────────────────────────────────────
+
+
+def read_git_tree(rev: str, paths: tuple[str, ...], keep: Callable[[str], bool]) -> tuple[list[str], dict[str, bytes]]:
+    """
+    Directories and files under `paths` as committed at `rev`, read from git objects.
+
+    One `git ls-tree -r -t` lists the trees and one `git cat-file --batch`
+    streams every blob wanted (each distinct blob once, shared between
+    the paths holding it), so nothing is checked out and no process is
+    spawned per file. Only files for which keep(path) is true are read.
+
+    Returns (directory paths, {file path: content}), relative to ROOT and
+    in tree order. Raises ValueError if git cannot read `rev`.
+    """
+    def git(*args: str, stdin: Optional[bytes] = None) -> bytes:
+        result = subprocess.run(["git", "-C", str(ROOT), *args], input=stdin, capture_output=True)
+        if result.returncode:
+            raise ValueError(f"git {args[0]} {rev}: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    trees: list[str] = []
+    blob_ids: dict[str, str] = {}
+    for entry in git("ls-tree", "-r", "-t", "-z", rev, "--", *paths).split(b"\0"):
+        if not entry:
+            continue
+        meta, _, path = entry.decode().partition("\t")
+        _, kind, oid = meta.split()
+        if kind == "tree":
+            trees.append(path)
+        elif kind == "blob" and keep(path):
+            blob_ids[path] = oid
+
+    # --batch answers "<oid> blob <size>\n<content>\n" per requested object, in order
+    oids = list(dict.fromkeys(blob_ids.values()))
+    out = git("cat-file", "--batch", stdin="".join(f"{oid}\n" for oid in oids).encode()) if oids else b""
+    contents: dict[str, bytes] = {}
+    pos = 0
+    for oid in oids:
+        header_end = out.index(b"\n", pos)
+        size = int(out[pos:header_end].rsplit(b" ", 1)[1])
+        contents[oid] = out[header_end + 1:header_end + 1 + size]
+        pos = header_end + 1 + size + 1
+    return trees, {path: contents[oid] for path, oid in blob_ids.items()}
+
+
+def read_revision(rev: str) -> tuple[dict, dict[str, tuple[Optional[dict], Optional[str]]]]:
+    """
+    tickets/ and ticket-state/ as committed at `rev` (see read_git_tree()).
+
+    Returns (listing, records) shaped like list_ticket_files() and the
+    records integrity_report() takes, keyed by repository path; listing
+    entries carry no stat result. Raises ValueError if git cannot read `rev`.
+    """
+    def stage_of(path: str) -> Optional[str]:
+        """"" for a master, the stage for a state copy, None for any other file."""
+        directory, _, name = path.rpartition("/")
+        if not name.endswith(".json") or name == "ticket-schema.json":
+            return None
+        if directory == TICKETS_DIR.name:
+            return ""
+        parent, _, stage = directory.partition("/")
+        return stage if parent == STATE_DIR.name and stage in STAGES else None
+
+    # Paths are relative to ROOT; -t also lists stage directories holding only a .gitkeep
+    trees, blobs = read_git_tree(rev, (TICKETS_DIR.name, STATE_DIR.name), lambda path: stage_of(path) is not None)
+    listing: dict = {"masters": [], "states": {}}
+    for path in trees:
+        directory, _, name = path.rpartition("/")
+        if directory == STATE_DIR.name and name in STAGES:
+            listing["states"].setdefault(name, [])
+    parsed: dict[int, tuple[Optional[dict], Optional[str]]] = {}
+    records: dict[str, tuple[Optional[dict], Optional[str]]] = {}
+    for path, data in blobs.items():
+        stage, name = stage_of(path), path.rpartition("/")[2]
+        if stage:
+            listing["states"].setdefault(stage, []).append((name, path, None))
+        else:
+            listing["masters"].append((name, path, None))
+        if id(data) not in parsed:  # identical blobs share one bytes object: parse each once
+            try:
+                parsed[id(data)] = (json_loads(data), None)
+            except ValueError as e:
+                parsed[id(data)] = (None, str(e))
+        records[path] = parsed[id(data)]
+    return listing, records
+
+
 # ─── Status Display ───────────────────────────────────────────────────────────
 
 
-def print_status() -> None:
-    """Print current state of all tickets."""
+def status_snapshot(
+    store: Optional[TicketStore] = None, state_copies: bool = True, rev: Optional[str] = None,
+) -> dict:
+    """
+    One consistent view of all tickets for print_status() and status_report().
+
+    tickets/ and the stage directories are listed once and every file is
+    read at most once; stage contents, master records and integrity errors
+    all come from that pass, so counts agree even if files change mid-run.
+    Without `state_copies` only masters are read and state files are
+    checked from the validation manifest. With `rev` the files are read
+    as committed at that git revision (read_revision()) instead of from
+    `store`, and every file is read.
+
+    Returns {"stages": {stage: [(ticket_id, state copy or None)]},
+    "ticket_ids": [...], "masters": [readable records, by ID], "errors": [...]}.
+    """
+    if rev is not None:
+        listing, records = read_revision(rev)
+    elif isinstance(store, SqliteTicketStore):
+        return {
+            "stages": {
+                stage: [
+                    (tid, store.state_copy(tid, stage) if state_copies else None)
+                    for tid in sorted(store.stage_ids(stage))
+                ]
+                for stage in STAGES
+            },
+            "ticket_ids": store.ticket_ids(),
+            "masters": store.tickets(),
+            "errors": store.integrity_report()["errors"],
+        }
+    else:
+        listing = list_ticket_files()
+        files = [(TICKETS_DIR / name, path) for name, path, _ in listing["masters"]]
+        if state_copies:
+            files += [(STATE_DIR / stage / name, path) for stage, found in listing["states"].items() for name, path, _ in found]
+        loaded, load_errors = load_tickets_parallel([file for file, _ in files])
+        records = {
+            path: (ticket, str(load_errors[file]) if file in load_errors else None)
+            for (file, path), ticket in zip(files, loaded)
+        }
+    masters = sorted(listing["masters"])
+    return {
+        "stages": {
+            stage: [
+                (name[:-5], records[path][0] if path in records else None)
+                for name, path, _ in sorted(listing["states"].get(stage, []))
+            ]
+            for stage in STAGES
+        },
+        "ticket_ids": [name[:-5] for name, _, _ in masters],
+        "masters": [records[path][0] for _, path, _ in masters if records[path][0] is not None],
+        "errors": integrity_report(listing=listing, records=records, cache=rev is None)["errors"],
+    }
+
+
+def print_status(store: Optional[TicketStore] = None, rev: Optional[str] = None) -> None:
+    """Print current state of all tickets (from the files, `store` if given, or git revision `rev`)."""
+    snapshot = status_snapshot(store, state_copies=False, rev=rev)
     print("=" * 80)
-    print("DISTRIBUTED TICKET STATE MACHINE — STATUS")
+    print("DISTRIBUTED TICKET STATE MACHINE — STATUS" + (f" AT {rev}" if rev is not None else ""))
     print("=" * 80)
     print()
 
     # Count by stage
-    stage_counts: dict[str, int] = {}
-    for stage in STAGES:
-        stage_dir = STATE_DIR / stage
-        count = len(list(stage_dir.glob("*.json"))) if stage_dir.exists() else 0
-        stage_counts[stage] = count
+    stage_counts = {stage: len(entries) for stage, entries in snapshot["stages"].items()}
 
     print("Stage Distribution:")
     for stage, count in stage_counts.items():
         bar = "█" * count
         print(f"  {stage:12s} │ {count:3d} {bar}")
 
-    total_master = len(all_ticket_ids())
+    total_master = len(snapshot["ticket_ids"])
     total_in_state = sum(stage_counts.values())
     print(f"\n  Total tickets (master): {total_master}")
     print(f"  Total in state dirs:    {total_in_state}")
@@ -745,7 +3521,7 @@ def print_status() -> None:
     # Show claimed tickets
     print("\nActive Claims:")
     found_claims = False
-    for ticket in all_tickets():
+    for ticket in snapshot["masters"]:
         if ticket.get("claimed_by"):
             found_claims = True
             expiry = ticket.get("lease_expiry", "N/A")
@@ -759,7 +3535,7 @@ def print_status() -> None:
         print("  (none)")
 
     # Show errors
-    errors = validate_integrity()
+    errors = snapshot["errors"]
     if errors:
         print(f"\nIntegrity Issues ({len(errors)}):")
         for e in errors:
@@ -770,8 +3546,14 @@ def print_status() -> None:
     print()
 
 
-def print_status_json() -> None:
+def print_status_json(store: Optional[TicketStore] = None, rev: Optional[str] = None) -> None:
     """Output machine-readable JSON status of all tickets, grouped by stage."""
+    print(json.dumps(status_report(store, rev), indent=2, default=str))
+
+
+def status_report(store: Optional[TicketStore] = None, rev: Optional[str] = None) -> dict:
+    """The data behind print_status_json()."""
+    snapshot = status_snapshot(store, rev=rev)
     output: dict = {
         "stages": {},
         "summary": {
@@ -785,35 +3567,30 @@ def print_status_json() -> None:
 
     # Count by stage
     total_in_state = 0
-    for stage in STAGES:
-        stage_dir = STATE_DIR / stage
+    for stage, entries in snapshot["stages"].items():
         stage_tickets = []
-        if stage_dir.exists():
-            for f in sorted(stage_dir.glob("*.json")):
-                try:
-                    ticket = load_ticket(f)
-                    stage_tickets.append({
-                        "ticket_id": ticket.get("ticket_id", f.stem),
-                        "title": ticket.get("title", ""),
-                        "type": ticket.get("type", ""),
-                        "priority": ticket.get("priority", "medium"),
-                        "claimed_by": ticket.get("claimed_by"),
-                        "operator": ticket.get("operator"),
-                        "machine_id": ticket.get("machine_id"),
-                        "lease_expiry": ticket.get("lease_expiry"),
-                        "rework_count": ticket.get("rework_count", 0),
-                        "dependencies": ticket.get("dependencies", []),
-                        "sdlc_flow": ticket.get("sdlc_flow", []),
-                        "file_paths": ticket.get("file_paths", []),
-                        "acceptance_criteria": ticket.get("acceptance_criteria", []),
-                    })
-                except (json.JSONDecodeError, KeyError):
-                    pass
+        for tid, ticket in entries:
+            if ticket is not None:
+                stage_tickets.append({
+                    "ticket_id": ticket.get("ticket_id", tid),
+                    "title": ticket.get("title", ""),
+                    "type": ticket.get("type", ""),
+                    "priority": ticket.get("priority", "medium"),
+                    "claimed_by": ticket.get("claimed_by"),
+                    "operator": ticket.get("operator"),
+                    "machine_id": ticket.get("machine_id"),
+                    "lease_expiry": ticket.get("lease_expiry"),
+                    "rework_count": ticket.get("rework_count", 0),
+                    "dependencies": ticket.get("dependencies", []),
+                    "sdlc_flow": ticket.get("sdlc_flow", []),
+                    "file_paths": ticket.get("file_paths", []),
+                    "acceptance_criteria": ticket.get("acceptance_criteria", []),
+                })
         total_in_state += len(stage_tickets)
         output["stages"][stage] = stage_tickets
 
     # Collect active claims
-    for ticket in all_tickets():
+    for ticket in snapshot["masters"]:
         if ticket.get("claimed_by"):
             output["active_claims"].append({
                 "ticket_id": ticket["ticket_id"],
@@ -823,18 +3600,18 @@ def print_status_json() -> None:
                 "lease_expiry": ticket.get("lease_expiry"),
             })
 
-    total_master = len(all_ticket_ids())
+    total_master = len(snapshot["ticket_ids"])
     output["summary"]["total_master"] = total_master
     output["summary"]["total_in_state"] = total_in_state
     output["summary"]["blocked"] = total_master - total_in_state
 
     # Integrity errors
-    output["errors"] = validate_integrity()
+    output["errors"] = snapshot["errors"]
 
-    print(json.dumps(output, indent=2, default=str))
+    return output
 
 
-def print_dot_graph() -> None:
+def print_dot_graph(store: Optional[TicketStore] = None) -> None:
     """Output dependency graph in DOT format for visualization."""
     print("digraph tickets {")
     print("  rankdir=LR;")
@@ -855,7 +3632,7 @@ def print_dot_graph() -> None:
         "DONE": "#32CD32",
     }
 
-    for ticket in all_tickets():
+    for ticket in store.tickets() if store is not None else all_tickets():
         tid = ticket["ticket_id"]
         stage = ticket.get("stage", "UNKNOWN")
         color = stage_colors.get(stage, "#FFFFFF")
@@ -867,10 +3644,880 @@ def print_dot_graph() -> None:
     print("}")
 
 
+# ─── Point-in-Time Board ──────────────────────────────────────────────────────
+
+# Claim details as written by claim_ticket() and renew_lease()
+CLAIM_DETAILS_RE = re.compile(r"Claimed by (?P<operator>.*)@[^@]* via .*, lease until (?P<expiry>\S+)$")
+LEASE_DETAILS_RE = re.compile(r"until (?P<expiry>\S+)$")
+
+# Layout of a history_steps() step; cached runs with another layout are rebuilt
+HISTORY_STEP_FIELDS = ("time", "timestamp", "event", "stage", "claim", "rework_count", "agent")
+
+
+def history_steps(events: list[dict]) -> list[list]:
+    """
+    Replay steps of one ticket's events, oldest first.
+
+    Each step is [POSIX time, timestamp, event, stage, claim, rework_count,
+    agent]: the ticket's state right after the event, and the agent that
+    recorded it. `stage` is None before
+    MOVED_TO_READY (the ticket is not in any stage directory), `claim`
+    is [agent, operator, machine_id, lease_expiry] or None. CREATED,
+    MOVED_TO_READY, CLAIMED, LEASE_RENEWED and CLAIM_RELEASED change
+    the state as named; any other event with a "to_stage" moves the
+    ticket there and ends its claim. Events without a parsable timezone-
+    aware timestamp cannot be placed in time and are skipped.
+
+    Events apply in log order. A hand-written timestamp later than the
+    next event's is taken as that event's time, so steps stay sorted.
+    """
+    timed = [
+        [moment, event] for event in events if (moment := lease_timestamp(event.get("timestamp"))) is not None
+    ]
+    for i in range(len(timed) - 2, -1, -1):
+        timed[i][0] = min(timed[i][0], timed[i + 1][0])
+    steps = []
+    stage: Optional[str] = None
+    claim: Optional[list] = None
+    rework_count = 0
+    for moment, event in timed:
+        kind = event.get("event")
+        details = event.get("details") or ""
+        if kind == "CREATED":
+            stage, claim = None, None
+        elif kind == "MOVED_TO_READY":
+            stage = "READY"
+        elif kind == "CLAIMED":
+            match = CLAIM_DETAILS_RE.match(details)
+            claim = [
+                event.get("agent"), match["operator"] if match else None,
+                event.get("machine_id"), match["expiry"] if match else None,
+            ]
+        elif kind == "LEASE_RENEWED":
+            match = LEASE_DETAILS_RE.search(details)
+            if claim and match:
+                claim = claim[:3] + [match["expiry"]]
+        elif kind == "CLAIM_RELEASED":
+            claim = None
+        elif event.get("to_stage"):
+            stage, claim = event["to_stage"], None
+            if kind == "REWORK":
+                rework_count += 1
+        steps.append([moment, event["timestamp"], kind, stage, claim, rework_count, event.get("agent")])
+    return steps
+
+
+def _replay_events(store: TicketStore, ticket_id: str) -> list[dict]:
+    """A ticket's events including those compact_history() archived, without the COMPACTED marker."""
+    events = store.history(ticket_id)
+    archived = store.archived_history(ticket_id)
+    if archived:
+        events = archived + [event for event in events if event.get("event") != "COMPACTED"]
+    return events
+
+
+def event_runs(store: TicketStore) -> tuple[dict[str, list[list]], str]:
+    """
+    ticket_id → history_steps() of every master, and the event-log watermark.
+
+    For the file layout the steps are kept in ticket-state/.events.json
+    with the size and mtime of the master, history log and archive they
+    came from; tickets/ is listed once and only tickets whose files
+    changed are read again, so an unchanged board reads no ticket file.
+    The watermark is that file's generation (SqliteTicketStore:
+    history_watermark()); it changes whenever any event does.
+    """
+    if isinstance(store, SqliteTicketStore):
+        runs = {tid: history_steps(_replay_events(store, tid)) for tid in store.ticket_ids()}
+        return runs, store.history_watermark()
+
+    # [master, history log, archive] → [size, mtime_ns] or None, per ticket
+    stamps: dict[str, list] = {}
+    suffixes = ((ARCHIVE_SUFFIX, 2), (HISTORY_SUFFIX, 1), (".json", 0))
+    with os.scandir(store.tickets_dir) as entries:
+        for entry in entries:
+            for suffix, slot in suffixes:
+                if entry.name.endswith(suffix):
+                    st = entry.stat()
+                    stamps.setdefault(entry.name[:-len(suffix)], [None, None, None])[slot] = [st.st_size, st.st_mtime_ns]
+                    break
+    stamps.pop("ticket-schema", None)
+
+    path = store.state_dir / EVENT_INDEX_FILE
+    try:
+        with open(path, "rb") as f:
+            cached = json_loads(f.read())
+        if cached.get("version") != INDEX_VERSION or cached.get("fields") != list(HISTORY_STEP_FIELDS):
+            raise ValueError(f"{EVENT_INDEX_FILE} version {cached.get('version')}")
+    except (OSError, ValueError):
+        cached = {"tickets": {}}
+    entries_by_id: dict[str, dict] = {}
+    changed = False
+    for tid, files in stamps.items():
+        if files[0] is None:
+            continue  # a log without a master: the ticket no longer exists
+        hit = cached["tickets"].get(tid)
+        if hit is None or hit["files"] != files:
+            hit = {"files": files, "steps": history_steps(_replay_events(store, tid))}
+            changed = True
+        entries_by_id[tid] = hit
+    generation = cached.get("generation")
+    if changed or len(entries_by_id) != len(cached["tickets"]) or generation is None:
+        generation = f"{time.time_ns():x}"
+        write_json_atomic({
+            "version": INDEX_VERSION, "generation": generation, "fields": HISTORY_STEP_FIELDS, "tickets": entries_by_id,
+        }, path)
+    return {tid: entry["steps"] for tid, entry in entries_by_id.items()}, generation
+
+
+def board_as_of(moment: datetime, store: Optional[TicketStore] = None) -> dict:
+    """
+    Stages and claims of all tickets at `moment`, replayed from their history.
+
+    The per-ticket step runs from event_runs() are already in time order;
+    heapq.merge() interleaves them into one timeline that is replayed up
+    to `moment` and no further. Tickets created later are left out.
+
+    Returns {"as_of", "events" (replayed), "stages": {stage: [ids]},
+    "blocked": [ids], "claims": [{ticket_id, claimed_by, operator,
+    machine_id, lease_expiry, expired}], "tickets": {id: {stage,
+    rework_count, last_event, last_event_at}}}.
+    """
+    store = store or TicketStore()
+    cutoff = moment.timestamp()
+
+    def run(tid: str, steps: list[list]) -> Iterator[tuple[float, str, list]]:
+        for step in steps:
+            yield step[0], tid, step
+
+    latest: dict[str, list] = {}
+    replayed = 0
+    runs, _ = event_runs(store)
+    timeline = heapq.merge(*(run(tid, steps) for tid, steps in runs.items()), key=lambda entry: entry[0])
+    for when, tid, step in timeline:
+        if when > cutoff:
+            break
+        latest[tid] = step
+        replayed += 1
+
+    board: dict = {
+        "as_of": moment.isoformat(),
+        "events": replayed,
+        "stages": {stage: [] for stage in STAGES},
+        "blocked": [],
+        "claims": [],
+        "tickets": {},
+    }
+    for tid in sorted(latest):
+        timestamp, kind, stage, claim, rework_count = latest[tid][1:6]
+        if stage:
+            board["stages"].setdefault(stage, []).append(tid)
+        else:
+            board["blocked"].append(tid)
+        if claim:
+            expiry = lease_timestamp(claim[3])
+            board["claims"].append({
+                "ticket_id": tid,
+                "claimed_by": claim[0],
+                "operator": claim[1],
+                "machine_id": claim[2],
+                "lease_expiry": claim[3],
+                "expired": expiry is not None and expiry <= cutoff,
+            })
+        board["tickets"][tid] = {
+            "stage": stage,
+            "rework_count": rework_count,
+            "last_event": kind,
+            "last_event_at": timestamp,
+        }
+    return board
+
+
+def print_board_as_of(board: dict) -> None:
+    """Text rendering of board_as_of(), laid out like print_status()."""
+    print("=" * 80)
+    print(f"BOARD AS OF {board['as_of']} ({board['events']} events replayed)")
+    print("=" * 80)
+    print()
+
+    print("Stage Distribution:")
+    for stage, ids in board["stages"].items():
+        print(f"  {stage:12s} │ {len(ids):3d} {'█' * len(ids)}")
+    print(f"\n  Tickets existing then:  {len(board['tickets'])}")
+    print(f"  Blocked (not in state): {len(board['blocked'])}")
+
+    print("\nClaims:")
+    for claim in board["claims"]:
+        print(
+            f"  {claim['ticket_id']:20s} → {claim['claimed_by']} "
+            f"on {claim['machine_id'] or '?'} "
+            f"({claim['operator'] or '?'}) "
+            f"until {claim['lease_expiry'] or 'N/A'}"
+            + (" [expired]" if claim["expired"] else "")
+        )
+    if not board["claims"]:
+        print("  (none)")
+    print()
+
+
+# ─── Flow Metrics ─────────────────────────────────────────────────────────────
+
+METRICS_PERCENTILES = (50, 85, 95)
+
+
+def history_columns(runs: dict[str, list[list]]) -> dict:
+    """
+    Every step of every event_runs() run as parallel columns.
+
+    Rows go ticket by ticket, in time order within a ticket. "ticket",
+    "event", "stage" and "agent" hold indexes into the "tickets",
+    "events", "stages" and "agents" lists (stage -1: not in a stage
+    directory); "time" holds POSIX times. Columns are numpy arrays when
+    numpy is installed, array.array otherwise. This is the only pass over
+    the events in Python; the metrics are computed from the columns.
+    """
+    names: dict[str, dict] = {"events": {}, "stages": {}, "agents": {}}
+    events, stages, agents = names["events"], names["stages"], names["agents"]
+    tickets = sorted(runs)
+    columns = {"ticket": array("i"), "time": array("d"), "event": array("i"), "stage": array("i"), "agent": array("i")}
+    ticket_col, time_col, event_col, stage_col, agent_col = columns.values()
+    for index, tid in enumerate(tickets):
+        for step in runs[tid]:
+            ticket_col.append(index)
+            time_col.append(step[0])
+            event_col.append(events.setdefault(step[2], len(events)))
+            stage_col.append(-1 if step[3] is None else stages.setdefault(step[3], len(stages)))
+            agent_col.append(agents.setdefault(step[6] or "?", len(agents)))
+    if numpy is not None:
+        columns = {
+            name: numpy.frombuffer(column, dtype=numpy.float64 if column.typecode == "d" else numpy.intc)
+            for name, column in columns.items()
+        }
+    columns.update({"tickets": tickets, **{name: list(codes) for name, codes in names.items()}})
+    return columns
+
+
+def _flow_samples(columns: dict) -> dict:
+    """
+    Per-event samples behind flow_metrics(), from history_columns().
+
+    "dwell": (stage, hours) of every closed stay in a stage; "lead" and
+    "cycle": hours from a ticket's first event / first claim to its first
+    arrival in DONE; "rework_from": stage of every REWORK; "completed":
+    (UTC day, agent) of every STAGE_COMPLETED; "done_days": UTC day of
+    every first arrival in DONE; "reworked": tickets reworked at least once.
+    """
+    codes = {name: {value: i for i, value in enumerate(columns[name])} for name in ("events", "stages")}
+    done = codes["stages"].get("DONE", -2)
+    claimed = codes["events"].get("CLAIMED", -2)
+    rework = codes["events"].get("REWORK", -2)
+    completed = codes["events"].get("STAGE_COMPLETED", -2)
+    ticket, when, event, stage, agent = (columns[name] for name in ("ticket", "time", "event", "stage", "agent"))
+
+    if numpy is not None:
+        first = numpy.ones(len(ticket), dtype=bool)
+        first[1:] = ticket[1:] != ticket[:-1]
+        entered = first.copy()
+        entered[1:] |= stage[1:] != stage[:-1]
+        entries = numpy.flatnonzero(entered)
+        stay, leave = entries[:-1], entries[1:]
+        closed = ticket[leave] == ticket[stay]
+        stay, leave = stay[closed], leave[closed]
+
+        started = numpy.zeros(len(columns["tickets"]))
+        started[ticket[first]] = when[first]
+        done_rows = numpy.flatnonzero(entered & (stage == done))
+        done_tickets, pick = numpy.unique(ticket[done_rows], return_index=True)
+        done_rows = done_rows[pick]
+        claim_rows = numpy.flatnonzero(event == claimed)
+        claim_tickets, pick = numpy.unique(ticket[claim_rows], return_index=True)
+        first_claim = numpy.full(len(columns["tickets"]), numpy.nan)
+        first_claim[claim_tickets] = when[claim_rows[pick]]
+        cycle = when[done_rows] - first_claim[done_tickets]
+
+        rework_rows = numpy.flatnonzero((event == rework) & ~first)
+        completed_rows = numpy.flatnonzero(event == completed)
+        return {
+            "dwell": (stage[stay], (when[leave] - when[stay]) / 3600),
+            "lead": (when[done_rows] - started[done_tickets]) / 3600,
+            "cycle": cycle[cycle >= 0] / 3600,
+            "rework_from": stage[rework_rows - 1],
+            "completed": ((when[completed_rows] // 86400).astype(numpy.int64), agent[completed_rows]),
+            "done_days": (when[done_rows] // 86400).astype(numpy.int64),
+            "reworked": len(numpy.unique(ticket[rework_rows])),
+        }
+
+    samples: dict = {
+        "dwell": ([], []), "lead": [], "cycle": [], "rework_from": [],
+        "completed": ([], []), "done_days": [], "reworked": set(),
+    }
+    for i in range(len(ticket)):
+        first = i == 0 or ticket[i] != ticket[i - 1]
+        entered = first or stage[i] != stage[i - 1]
+        if first:
+            started = entered_at = when[i]
+            first_claim = None
+            reached_done = False
+        elif entered:
+            samples["dwell"][0].append(stage[i - 1])
+            samples["dwell"][1].append((when[i] - entered_at) / 3600)
+            entered_at = when[i]
+        if event[i] == rework and not first:
+            samples["rework_from"].append(stage[i - 1])
+            samples["reworked"].add(ticket[i])
+        if event[i] == claimed and first_claim is None:
+            first_claim = when[i]
+        if entered and stage[i] == done and not reached_done:
+            reached_done = True
+            samples["lead"].append((when[i] - started) / 3600)
+            if first_claim is not None:
+                samples["cycle"].append((when[i] - first_claim) / 3600)
+            samples["done_days"].append(int(when[i] // 86400))
+        if event[i] == completed:
+            samples["completed"][0].append(int(when[i] // 86400))
+            samples["completed"][1].append(agent[i])
+    samples["reworked"] = len(samples["reworked"])
+    return samples
+
+
+def _summary_stats(values: Any) -> dict:
+    """count, mean, percentiles (linear interpolation) and max of `values`, rounded to 2 places."""
+    ordered = numpy.sort(values) if numpy is not None else sorted(values)
+    count = len(ordered)
+    if not count:
+        return {"count": 0}
+    stats = {"count": count, "mean": round(float(sum(ordered) if numpy is None else ordered.sum()) / count, 2)}
+    for q in METRICS_PERCENTILES:
+        position = (count - 1) * q / 100
+        low = int(position)
+        high = min(low + 1, count - 1)
+        stats[f"p{q}"] = round(float(ordered[low] + (ordered[high] - ordered[low]) * (position - low)), 2)
+    stats["max"] = round(float(ordered[-1]), 2)
+    return stats
+
+
+def _grouped_stats(keys: Any, values: Any) -> dict[int, dict]:
+    """_summary_stats() of `values` per distinct key, vectorized over all groups with numpy."""
+    if numpy is None:
+        groups: dict[int, list[float]] = {}
+        for key, value in zip(keys, values):
+            groups.setdefault(key, []).append(value)
+        return {key: _summary_stats(group) for key, group in groups.items()}
+    if not len(keys):
+        return {}
+    order = numpy.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    counts = numpy.diff(numpy.r_[starts, len(keys)])
+    means = numpy.add.reduceat(values, starts) / counts
+    percentiles = {}
+    for q in METRICS_PERCENTILES:
+        position = (counts - 1) * q / 100
+        low = position.astype(numpy.int64)
+        high = numpy.minimum(low + 1, counts - 1)
+        percentiles[q] = values[starts + low] + (values[starts + high] - values[starts + low]) * (position - low)
+    maxima = values[starts + counts - 1]
+    grouped = {}
+    for g, key in enumerate(keys[starts].tolist()):
+        grouped[key] = {"count": int(counts[g]), "mean": round(float(means[g]), 2)}
+        grouped[key].update({f"p{q}": round(float(percentiles[q][g]), 2) for q in METRICS_PERCENTILES})
+        grouped[key]["max"] = round(float(maxima[g]), 2)
+    return grouped
+
+
+def _counts(keys: Any) -> dict[int, int]:
+    """Occurrences of each distinct key."""
+    if numpy is None:
+        counts: dict[int, int] = {}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+    distinct, counts = numpy.unique(keys, return_counts=True)
+    return dict(zip(distinct.tolist(), counts.tolist()))
+
+
+def compute_flow_metrics(runs: dict[str, list[list]]) -> dict:
+    """
+    Lead and cycle time, stage dwell, rework rates and daily throughput.
+
+    Times are in hours; days are UTC dates. Stays in a stage count once
+    the ticket has left it, so the current stage of open tickets is not
+    included. A stage's rework rate is its REWORK events over all exits.
+    """
+    columns = history_columns(runs)
+    samples = _flow_samples(columns)
+    stage_names = {-1: "BLOCKED", **dict(enumerate(columns["stages"]))}
+    stage_rank = {name: rank for rank, name in enumerate(["BLOCKED"] + STAGES)}
+
+    def by_stage(grouped: dict[int, Any]) -> dict[str, Any]:
+        named = {stage_names[int(code)]: value for code, value in grouped.items()}
+        return dict(sorted(named.items(), key=lambda item: (stage_rank.get(item[0], len(stage_rank)), item[0])))
+
+    def day(number: int) -> str:
+        return datetime.fromtimestamp(number * 86400, timezone.utc).date().isoformat()
+
+    dwell = by_stage(_grouped_stats(*samples["dwell"]))
+    reworks = by_stage(_counts(samples["rework_from"]))
+    agents = columns["agents"]
+    days, agent_codes = samples["completed"]
+    per_agent: dict[str, dict[str, int]] = {}
+    combined = [d * len(agents) + a for d, a in zip(days, agent_codes)] if numpy is None else days * len(agents) + agent_codes
+    for key, count in sorted(_counts(combined).items()):
+        per_agent.setdefault(agents[key % len(agents)], {})[day(key // len(agents))] = count
+    return {
+        "tickets": len(columns["tickets"]),
+        "events": len(columns["ticket"]),
+        "lead_time_hours": _summary_stats(samples["lead"]),
+        "cycle_time_hours": _summary_stats(samples["cycle"]),
+        "stage_dwell_hours": dwell,
+        "rework": {
+            "tickets_reworked": samples["reworked"],
+            "rate": round(samples["reworked"] / len(columns["tickets"]), 4) if columns["tickets"] else 0.0,
+            "by_stage": {
+                stage: {"reworks": count, "exits": dwell[stage]["count"], "rate": round(count / dwell[stage]["count"], 4)}
+                for stage, count in reworks.items() if stage in dwell
+            },
+        },
+        "throughput": {
+            "done_per_day": {day(key): count for key, count in sorted(_counts(samples["done_days"]).items())},
+            "completions_per_day": dict(sorted(per_agent.items())),
+        },
+    }
+
+
+def flow_metrics(store: Optional[TicketStore] = None) -> dict:
+    """
+    compute_flow_metrics() over all history, cached per event-log watermark.
+
+    The result is kept in ticket-state/.metrics.json with the watermark
+    from event_runs(); while no event changes it is returned as is.
+    """
+    store = store or TicketStore()
+    runs, watermark = event_runs(store)
+    path = store.state_dir / METRICS_FILE
+    try:
+        with open(path, "rb") as f:
+            cached = json_loads(f.read())
+        if cached.get("version") == INDEX_VERSION and cached.get("watermark") == watermark:
+            return cached["metrics"]
+    except (OSError, ValueError):
+        pass
+    metrics = compute_flow_metrics(runs)
+    write_json_atomic({"version": INDEX_VERSION, "watermark": watermark, "metrics": metrics}, path)
+    return metrics
+
+
+def print_flow_metrics(metrics: dict) -> None:
+    """Text rendering of flow_metrics()."""
+    def stats_line(stats: dict) -> str:
+        if not stats["count"]:
+            return "n=0"
+        return f"n={stats['count']}  mean {stats['mean']}  " + "  ".join(
+            f"p{q} {stats[f'p{q}']}" for q in METRICS_PERCENTILES
+        ) + f"  max {stats['max']}"
+
+    print("=" * 80)
+    print(f"FLOW METRICS ({metrics['tickets']} tickets, {metrics['events']} events)")
+    print("=" * 80)
+    print()
+    print(f"Lead time (first event → DONE), hours:  {stats_line(metrics['lead_time_hours'])}")
+    print(f"Cycle time (first claim → DONE), hours: {stats_line(metrics['cycle_time_hours'])}")
+
+    print("\nStage dwell, hours:")
+    for stage, stats in metrics["stage_dwell_hours"].items():
+        print(f"  {stage:12s} {stats_line(stats)}")
+
+    rework = metrics["rework"]
+    print(f"\nRework: {rework['tickets_reworked']} of {metrics['tickets']} tickets ({rework['rate']:.1%})")
+    for stage, row in rework["by_stage"].items():
+        print(f"  {stage:12s} {row['reworks']:4d} / {row['exits']:<4d} exits ({row['rate']:.1%})")
+
+    print("\nThroughput (stage completions per day):")
+    for agent, days in metrics["throughput"]["completions_per_day"].items():
+        print(f"  {agent:14s} " + ", ".join(f"{d} {n}" for d, n in days.items()))
+    done = metrics["throughput"]["done_per_day"]
+    print("  DONE per day:  " + (", ".join(f"{d} {n}" for d, n in done.items()) or "(none)"))
+    print()
+
+
+def write_flow_metrics_csv(metrics: dict, out: TextIO) -> None:
+    """flow_metrics() as CSV rows of metric, group, key, value."""
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["metric", "group", "key", "value"])
+    writer.writerow(["tickets", "", "", metrics["tickets"]])
+    writer.writerow(["events", "", "", metrics["events"]])
+    for metric in ("lead_time_hours", "cycle_time_hours"):
+        for key, value in metrics[metric].items():
+            writer.writerow([metric, "", key, value])
+    for stage, stats in metrics["stage_dwell_hours"].items():
+        for key, value in stats.items():
+            writer.writerow(["stage_dwell_hours", stage, key, value])
+    writer.writerow(["rework", "", "tickets_reworked", metrics["rework"]["tickets_reworked"]])
+    writer.writerow(["rework", "", "rate", metrics["rework"]["rate"]])
+    for stage, row in metrics["rework"]["by_stage"].items():
+        for key, value in row.items():
+            writer.writerow(["rework", stage, key, value])
+    for day, count in metrics["throughput"]["done_per_day"].items():
+        writer.writerow(["done_per_day", "", day, count])
+    for agent, days in metrics["throughput"]["completions_per_day"].items():
+        for day, count in days.items():
+            writer.writerow(["completions_per_day", agent, day, count])
+
+
+# ─── Query ────────────────────────────────────────────────────────────────────
+
+# Columns of a query index row; every one but rework_count is a list of casefolded values
+QUERY_FIELDS = ("stage", "type", "priority", "tag", "operator", "claimed_by", "rework_count", "depends_on")
+QUERY_FLAGS = {"claimed": "claimed_by", "has_dependency": "depends_on"}  # yes/no: whether the field is set
+QUERY_TERM_RE = re.compile(r"^(!?)([A-Za-z_-]+)(?:(!=|<=|>=|=|<|>)(.*))?$")
+QUERY_COMPARE = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+}
+
+
+def query_row(ticket: dict) -> list:
+    """The fields of a ticket --query can filter on, in QUERY_FIELDS order, as kept in the query index."""
+    def values(value: Any) -> list[str]:
+        if isinstance(value, list):
+            return [str(v).casefold() for v in value]
+        return [] if value is None or value == "" else [str(value).casefold()]
+
+    return [
+        values(ticket.get("stage")),
+        values(ticket.get("type")),
+        values(ticket.get("priority", "medium")),
+        values(ticket.get("tags", [])),
+        values(ticket.get("operator")),
+        values(ticket.get("claimed_by")),
+        ticket.get("rework_count") or 0,
+        values(ticket.get("dependencies", [])),
+    ]
+
+
+def parse_query(expression: str) -> list[tuple[str, str, list]]:
+    """
+    Parse a --query expression into (field, operator, values) terms.
+
+    Terms are separated by whitespace and must all match:
+      stage=QA priority=critical,high tag=auth operator=Owais
+      rework_count>=2  rework_count=1..3  type!=docs
+      claimed  !claimed  has-dependency  depends_on=TASK-001
+    Comma-separated values match any of them. Field names accept "-" for
+    "_" and "tags" for "tag"; string comparisons ignore case.
+    Raises ValueError on an unknown field or malformed term.
+    """
+    terms: list[tuple[str, str, list]] = []
+    for raw in expression.split():
+        m = QUERY_TERM_RE.match(raw)
+        if not m:
+            raise ValueError(f"Malformed query term: {raw!r}")
+        negate, field, op, value = m.groups()
+        field = field.replace("-", "_").lower()
+        field = "tag" if field == "tags" else field
+        if field in QUERY_FLAGS:
+            if op is None:
+                want = True
+            elif op in ("=", "!=") and value.lower() in ("yes", "true", "1", "no", "false", "0"):
+                want = (value.lower() in ("yes", "true", "1")) == (op == "=")
+            else:
+                raise ValueError(f"{field} takes yes/no: {raw!r}")
+            terms.append((field, "=", [want != bool(negate)]))
+            continue
+        if field not in QUERY_FIELDS:
+            raise ValueError(f"Unknown query field {field!r} (valid: {', '.join(QUERY_FIELDS + tuple(QUERY_FLAGS))})")
+        if negate:
+            raise ValueError(f"Use != to negate {field}: {raw!r}")
+        if op is None:
+            raise ValueError(f"Query term needs an operator and value: {raw!r}")
+        values = [v for v in value.split(",") if v]
+        if not values:
+            raise ValueError(f"Query term has no value: {raw!r}")
+        if field == "rework_count":
+            try:
+                if op in ("=", "!=") and any(".." in v for v in values):
+                    bounds = [tuple(int(n) for n in v.split("..", 1)) if ".." in v else (int(v), int(v)) for v in values]
+                    terms.append((field, "in" if op == "=" else "not in", bounds))
+                else:
+                    terms.append((field, op, [int(v) for v in values]))
+            except ValueError:
+                raise ValueError(f"rework_count takes integers or ranges like 1..3: {raw!r}") from None
+        elif op in ("=", "!="):
+            terms.append((field, op, [v.casefold() for v in values]))
+        else:
+            raise ValueError(f"{field} only supports = and !=: {raw!r}")
+    return terms
+
+
+def _query_match(term: tuple[str, str, list], row: list) -> bool:
+    field, op, values = term
+    if field in QUERY_FLAGS:
+        return bool(row[QUERY_FIELDS.index(QUERY_FLAGS[field])]) == values[0]
+    value = row[QUERY_FIELDS.index(field)]
+    if field == "rework_count":
+        if op in ("in", "not in"):
+            return any(lo <= value <= hi for lo, hi in values) == (op == "in")
+        if op in ("=", "!="):
+            return (value in values) == (op == "=")
+        return QUERY_COMPARE[op](value, values[0])
+    return (not set(value).isdisjoint(values)) == (op == "=")
+
+
+def query_tickets(expression: str, store: Optional[TicketStore] = None) -> list[str]:
+    """
+    IDs of tickets matching a --query expression (see parse_query()), sorted.
+
+    Equality terms on list fields intersect the in-memory postings to pick
+    candidates; every term is then checked against the candidates' index
+    rows. No ticket file is read unless the index must be rebuilt.
+    """
+    terms = parse_query(expression)
+    store = store or TicketStore()
+    rows = store.query_rows()
+    candidates: Optional[set[str]] = None
+    for field, op, values in terms:
+        if op == "=" and field not in QUERY_FLAGS and field != "rework_count":
+            postings = store.query_postings(field)
+            ids = set().union(*(postings.get(v, ()) for v in values))
+            candidates = ids if candidates is None else candidates & ids
+    return sorted(
+        tid for tid in (rows if candidates is None else candidates)
+        if tid in rows and all(_query_match(term, rows[tid]) for term in terms)
+    )
+
+
+# ─── Search ───────────────────────────────────────────────────────────────────
+
+# Ticket fields --search indexes, joined into one document per ticket
+SEARCH_FIELDS = ("title", "description", "acceptance_criteria", "tags")
+SEARCH_K1 = 1.5  # BM25 term-frequency saturation
+SEARCH_B = 0.75  # BM25 document-length normalization
+
+
+def search_tokens(text: str) -> list[str]:
+    """Lowercase, split, remove punctuation, filter short words (as BM25.tokenize in ui-ux-pro-max core.py)."""
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return [w for w in text.split() if len(w) > 2]
+
+
+def search_row(ticket: dict) -> list:
+    """[document length, {term: frequency}] of a ticket's SEARCH_FIELDS, as kept in the search index."""
+    parts = []
+    for field in SEARCH_FIELDS:
+        value = ticket.get(field) or ""
+        parts.append(" ".join(map(str, value)) if isinstance(value, list) else str(value))
+    tokens = search_tokens(" ".join(parts))
+    frequencies: dict[str, int] = {}
+    for token in tokens:
+        frequencies[token] = frequencies.get(token, 0) + 1
+    return [len(tokens), frequencies]
+
+
+def search_tickets(text: str, store: Optional[TicketStore] = None) -> list[tuple[str, float]]:
+    """
+    (ticket_id, score) of tickets matching `text`, best first.
+
+    BM25 with k1=1.5 and b=0.75 over title, description, acceptance
+    criteria and tags, scored like BM25 in
+    .github/prompts/ui-ux-pro-max/scripts/core.py, but from the search
+    index: only the postings of the query's terms are touched. Tickets
+    scoring 0 are left out; ties are ordered by ticket ID.
+    """
+    store = store or TicketStore()
+    rows = store.search_rows()
+    n = len(rows)
+    if not n:
+        return []
+    avgdl = sum(row[0] for row in rows.values()) / n
+    scores: dict[str, float] = {}
+    for token in search_tokens(text):
+        postings = store.search_postings(token)
+        if not postings:
+            continue
+        idf = log((n - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+        for tid, tf in postings.items():
+            doc_len = rows[tid][0]
+            numerator = tf * (SEARCH_K1 + 1)
+            denominator = tf + SEARCH_K1 * (1 - SEARCH_B + SEARCH_B * doc_len / avgdl)
+            scores[tid] = scores.get(tid, 0.0) + idf * numerator / denominator
+    return sorted(((tid, score) for tid, score in scores.items() if score > 0), key=lambda r: (-r[1], r[0]))
+
+
+# ─── Daemon ───────────────────────────────────────────────────────────────────
+
+
+def state_signature(tickets_dir: Path = TICKETS_DIR, state_dir: Path = STATE_DIR) -> tuple:
+    """
+    mtimes of tickets/ and every stage directory, plus size and mtime of
+    every ticket file in them: changes when files are added, removed or
+    renamed, and when a master or state copy is rewritten in place.
+    """
+    signature: list = []
+    files: dict[str, tuple[int, int]] = {}
+    for directory in [tickets_dir] + [state_dir / STAGE_TO_STATE_DIR.get(s, s) for s in STAGES]:
+        try:
+            signature.append(directory.stat().st_mtime_ns)
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature), files
+
+
+class TicketDaemon:
+    """
+    A TicketStore kept in memory and served as newline-delimited JSON-RPC 2.0.
+
+    Methods: claim, release, renew, advance, rework and next (params as in
+    --batch), status, sync, ping, and cli (runs a full tickets.py command
+    line and returns its stdout, stderr and exit code — used by the CLI to
+    forward commands transparently).
+
+    Requests are handled one at a time. Before each one the state
+    signature is compared with the one recorded after the daemon's own
+    last write; any external change (new, deleted, renamed or rewritten
+    ticket files, e.g. from git, an editor or a --no-daemon, --batch or
+    --parse run) drops the in-memory store so it is rebuilt from disk.
+    """
+
+    def __init__(self) -> None:
+        self.store: Optional[TicketStore] = None
+        self.signature: Optional[tuple] = None
+
+    def call(self, method: str, params: dict) -> Any:
+        if self.store is None or state_signature() != self.signature:
+            self.store = TicketStore()
+        store = self.store
+        try:
+            if method in BATCH_OPS:
+                return run_batch_op({**params, "op": method}, store)
+            if method == "status":
+                return status_report(store)
+            if method == "sync":
+                released = release_expired_claims(store)
+                return {"released": released, **sync_tickets(store)}
+            if method == "cli":
+                return self._run_cli(list(params.get("argv", [])))
+            if method == "ping":
+                return {"pid": os.getpid(), "root": str(ROOT)}
+            raise LookupError(method)
+        except Exception:
+            self.store = None  # never keep a half-updated view
+            raise
+        finally:
+            if self.store is not None:
+                store.flush()
+            self.signature = state_signature()
+
+    def _run_cli(self, argv: list[str]) -> dict:
+        parser = build_parser()
+        out, err = io.StringIO(), io.StringIO()
+        exit_code = 0
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                run_command(parser.parse_args(argv), parser, self.store)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        return {"stdout": out.getvalue(), "stderr": err.getvalue(), "exit_code": exit_code}
+
+    def respond(self, line: bytes) -> dict:
+        """Handle one JSON-RPC request line."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": f"Parse error: {e}"}}
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid request"}}
+        response: dict = {"jsonrpc": "2.0", "id": request.get("id")}
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            return {**response, "error": {"code": -32602, "message": "params must be an object"}}
+        try:
+            response["result"] = self.call(request["method"], params)
+        except LookupError:
+            response["error"] = {"code": -32601, "message": f"Method not found: {request['method']}"}
+        except Exception as e:
+            response["error"] = {"code": -32603, "message": f"{type(e).__name__}: {e}"}
+        return response
+
+
+class _RpcHandler(socketserver.StreamRequestHandler):
+    timeout = DAEMON_TIMEOUT
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if line.strip():
+                response = self.server.tickets.respond(line)
+                self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+
+def daemon_call(method: str, params: Optional[dict] = None, socket_path: Optional[Path] = None) -> Optional[Any]:
+    """
+    Result of one RPC call to a running daemon, or None if none is listening.
+
+    Raises RuntimeError with the daemon's message if the call failed.
+    """
+    path = socket_path or STATE_DIR / SOCKET_FILE
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        return None
+    request = {"jsonrpc": "2.0", "id": os.getpid(), "method": method, "params": params or {}}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(str(path))
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None  # stale socket left by a daemon that died
+    if not line:
+        raise RuntimeError("daemon closed the connection without replying")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"]["message"])
+    return response["result"]
+
+
+def serve(socket_path: Optional[Path] = None) -> int:
+    """Run the daemon in the foreground until SIGINT/SIGTERM. Returns an exit code."""
+    path = socket_path or STATE_DIR / SOCKET_FILE
+    if not hasattr(socket, "AF_UNIX"):
+        print("ERROR: --serve needs Unix domain sockets, which this platform lacks", file=sys.stderr)
+        return 1
+    if daemon_call("ping", socket_path=path) is not None:
+        print(f"ERROR: a daemon is already serving {path}", file=sys.stderr)
+        return 1
+    path.unlink(missing_ok=True)
+    server = socketserver.UnixStreamServer(str(path), _RpcHandler)
+    server.tickets = TicketDaemon()
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serving tickets on {path} (pid {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+    return 0
+
+
 # ─── CLI ──────────────────────────────────────────────────────────────────────
 
 
-def main():
+def exit_code(ok: bool, message: str) -> int:
+    """0 on success, EXIT_CONFLICT when a compare-and-swap write lost, 1 otherwise."""
+    if ok:
+        return 0
+    return EXIT_CONFLICT if message.startswith("CONFLICT") else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Distributed Git-Native Ticket State Machine Manager",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -878,41 +4525,154 @@ def main():
 Examples:
   python tickets.py --sync                              # Resolve deps, move unblocked to READY
   python tickets.py --parse TODO/tasks/                  # Parse L3 markdown into tickets
+  python tickets.py --parse TODO/tasks/ --upsert         # ...and update tickets whose L3 task changed
   python tickets.py --status                             # Show full state dashboard
+  python tickets.py --status --rev HEAD~20               # The board as committed 20 commits ago
+  python tickets.py --as-of 2026-04-10T03:00:00Z         # Who held what at 03:00 UTC, from history
+  python tickets.py --metrics --csv > flow.csv           # Flow metrics from history, as CSV
+  python tickets.py --query "stage=QA priority=critical tag=auth operator=Owais"
+  python tickets.py --query "claimed rework_count>=2" --ids-only
+  python tickets.py --search "mcp server"                # Best-matching tickets by wording
   python tickets.py --claim TASK-001-01-01 Backend host1 Owais
   python tickets.py --release TASK-001-01-01             # Release claim
+  python tickets.py --renew TASK-001-01-01               # Extend the lease by 30 minutes from now
+  python tickets.py --next Backend                       # Best claimable ticket for an agent
   python tickets.py --advance TASK-001-01-01 Backend     # Move to next stage
+  python tickets.py --advance TASK-001-01-01 Validator --unblock  # ...and release dependents on DONE
   python tickets.py --rework TASK-001-01-01 QA "Tests failed"
   python tickets.py --validate                           # Full integrity check
+  python tickets.py --history TASK-001-01-01             # Event timeline
+  python tickets.py --compact                            # Archive old history events
+  python tickets.py --restore-history TASK-001-01-01     # Un-archive a ticket's events
+  echo '{"op":"advance","ticket_id":"TASK-001-01-01","agent":"Backend"}' | python tickets.py --batch
+  python tickets.py --serve &                            # Keep state in memory; the CLI forwards to it
   python tickets.py --dot | dot -Tpng -o graph.png       # Dependency graph
   python tickets.py --release-expired                    # Release all expired claims
+  python tickets.py --validate --jobs 16                 # Read files with 16 threads
+  python tickets.py --db-import                          # Load tickets/ + ticket-state/ into tickets.db
+  python tickets.py --backend sqlite --status            # Any command, against tickets.db
+  python tickets.py --db-export                          # Write tickets.db back to the directory layout
         """,
     )
 
     parser.add_argument("--sync", action="store_true", help="Evaluate all tickets, move unblocked to READY")
     parser.add_argument("--parse", metavar="L3_DIR", help="Parse L3 markdown directory into tickets")
+    parser.add_argument("--upsert", action="store_true",
+                        help="With --parse: also apply L3 edits to existing tickets (one UPDATED event each)")
     parser.add_argument("--status", action="store_true", help="Show ticket state dashboard")
+    parser.add_argument("--rev", metavar="COMMIT",
+                        help="With --status: read tickets as committed at a git revision (no checkout)")
+    parser.add_argument("--as-of", metavar="TIMESTAMP",
+                        help="Show stages and claims at an ISO 8601 time, replayed from history (UTC if no offset)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Lead/cycle time, stage dwell, rework rates and daily throughput from history")
+    parser.add_argument("--csv", action="store_true", help="With --metrics: output CSV rows (metric,group,key,value)")
+    parser.add_argument("--query", metavar="EXPR",
+                        help="List tickets matching all terms, e.g. 'stage=QA priority=critical tag=auth'")
+    parser.add_argument("--search", metavar="TEXT",
+                        help="Rank tickets by BM25 over title, description, acceptance criteria and tags")
+    parser.add_argument("--limit", type=int, default=20, metavar="N",
+                        help="With --search: show at most N results (default: 20)")
+    parser.add_argument("--ids-only", action="store_true",
+                        help="With --query/--search: print only matching ticket IDs")
     parser.add_argument("--claim", nargs=4, metavar=("TICKET_ID", "AGENT", "MACHINE_ID", "OPERATOR"),
                         help="Claim a ticket")
     parser.add_argument("--release", metavar="TICKET_ID", help="Release claim on a ticket")
+    parser.add_argument("--renew", metavar="TICKET_ID", help="Extend the lease on an active claim")
+    parser.add_argument("--next", metavar="AGENT", help="Show the best claimable ticket for an agent")
     parser.add_argument("--advance", nargs=2, metavar=("TICKET_ID", "AGENT"),
                         help="Advance ticket to next SDLC stage")
+    parser.add_argument("--unblock", action="store_true",
+                        help="With --advance: on reaching DONE, move newly unblocked dependents to READY")
     parser.add_argument("--rework", nargs=3, metavar=("TICKET_ID", "AGENT", "REASON"),
                         help="Send ticket back for rework")
     parser.add_argument("--validate", action="store_true", help="Full integrity check")
     parser.add_argument("--dot", action="store_true", help="Output dependency graph in DOT format")
     parser.add_argument("--release-expired", action="store_true", help="Release all expired claims")
+    parser.add_argument("--history", metavar="TICKET_ID", help="Show a ticket's full event timeline")
+    parser.add_argument("--compact", action="store_true",
+                        help="Fold old history events into a summary and move them to a compressed archive")
+    parser.add_argument("--restore-history", metavar="TICKET_ID",
+                        help="Restore a ticket's archived history events")
+    parser.add_argument("--batch", action="store_true",
+                        help="Read NDJSON operations from stdin, apply them in order, stream NDJSON results")
+    parser.add_argument("--serve", action="store_true",
+                        help=f"Run a daemon holding ticket state in memory on ticket-state/{SOCKET_FILE}")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Run locally even if a --serve daemon is listening")
     parser.add_argument("--json", action="store_true", help="Output in JSON format where applicable")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help=f"Concurrent file reads for bulk loads (default: {LOAD_JOBS})")
+    parser.add_argument("--backend", choices=["files", "sqlite"], default="files",
+                        help="Ticket storage: JSON files (default) or a SQLite database")
+    parser.add_argument("--db", metavar="PATH", type=Path,
+                        help=f"SQLite database for --backend sqlite (default: {DB_FILE.name})")
+    parser.add_argument("--db-import", action="store_true",
+                        help="Copy tickets/ and ticket-state/ into the SQLite database")
+    parser.add_argument("--db-export", action="store_true",
+                        help="Write the SQLite database back to tickets/ and ticket-state/")
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    global LOAD_JOBS
+
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.jobs is not None:
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        LOAD_JOBS = args.jobs
+    if args.rev is not None and not args.status:
+        parser.error("--rev only applies to --status")
+
+    if args.serve:
+        sys.exit(serve())
+
+    # Hand the command to a running daemon (it holds the state in memory)
+    local_only = (
+        args.no_daemon or args.batch or args.parse or args.backend != "files"
+        or args.db_import or args.db_export or args.rev is not None
+    )
+    if not local_only:
+        try:
+            reply = daemon_call("cli", {"argv": argv})
+        except (OSError, RuntimeError) as e:
+            print(f"ERROR: ticket daemon failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        if reply is not None:
+            sys.stdout.write(reply["stdout"])
+            sys.stderr.write(reply["stderr"])
+            sys.exit(reply["exit_code"])
+
+    db = None
+    if args.backend == "sqlite" or args.db_import or args.db_export:
+        db = open_store("sqlite", args.db)
+    run_command(args, parser, db)
+
+
+def run_command(args: argparse.Namespace, parser: argparse.ArgumentParser, db: Optional[TicketStore]) -> None:
+    """Execute a parsed command line against `db` (None: a fresh file-backed store per operation)."""
+    if args.db_import or args.db_export:
+        source, target = (TicketStore(), db) if args.db_import else (db, TicketStore())
+        summary = copy_tickets(source, target)
+        print(
+            f"{'Imported' if args.db_import else 'Exported'} {summary['written'] + summary['skipped']} ticket(s): "
+            f"wrote {summary['written']}, skipped {summary['skipped']} unchanged, "
+            f"removed {summary['removed']} stale state location(s)."
+        )
 
-    args = parser.parse_args()
-
-    if args.sync:
+    elif args.sync:
         print("Syncing tickets...")
-        released = release_expired_claims()
+        store = db or TicketStore()
+        released = release_expired_claims(store)
         for msg in released:
             print(f"  RELEASED: {msg}")
 
-        result = sync_tickets()
+        result = sync_tickets(store)
         if args.json:
             print(json.dumps(result, indent=2))
         else:
@@ -922,6 +4682,10 @@ Examples:
                 print(f"  Still blocked:")
                 for b in result["still_blocked"]:
                     print(f"    - {b}")
+            if result["newly_blocked"]:
+                print("  Newly blocked:")
+                for b in result["newly_blocked"]:
+                    print(f"    - {b}")
             if result["duplicates_fixed"]:
                 print(f"  Duplicates fixed:")
                 for d in result["duplicates_fixed"]:
@@ -930,65 +4694,237 @@ Examples:
                 print(f"  Errors:")
                 for e in result["errors"]:
                     print(f"    ⚠ {e}")
-            if not any(result.values()):
+            if not any(v for k, v in result.items() if k != "summary"):
                 print("  No changes needed.")
+            summary = result["summary"]
+            print(f"  Wrote {summary['written']} ticket(s), skipped {summary['skipped']} unchanged.")
+
+    elif args.parse and args.upsert:
+        print(f"Parsing L3 tasks from: {args.parse} (upsert)")
+        result = upsert_l3_tasks(args.parse, created_by="TODO", store=db)
+        print(f"\nCreated {len(result['created'])} tickets, updated {len(result['updated'])}.")
+        if result["moved_to_ready"]:
+            print(f"  Moved to READY: {', '.join(result['moved_to_ready'])}")
+        if result["newly_blocked"]:
+            print("  Newly blocked:")
+            for b in result["newly_blocked"]:
+                print(f"    - {b}")
+        if result["errors"]:
+            print("  Errors:")
+            for e in result["errors"]:
+                print(f"    ⚠ {e}")
+            sys.exit(EXIT_CONFLICT)
 
     elif args.parse:
         print(f"Parsing L3 tasks from: {args.parse}")
-        tickets = parse_l3_tasks(args.parse, created_by="TODO")
+        store = db or TicketStore()
+        tickets = parse_l3_tasks(args.parse, created_by="TODO", store=store)
         print(f"\nCreated {len(tickets)} tickets.")
 
         # Auto-sync after parse
         print("\nRunning sync...")
-        result = sync_tickets()
+        result = sync_tickets(store)
         if result["moved_to_ready"]:
             print(f"  Moved to READY: {', '.join(result['moved_to_ready'])}")
 
     elif args.status:
+        try:
+            if args.json:
+                print_status_json(db, args.rev)
+            else:
+                print_status(db, args.rev)
+        except ValueError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+
+    elif args.as_of is not None:
+        try:
+            moment = datetime.fromisoformat(args.as_of)
+        except ValueError:
+            print(f"FAIL: --as-of needs an ISO 8601 timestamp, got {args.as_of!r}")
+            sys.exit(1)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        board = board_as_of(moment, db)
         if args.json:
-            print_status_json()
+            print(json.dumps(board, indent=2))
         else:
-            print_status()
+            print_board_as_of(board)
+
+    elif args.metrics:
+        metrics = flow_metrics(db)
+        if args.csv:
+            write_flow_metrics_csv(metrics, sys.stdout)
+        elif args.json:
+            print(json.dumps(metrics, indent=2))
+        else:
+            print_flow_metrics(metrics)
+
+    elif args.query is not None:
+        store = db or TicketStore()
+        try:
+            ids = query_tickets(args.query, store)
+        except ValueError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+        store.flush()
+        if args.ids_only and args.json:
+            print(json.dumps(ids, indent=2))
+        elif args.ids_only:
+            for tid in ids:
+                print(tid)
+        elif args.json:
+            print(json.dumps([store.load(tid) for tid in ids], indent=2, default=str))
+        else:
+            for tid in ids:
+                ticket = store.load(tid)
+                print(
+                    f"  {tid:20s} {ticket.get('stage') or '?':12s} {ticket.get('priority', 'medium'):8s} "
+                    f"{ticket.get('type', ''):10s} {ticket.get('title', '')}"
+                )
+            print(f"\n{len(ids)} ticket(s) match.")
+
+    elif args.search is not None:
+        store = db or TicketStore()
+        results = search_tickets(args.search, store)[:args.limit]
+        store.flush()
+        if args.ids_only and args.json:
+            print(json.dumps([tid for tid, _ in results], indent=2))
+        elif args.ids_only:
+            for tid, _ in results:
+                print(tid)
+        elif args.json:
+            print(json.dumps([
+                {
+                    "ticket_id": tid,
+                    "score": round(score, 4),
+                    "title": store.load(tid).get("title", ""),
+                    "stage": store.load(tid).get("stage"),
+                }
+                for tid, score in results
+            ], indent=2))
+        elif results:
+            for tid, score in results:
+                ticket = store.load(tid)
+                print(f"  {score:6.2f}  {tid:20s} {ticket.get('stage') or '?':12s} {ticket.get('title', '')}")
+        else:
+            print(f"No tickets match: {args.search}")
 
     elif args.claim:
         ticket_id, agent, machine_id, operator = args.claim
-        ok, msg = claim_ticket(ticket_id, agent, machine_id, operator)
+        ok, msg = claim_ticket(ticket_id, agent, machine_id, operator, store=db)
         print(f"{'OK' if ok else 'FAIL'}: {msg}")
-        sys.exit(0 if ok else 1)
+        sys.exit(exit_code(ok, msg))
+
+    elif args.next:
+        try:
+            ticket = next_ticket(args.next, db)
+        except ValueError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+        if args.json:
+            print(json.dumps(ticket and {
+                "ticket_id": ticket["ticket_id"],
+                "title": ticket.get("title", ""),
+                "priority": ticket.get("priority", "medium"),
+                "stage": ticket.get("stage"),
+                "downstream": ticket["downstream"],
+            }, indent=2))
+        elif ticket:
+            print(
+                f"NEXT: {ticket['ticket_id']} [{ticket.get('priority', 'medium')}, "
+                f"{ticket['downstream']} downstream] {ticket.get('title', '')}"
+            )
+        else:
+            print(f"No claimable tickets for {args.next}.")
+        sys.exit(0 if ticket else 1)
 
     elif args.release:
-        ok, msg = release_claim(args.release)
+        ok, msg = release_claim(args.release, store=db)
         print(f"{'OK' if ok else 'FAIL'}: {msg}")
-        sys.exit(0 if ok else 1)
+        sys.exit(exit_code(ok, msg))
+
+    elif args.renew:
+        ok, msg = renew_lease(args.renew, store=db)
+        print(f"{'OK' if ok else 'FAIL'}: {msg}")
+        sys.exit(exit_code(ok, msg))
 
     elif args.advance:
         ticket_id, agent = args.advance
-        ok, msg = advance_ticket(ticket_id, agent)
+        ok, msg = advance_ticket(ticket_id, agent, store=db, unblock=args.unblock)
         print(f"{'OK' if ok else 'FAIL'}: {msg}")
-        sys.exit(0 if ok else 1)
+        sys.exit(exit_code(ok, msg))
 
     elif args.rework:
         ticket_id, agent, reason = args.rework
-        ok, msg = rework_ticket(ticket_id, agent, reason)
+        ok, msg = rework_ticket(ticket_id, agent, reason, store=db)
         print(f"{'OK' if ok else 'FAIL'}: {msg}")
-        sys.exit(0 if ok else 1)
+        sys.exit(exit_code(ok, msg))
 
     elif args.validate:
-        errors = validate_integrity()
-        if errors:
+        report = integrity_report(db)
+        errors = report["errors"]
+        graph = report["graph"]
+        if args.json:
+            print(json.dumps(report, indent=2))
+        elif errors:
             print(f"INTEGRITY CHECK FAILED ({len(errors)} issues):")
             for e in errors:
                 print(f"  ⚠ {e}")
-            sys.exit(1)
         else:
             print("✓ All integrity checks passed")
-            sys.exit(0)
+        if not args.json:
+            print(
+                f"  Dependency graph: {graph['nodes']} tickets, {graph['edges']} edges, "
+                f"depth {graph['depth']}, width {graph['width']}"
+            )
+        sys.exit(1 if errors else 0)
 
     elif args.dot:
-        print_dot_graph()
+        print_dot_graph(db)
+
+    elif args.batch:
+        summary = run_batch(sys.stdin, sys.stdout, db)
+        ok = summary["failed"] == 0 and not summary["conflicts"]
+        print(json.dumps({"op": "batch", "ok": ok, **summary}))
+        sys.exit(0 if ok else EXIT_CONFLICT if summary["conflicts"] else 1)
+
+    elif args.compact:
+        result = compact_history(db)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            if result["compacted"]:
+                print(f"Compacted {len(result['compacted'])} ticket(s): archived {result['events']} event(s).")
+            else:
+                print("  Nothing to compact.")
+            if result["errors"]:
+                print("  Errors:")
+                for e in result["errors"]:
+                    print(f"    ⚠ {e}")
+
+    elif args.restore_history:
+        ok, msg = restore_history(args.restore_history, db)
+        print(f"{'OK' if ok else 'FAIL'}: {msg}")
+        sys.exit(exit_code(ok, msg))
+
+    elif args.history:
+        store = db or TicketStore()
+        if not store.exists(args.history):
+            print(f"FAIL: Ticket {args.history} does not exist")
+            sys.exit(1)
+        events = store.history(args.history)
+        if args.json:
+            print(json.dumps(events, indent=2))
+        else:
+            for event in events:
+                stages = f" {event['from_stage']} → {event['to_stage']}" if event.get("from_stage") else ""
+                print(f"  {event.get('timestamp', '?')}  {event.get('event', '?'):15s} {event.get('agent', '?')}{stages}")
+                if event.get("details"):
+                    print(f"      {event['details']}")
 
     elif args.release_expired:
-        released = release_expired_claims()
+        released = release_expired_claims(db)
         if released:
             for msg in released:
                 print(f"  RELEASED: {msg}")
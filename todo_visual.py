@@ -18,6 +18,7 @@ Usage:
     python3 todo_visual.py --stage QA   # Filter by stage
     python3 todo_visual.py --owner Owais  # Filter by operator
     python3 todo_visual.py --list       # List all state directories + counts
+    python3 todo_visual.py --rev HEAD~5 # Board as committed at a git revision (no checkout)
 """
 
 from __future__ import annotations
@@ -107,23 +108,38 @@ class BoardStats:
 #  DISCOVERY -- Scan ticket-state directories
 # =====================================================================
 
-def discover_tickets() -> dict[str, Ticket]:
-    """Scan ticket-state/<STAGE>/ directories for ticket JSON."""
+def discover_tickets(revision: tuple[set[str], dict[str, bytes]] | None = None) -> dict[str, Ticket]:
+    """Scan ticket-state/<STAGE>/ directories for ticket JSON (or a read_revision() snapshot)."""
     registry: dict[str, Ticket] = {}
 
-    if not TICKET_STATE_DIR.is_dir():
-        _log.warning("ticket-state directory not found: %s", TICKET_STATE_DIR)
-        return registry
+    if revision is not None:
+        dirs, blobs = revision
+        stage_files = {
+            stage: sorted(
+                (path.rsplit("/", 1)[1], blobs[path])
+                for path in blobs if path.startswith("ticket-state/" + stage + "/")
+            )
+            for stage in sorted(dirs) if stage in STAGE_ORDER
+        }
+        master_files = sorted(
+            (path.rsplit("/", 1)[1], data)
+            for path, data in blobs.items() if path.startswith("tickets/")
+        )
+    else:
+        if not TICKET_STATE_DIR.is_dir():
+            _log.warning("ticket-state directory not found: %s", TICKET_STATE_DIR)
+            return registry
+        stage_files = {
+            stage_dir.name: [(f.name, f) for f in sorted(stage_dir.glob("*.json"))]
+            for stage_dir in sorted(TICKET_STATE_DIR.iterdir())
+            if stage_dir.is_dir() and stage_dir.name in STAGE_ORDER
+        }
+        master_files = [(f.name, f) for f in sorted(TICKETS_DIR.glob("*.json"))] if TICKETS_DIR.is_dir() else []
 
-    for stage_dir in sorted(TICKET_STATE_DIR.iterdir()):
-        if not stage_dir.is_dir():
-            continue
-        stage_name = stage_dir.name
-        if stage_name not in STAGE_ORDER:
-            continue
-        for ticket_file in sorted(stage_dir.glob("*.json")):
+    for stage_name, files in stage_files.items():
+        for name, source in files:
             try:
-                ticket = _parse_ticket(ticket_file, stage_name)
+                ticket = _parse_ticket(source, stage_name, name)
                 if ticket.ticket_id in registry:
                     _log.warning(
                         "Duplicate ticket %s in %s (already in %s)",
@@ -133,29 +149,51 @@ def discover_tickets() -> dict[str, Ticket]:
                     continue
                 registry[ticket.ticket_id] = ticket
             except Exception:
-                _log.exception("Failed to parse %s", ticket_file)
+                _log.exception("Failed to parse %s", source if isinstance(source, Path) else f"ticket-state/{stage_name}/{name}")
 
     # Backfill from master tickets dir
-    if TICKETS_DIR.is_dir():
-        for ticket_file in sorted(TICKETS_DIR.glob("*.json")):
-            if ticket_file.name == "ticket-schema.json":
-                continue
-            try:
-                data = json.loads(ticket_file.read_text(encoding="utf-8"))
-                tid = data.get("ticket_id", "")
-                if tid and tid not in registry:
-                    ticket = _data_to_ticket(data, f"tickets/{ticket_file.name}")
-                    registry[tid] = ticket
-            except Exception:
-                _log.exception("Failed to parse master ticket %s", ticket_file)
+    for name, source in master_files:
+        if name == "ticket-schema.json":
+            continue
+        try:
+            data = json.loads(_read(source))
+            tid = data.get("ticket_id", "")
+            if tid and tid not in registry:
+                ticket = _data_to_ticket(data, f"tickets/{name}")
+                registry[tid] = ticket
+        except Exception:
+            _log.exception("Failed to parse master ticket %s", source if isinstance(source, Path) else f"tickets/{name}")
 
     return registry
 
 
-def _parse_ticket(path: Path, stage_name: str) -> Ticket:
+def read_revision(rev: str) -> tuple[set[str], dict[str, bytes]]:
+    """
+    Stage directory names and ticket JSON blobs ({repo path: bytes}) at git `rev`,
+    read with tickets.read_git_tree(). Raises ValueError on a bad revision.
+    """
+    from tickets import read_git_tree
+
+    def is_ticket(path: str) -> bool:
+        parts = path.split("/")
+        return path.endswith(".json") and (
+            (len(parts) == 2 and parts[0] == "tickets") or (len(parts) == 3 and parts[0] == "ticket-state")
+        )
+
+    trees, blobs = read_git_tree(rev, ("tickets", "ticket-state"), is_ticket)
+    dirs = {parts[1] for parts in (path.split("/") for path in trees) if len(parts) == 2 and parts[0] == "ticket-state"}
+    return dirs, blobs
+
+
+def _read(source: Path | bytes) -> str:
+    """Text of a ticket file, or of a git blob already read by read_revision()."""
+    return source.read_text(encoding="utf-8") if isinstance(source, Path) else source.decode("utf-8")
+
+
+def _parse_ticket(source: Path | bytes, stage_name: str, name: str) -> Ticket:
     """Parse a single ticket JSON from a state directory."""
-    data = json.loads(path.read_text(encoding="utf-8"))
-    rel = f"ticket-state/{stage_name}/{path.name}"
+    data = json.loads(_read(source))
+    rel = f"ticket-state/{stage_name}/{name}"
     ticket = _data_to_ticket(data, rel)
     ticket.stage = stage_name  # state dir is authoritative
     return ticket
@@ -919,15 +957,37 @@ def main() -> None:
         print(__doc__)
         return
 
+    # --rev COMMIT: read tickets/ and ticket-state/ from git objects instead of the working tree
+    rev = None
+    if "--rev" in args:
+        argv = sys.argv[1:]
+        for i, a in enumerate(argv):
+            if a == "--rev" and i + 1 < len(argv):
+                rev = argv[i + 1]
+                break
+        if rev is None:
+            print("--rev needs a git revision")
+            sys.exit(1)
+    revision = None
+    if rev is not None:
+        try:
+            revision = read_revision(rev)
+        except ValueError as e:
+            print("Cannot read revision " + rev + ": " + str(e))
+            sys.exit(1)
+
     # --list: directory structure + counts
     if args & {"--list", "-l"}:
-        print("Ticket State Directories (" + str(TICKET_STATE_DIR) + "):")
-        if not TICKET_STATE_DIR.is_dir():
+        print("Ticket State Directories (" + (rev if rev is not None else str(TICKET_STATE_DIR)) + "):")
+        if revision is None and not TICKET_STATE_DIR.is_dir():
             print("  ticket-state directory not found!")
             return
         for stage in STAGE_ORDER:
             d = TICKET_STATE_DIR / stage
-            if d.is_dir():
+            if revision is not None and stage in revision[0]:
+                count = sum(1 for path in revision[1] if path.startswith("ticket-state/" + stage + "/"))
+                print("  " + STAGE_EMOJI.get(stage, " ") + " " + stage.ljust(12) + "  " + str(count) + " ticket(s)")
+            elif revision is None and d.is_dir():
                 tickets = list(d.glob("*.json"))
                 print("  " + STAGE_EMOJI.get(stage, " ") + " " + stage.ljust(12) + "  " + str(len(tickets)) + " ticket(s)")
             else:
@@ -935,7 +995,7 @@ def main() -> None:
         return
 
     # Discovery
-    tickets = discover_tickets()
+    tickets = discover_tickets(revision=revision)
     if not tickets:
         print("No tickets found in ticket-state/ or tickets/")
         print("  Hint: Create tickets with  python3 tickets.py --parse <dir>")